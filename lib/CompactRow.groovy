@@ -0,0 +1,76 @@
+import groovy.transform.CompileStatic
+
+/**
+ * Read-only Map view over a parsed row that stores only the columns with a value.
+ *
+ * Column positions come from a shared RowSchema, values are dictionary-encoded and
+ * absent ("NA") values are not stored. Lookups behave like the header-keyed maps
+ * returned by splitCsv: schema columns without a value read as "NA" and unknown
+ * columns read as null.
+ */
+@CompileStatic
+class CompactRow extends AbstractMap<String, String> {
+
+    private final RowSchema schema
+    // Positions of the columns with a value, in increasing order, and their values
+    private final short[] positions
+    private final String[] values
+
+    private CompactRow(RowSchema schema, short[] positions, String[] values) {
+        this.schema = schema
+        this.positions = positions
+        this.values = values
+    }
+
+    /**
+     * Build a row from the CSV values of a record laid out as described by the schema
+     */
+    static CompactRow of(RowSchema schema, List<String> record) {
+        def count = Math.min(schema.size(), record.size())
+        def presentPositions = new short[count]
+        def presentValues = new String[count]
+        def present = 0
+        for (int position = 0; position < count; position++) {
+            def value = schema.encode(position, record.get(position))
+            if (value != null) {
+                presentPositions[present] = (short) position
+                presentValues[present] = value
+                present++
+            }
+        }
+        return new CompactRow(schema, Arrays.copyOf(presentPositions, present), Arrays.copyOf(presentValues, present))
+    }
+
+    RowSchema getSchema() {
+        return schema
+    }
+
+    @Override
+    String get(Object column) {
+        def position = schema.positionOf(column)
+        if (position < 0) {
+            return null
+        }
+        def index = Arrays.binarySearch(positions, (short) position)
+        return index >= 0 ? values[index] : RowSchema.ABSENT_VALUE
+    }
+
+    @Override
+    boolean containsKey(Object column) {
+        return schema.positionOf(column) >= 0
+    }
+
+    @Override
+    int size() {
+        return schema.size()
+    }
+
+    @Override
+    Set<Map.Entry<String, String>> entrySet() {
+        def entries = new LinkedHashSet<Map.Entry<String, String>>()
+        schema.columns.each { String column ->
+            entries.add(new AbstractMap.SimpleImmutableEntry<String, String>(column, get(column)))
+        }
+        return Collections.unmodifiableSet(entries)
+    }
+}
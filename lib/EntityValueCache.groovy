@@ -0,0 +1,36 @@
+import groovy.transform.CompileStatic
+
+import java.util.concurrent.ConcurrentHashMap
+
+/**
+ * Bounded cache of normalized entity values shared by all rows of a run.
+ *
+ * Entity values repeat across rows (flip-01, mt-on, echo-2, ...), so each distinct value is
+ * normalized once. Once the cache is full, new values are normalized without being cached.
+ */
+@CompileStatic
+class EntityValueCache {
+
+    static final int MAX_ENTRIES = 100000
+
+    private static final Map<Object, String> CACHE = new ConcurrentHashMap<>()
+
+    static String normalize(Object value, Closure<String> normalizer) {
+        def normalized = CACHE.get(value)
+        if (normalized == null) {
+            normalized = normalizer.call(value)
+            if (CACHE.size() < MAX_ENTRIES) {
+                CACHE.putIfAbsent(value, normalized)
+            }
+        }
+        return normalized
+    }
+
+    static int size() {
+        return CACHE.size()
+    }
+
+    static void clear() {
+        CACHE.clear()
+    }
+}
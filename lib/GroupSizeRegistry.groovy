@@ -0,0 +1,46 @@
+import groovy.transform.CompileStatic
+
+import java.util.concurrent.ConcurrentHashMap
+
+/**
+ * Expected group sizes of the merging stages downstream of the set type workflows.
+ *
+ * route_parsed_rows registers the sizes of every key of a batch when it routes the batch,
+ * before any result of that batch exists, so results can look up the size of their group
+ * when they reach groupKey. There is one entry per key, and it is removed once its group is
+ * complete.
+ */
+@CompileStatic
+class GroupSizeRegistry {
+
+    // Number of set type results per loop key
+    static final String RESULTS = 'results'
+    // Number of loop keys per non-task key
+    static final String LOOP_KEYS = 'loopKeys'
+    // [cacheKey, number of non-task keys] of the batch of each non-task key
+    static final String CACHE_BATCHES = 'cacheBatches'
+
+    private final Map<String, Map<Object, Object>> tables = new ConcurrentHashMap<>()
+
+    void put(String table, Object key, Object value) {
+        tables.computeIfAbsent(table) { new ConcurrentHashMap<Object, Object>() }.put(key, value)
+    }
+
+    /**
+     * Value registered for a key; a missing entry means routing and grouping disagree, which
+     * would otherwise leave a group incomplete until the end of the run
+     */
+    Object get(String table, Object key) {
+        def value = tables.get(table)?.get(key)
+        if (value == null) {
+            throw new IllegalStateException("No ${table} size registered for key ${key}")
+        }
+        return value
+    }
+
+    Object remove(String table, Object key) {
+        def value = get(table, key)
+        tables.get(table).remove(key)
+        return value
+    }
+}
@@ -0,0 +1,75 @@
+import groovy.transform.CompileStatic
+
+import java.util.concurrent.ConcurrentHashMap
+
+/**
+ * Column layout shared by all compact rows parsed from CSVs with the same header,
+ * together with the dictionary used to encode repeated entity values.
+ */
+@CompileStatic
+class RowSchema {
+
+    // Columns whose values are unique per file and not worth dictionary-encoding
+    static final Set<String> UNENCODED_COLUMNS = ['path'] as Set<String>
+
+    static final String ABSENT_VALUE = 'NA'
+
+    private static final Map<List<String>, RowSchema> SCHEMAS = new ConcurrentHashMap<>()
+    private static final Map<String, String> DICTIONARY = new ConcurrentHashMap<>()
+
+    final List<String> columns
+    private final Map<String, Integer> positions
+    private final boolean[] encoded
+
+    private RowSchema(List<String> columns) {
+        this.columns = Collections.unmodifiableList(new ArrayList<String>(columns))
+        def columnPositions = new HashMap<String, Integer>()
+        this.encoded = new boolean[columns.size()]
+        for (int index = 0; index < columns.size(); index++) {
+            columnPositions.put(columns.get(index), index)
+            this.encoded[index] = !UNENCODED_COLUMNS.contains(columns.get(index))
+        }
+        this.positions = Collections.unmodifiableMap(columnPositions)
+    }
+
+    /**
+     * Schema for a CSV header, shared by every CSV with the same header
+     */
+    static RowSchema forHeader(List<String> header) {
+        return SCHEMAS.computeIfAbsent(new ArrayList<String>(header)) { List<String> columns -> new RowSchema(columns) }
+    }
+
+    int size() {
+        return columns.size()
+    }
+
+    /**
+     * Position of a column, or -1 if the column is not part of the schema
+     */
+    int positionOf(Object column) {
+        def position = positions.get(column)
+        return position == null ? -1 : position.intValue()
+    }
+
+    /**
+     * Canonical instance of a value: absent values are stored as null, repeated entity
+     * values share a single String instance
+     */
+    String encode(int position, String value) {
+        if (value == null || value == ABSENT_VALUE) {
+            return null
+        }
+        if (!encoded[position]) {
+            return value
+        }
+        def canonical = DICTIONARY.putIfAbsent(value, value)
+        return canonical != null ? canonical : value
+    }
+
+    /**
+     * Number of distinct values in the shared dictionary
+     */
+    static int dictionarySize() {
+        return DICTIONARY.size()
+    }
+}
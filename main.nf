@@ -1,10 +1,12 @@
-include { libbids_sh_parse } from './modules/parsers/lib_bids_sh_parser.nf'
+include { parse_bids_dataset } from './subworkflows/parse_bids_dataset.nf'
+include { route_parsed_rows } from './subworkflows/route_parsed_rows.nf'
 include { emit_named_sets } from './subworkflows/emit_named_sets.nf'
 include { emit_sequential_sets } from './subworkflows/emit_sequential_sets.nf'
 include { emit_mixed_sets } from './subworkflows/emit_mixed_sets.nf'
 include { emit_plain_sets } from './subworkflows/emit_plain_sets.nf'
 include { BIDS_VALIDATOR } from './modules/parsers/bids_validator.nf'
 include {
+    loadBids2nfConfig;
     analyzeConfiguration;
     getConfigurationSummary;
     getLoopOverEntities
@@ -12,6 +14,14 @@ include {
 include { 
     preFlightChecks;
 } from './modules/parsers/bids_validator.nf'
+include {
+    getNonTaskKey;
+    buildCrossModalIndex;
+    broadcastCrossModal
+} from './modules/grouping/cross_modal_utils.nf'
+include {
+    writeCachedResults
+} from './modules/grouping/result_cache.nf'
 include {
     logProgress;
     tryWithContext
@@ -36,23 +46,23 @@ workflow bids2nf {
     
     def bids_parent_dir = file(bids_dir).parent.toString()
 
-    parsed_csv = libbids_sh_parse(bids_dir, params.libbids_sh, params.libbids_config_dir)
+    def bids_index_dir = params.bids_index_dir ? file(params.bids_index_dir).toAbsolutePath().toString() : null
+
+    parsed_units = parse_bids_dataset(bids_dir, params.libbids_sh, params.libbids_config_dir, bids_index_dir)
     
-    def config = tryWithContext("CONFIG_LOADING") {
-        new org.yaml.snakeyaml.Yaml().load(new FileReader(bids2nf_config))
+    // Parse and validate the configuration once; every helper below shares this object
+    def bids2nfConfig = tryWithContext("CONFIG_LOADING") {
+        loadBids2nfConfig(bids2nf_config)
     }
+    def config = bids2nfConfig.data
     
-    def configAnalysis = tryWithContext("CONFIG_ANALYSIS") {
-        analyzeConfiguration(bids2nf_config)
-    }
+    def configAnalysis = analyzeConfiguration(bids2nfConfig)
     
     // Get loop over entities from configuration
-    def loopOverEntities = tryWithContext("LOOP_OVER_CONFIG") {
-        getLoopOverEntities(bids2nf_config)
-    }
+    def loopOverEntities = getLoopOverEntities(bids2nfConfig)
     
     
-    def summary = getConfigurationSummary(bids2nf_config)
+    def summary = getConfigurationSummary(bids2nfConfig)
     
     logProgress("bids2nf", "┌─ ✓ Configuration analysis complete:")
     logProgress("bids2nf", "├─ ↬ Loop over entities: ${loopOverEntities.join(', ')}")
@@ -62,31 +72,43 @@ workflow bids2nf {
     logProgress("bids2nf", "├─ ⑉ Plain sets: ${summary.plainSets.count} patterns (${summary.plainSets.suffixes.join(', ')})")
     logProgress("bids2nf", "├─ = TOTAL patterns: ${summary.totalPatterns}")
     
+    // Final results of each batch of rows (one per subject when looping over subjects) can be
+    // cached across runs, keyed by the hash of the batch rows and of the config sections they use
+    def resultCache = params.grouping_cache_dir ? [
+        dir: file(params.grouping_cache_dir).toAbsolutePath().toString(),
+        context: [bids_parent_dir]
+    ] : null
+
+    // Parse the CSV once and pre-route every row to the set types that can handle it
+    // Sizes of the merging stages below, registered per key by route_parsed_rows
+    def sizeRegistry = new GroupSizeRegistry()
+    routed_rows = route_parsed_rows(parsed_units.subject_csvs, parsed_units.shared_csvs, config, loopOverEntities, resultCache, sizeRegistry)
+
     // Route to appropriate workflows based on configuration analysis, passing pre-processed data
     if (configAnalysis.hasNamedSets) {
         logProgress("bids2nf", "├─ ⑆ Processing named sets >>>")
-        named_results = emit_named_sets(parsed_csv, config, loopOverEntities)
+        named_results = emit_named_sets(routed_rows.named, config, loopOverEntities)
     } else {
         named_results = Channel.empty()
     }
     
     if (configAnalysis.hasSequentialSets) {
         logProgress("bids2nf", "├─ ⑇ Processing sequential sets ...")
-        sequential_results = emit_sequential_sets(parsed_csv, config, loopOverEntities)
+        sequential_results = emit_sequential_sets(routed_rows.sequential, config, loopOverEntities)
     } else {
         sequential_results = Channel.empty()
     }
     
     if (configAnalysis.hasMixedSets) {
         logProgress("bids2nf", "├─ ⑈ Processing mixed sets ...")
-        mixed_results = emit_mixed_sets(parsed_csv, config, loopOverEntities)
+        mixed_results = emit_mixed_sets(routed_rows.mixed, config, loopOverEntities)
     } else {
         mixed_results = Channel.empty()
     }
     
     if (configAnalysis.hasPlainSets) {
         logProgress("bids2nf", "├─ ⑉ Processing plain sets ...")
-        plain_results = emit_plain_sets(parsed_csv, config, loopOverEntities)
+        plain_results = emit_plain_sets(routed_rows.plain, config, loopOverEntities)
     } else {
         plain_results = Channel.empty()
     }
@@ -99,35 +121,35 @@ workflow bids2nf {
         .mix(mixed_results)
         .mix(plain_results)
     
-    // Group by loop_over entities and merge all data types
+    // Group by loop_over entities and merge all data types. Each set type routing rows to a
+    // loop key emits exactly one result for it, so groups are released as soon as they are complete.
     unified_results = combined_results
+        .map { groupingKey, data -> tuple(groupKey(groupingKey, sizeRegistry.get(GroupSizeRegistry.RESULTS, groupingKey)), data) }
         .groupTuple()
-        .map { groupingKey, dataList ->
+        .map { key, dataList ->
+            def groupingKey = key.getGroupTarget()
+            sizeRegistry.remove(GroupSizeRegistry.RESULTS, groupingKey)
+
             // Dynamically unpack grouping key based on loop_over entities
             def entityValues = [:]
             loopOverEntities.eachWithIndex { entity, index ->
                 entityValues[entity] = groupingKey[index] ?: "NA"
             }
             
-            // Merge all data maps and file paths
+            // Merge all data maps and file paths. Suffix data is shared by reference, never copied,
+            // and paths are deduplicated on insert instead of with a quadratic unique()
             def mergedDataMap = [:]
-            def allFilePaths = []
+            def allFilePaths = new LinkedHashSet()
             
             dataList.each { data ->
                 def (dataMap, filePaths) = data
-                
-                // Merge data maps
-                dataMap.each { suffix, suffixData ->
-                    mergedDataMap[suffix] = suffixData
-                }
-                
-                // Collect all file paths
+                mergedDataMap.putAll(dataMap)
                 allFilePaths.addAll(filePaths)
             }
             
             def enrichedData = [
                 data: mergedDataMap,
-                filePaths: allFilePaths.unique(),
+                filePaths: new ArrayList(allFilePaths),
                 bidsParentDir: "${bids_parent_dir}"
             ]
             
@@ -139,130 +161,47 @@ workflow bids2nf {
             tuple(groupingKey, enrichedData)
         }
     
-    // Apply demand-driven cross-modal broadcasting
-    final_results = unified_results
-        .toList()
-        .map { dataList ->
-            // Group data by non-task entities for cross-modal broadcasting
-            def groupedData = [:]
-            def crossModalData = [:]
-            
-            dataList.each { groupingKey, enrichedData ->
-                // Extract entity values
-                def entityValues = [:]
-                loopOverEntities.eachWithIndex { entity, index ->
-                    entityValues[entity] = groupingKey[index] ?: "NA"
-                }
-                
-                // Create grouping key without task entity
-                def nonTaskEntities = loopOverEntities.findAll { it != 'task' }
-                def nonTaskKey = nonTaskEntities.collect { entity ->
-                    entityValues[entity] ?: "NA"
-                }
-                
-                def nonTaskKeyStr = nonTaskKey.join('_')
-                
-                // Collect available cross-modal data (data with task="NA")
-                if (entityValues.task == "NA") {
-                    if (!crossModalData.containsKey(nonTaskKeyStr)) {
-                        crossModalData[nonTaskKeyStr] = [:]
-                    }
-                    
-                    // Store all suffixes from task="NA" channels as potential cross-modal data
-                    enrichedData.data.each { suffix, _suffixData ->
-                        crossModalData[nonTaskKeyStr][suffix] = _suffixData
-                    }
-                }
-                
-                // Group all data for later processing
-                if (!groupedData.containsKey(nonTaskKeyStr)) {
-                    groupedData[nonTaskKeyStr] = []
-                }
-                groupedData[nonTaskKeyStr] << [groupingKey, enrichedData, entityValues]
-            }
-            
-            // Apply demand-driven broadcasting
-            def broadcastedResults = []
-            
-            groupedData.each { nonTaskKeyStr, groupEntries ->
-                def availableCrossModalData = crossModalData[nonTaskKeyStr] ?: [:]
-                
-                groupEntries.each { groupingKey, enrichedData, entityValues ->
-                    def shouldKeepChannel = true
-                    def enhancedData = enrichedData.clone()
-                    enhancedData.data = enhancedData.data.clone()
-                    
-                    // For task-specific channels, check if they request cross-modal data
-                    if (entityValues.task != "NA") {
-                        enrichedData.data.each { suffix, _suffixData ->
-                            // Check if this suffix has include_cross_modal configuration
-                            def suffixConfig = config[suffix]
-                            if (suffixConfig) {
-                                def setCfg = suffixConfig.plain_set ?: suffixConfig.named_set ?: 
-                                           suffixConfig.sequential_set ?: suffixConfig.mixed_set
-                                
-                                if (setCfg && setCfg.include_cross_modal) {
-                                    // Add requested cross-modal data to this channel
-                                    setCfg.include_cross_modal.each { requestedSuffix ->
-                                        if (availableCrossModalData.containsKey(requestedSuffix)) {
-                                            enhancedData.data[requestedSuffix] = availableCrossModalData[requestedSuffix]
-                                        }
-                                    }
-                                }
-                            }
-                        }
-                    }
-                    
-                    // For task="NA" channels, check if their data was requested by other suffixes
-                    if (entityValues.task == "NA") {
-                        def dataWasRequested = false
-                        
-                        // Check if any suffix in this channel was requested by task-specific suffixes
-                        enrichedData.data.each { suffix, _suffixData ->
-                            // Look through all suffix configs to see if any request this suffix
-                            config.each { otherSuffix, otherSuffixConfig ->
-                                if (otherSuffix != suffix && otherSuffixConfig instanceof Map) {
-                                    def otherSetCfg = otherSuffixConfig.plain_set ?: otherSuffixConfig.named_set ?: 
-                                                     otherSuffixConfig.sequential_set ?: otherSuffixConfig.mixed_set
-                                    
-                                    if (otherSetCfg && otherSetCfg.include_cross_modal && 
-                                        otherSetCfg.include_cross_modal.contains(suffix)) {
-                                        dataWasRequested = true
-                                    }
-                                }
-                            }
-                        }
-                        
-                        // Only keep task="NA" channels if their data wasn't successfully included elsewhere
-                        // OR if they contain non-requested data
-                        def hasNonRequestedData = enrichedData.data.any { suffix, _suffixData ->
-                            def wasRequested = false
-                            config.each { otherSuffix, otherSuffixConfig ->
-                                if (otherSuffix != suffix && otherSuffixConfig instanceof Map) {
-                                    def otherSetCfg = otherSuffixConfig.plain_set ?: otherSuffixConfig.named_set ?: 
-                                                     otherSuffixConfig.sequential_set ?: otherSuffixConfig.mixed_set
-                                    
-                                    if (otherSetCfg && otherSetCfg.include_cross_modal && 
-                                        otherSetCfg.include_cross_modal.contains(suffix)) {
-                                        wasRequested = true
-                                    }
-                                }
-                            }
-                            return !wasRequested
-                        }
-                        
-                        shouldKeepChannel = hasNonRequestedData
-                    }
-                    
-                    if (shouldKeepChannel) {
-                        broadcastedResults << tuple(groupingKey, enhancedData)
-                    }
-                }
+    // Apply demand-driven cross-modal broadcasting per non-task key, streaming each key
+    // downstream as soon as all of its channels are available. The group size is the number of
+    // loop keys sharing the non-task key, i.e. the task="NA" donor and all task-specific consumers.
+    def crossModalIndex = buildCrossModalIndex(config)
+    broadcast_groups = unified_results
+        .map { groupingKey, enrichedData ->
+            def nonTaskKey = getNonTaskKey(groupingKey, loopOverEntities)
+            tuple(groupKey(nonTaskKey, sizeRegistry.get(GroupSizeRegistry.LOOP_KEYS, nonTaskKey)), [groupingKey, enrichedData])
+        }
+        .groupTuple()
+        .map { key, groupEntries ->
+            def nonTaskKey = key.getGroupTarget()
+            sizeRegistry.remove(GroupSizeRegistry.LOOP_KEYS, nonTaskKey)
+            tuple(nonTaskKey, broadcastCrossModal(groupEntries, crossModalIndex, loopOverEntities))
+        }
+
+    if (resultCache) {
+        // Collect the results of each regrouped batch once all of its non-task keys are broadcast
+        batch_results = broadcast_groups
+            .map { nonTaskKey, results ->
+                def (cacheKey, size) = sizeRegistry.remove(GroupSizeRegistry.CACHE_BATCHES, nonTaskKey)
+                tuple(groupKey(cacheKey, size), results)
             }
-            
-            return broadcastedResults
+            .groupTuple()
+            .map { key, resultLists -> tuple(key.getGroupTarget(), resultLists.collectMany { results -> results }) }
+
+        // Store them in a dedicated step, outside of the operators that pass results on
+        batch_results.subscribe { cacheKey, batchResults ->
+            writeCachedResults(resultCache.dir, cacheKey, batchResults)
         }
-        .flatMap()
+
+        // Then add the batches replayed from the cache
+        broadcast_results = batch_results
+            .flatMap { _cacheKey, batchResults -> batchResults }
+            .mix(routed_rows.cached_results)
+    } else {
+        broadcast_results = broadcast_groups.flatMap { _nonTaskKey, results -> results }
+    }
+
+    final_results = broadcast_results
+        .filter { _groupingKey, enrichedData -> enrichedData.data.size() > 0 }
     
     // Log final statistics and validate results
     final_results
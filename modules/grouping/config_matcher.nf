@@ -0,0 +1,96 @@
+include {
+    compileGroupings;
+    buildGroupingIndex;
+    findMatchingIndexedGrouping
+} from './entity_grouping_utils.nf'
+
+// Set types a configuration entry can declare, in routing order
+def getSetTypes() {
+    return ['named_set', 'sequential_set', 'mixed_set', 'plain_set']
+}
+
+def getTargetSuffix(configKey, configValue) {
+    // Return the actual BIDS suffix this config targets
+    return (configValue instanceof Map && configValue.containsKey('suffix_maps_to')) ? configValue.suffix_maps_to : configKey
+}
+
+def compileConfigMatcher(config) {
+    // Build a suffix -> candidates lookup table once, so routing a row costs a hash lookup
+    // plus the checks of the few configs targeting its suffix instead of a scan over the
+    // whole configuration. Candidates keep config order per set type, so the first
+    // candidate that can process a row wins, as with a linear scan of the config.
+    def matcher = [:]
+    config.each { configKey, configValue ->
+        if (!(configValue instanceof Map)) {
+            return
+        }
+        def targetSuffix = getTargetSuffix(configKey, configValue)
+        getSetTypes().each { setType ->
+            if (!configValue.containsKey(setType)) {
+                return
+            }
+            // Resolve the entity predicate of sequential sets and index the pre-normalized
+            // groupings of named and mixed sets up front
+            def requiredEntities = []
+            def groupingIndex = []
+            if (setType == 'sequential_set') {
+                def seqConfig = configValue.sequential_set
+                requiredEntities = seqConfig.containsKey('by_entities') ? seqConfig.by_entities : [seqConfig.by_entity]
+            } else if (setType == 'named_set') {
+                groupingIndex = buildGroupingIndex(compileGroupings(configValue.named_set))
+            } else if (setType == 'mixed_set') {
+                groupingIndex = buildGroupingIndex(compileGroupings(configValue.mixed_set.named_groups))
+            }
+            if (!matcher.containsKey(targetSuffix)) {
+                matcher[targetSuffix] = getSetTypes().collectEntries { [(it): []] }
+            }
+            matcher[targetSuffix][setType] << [configKey: configKey, configValue: configValue, requiredEntities: requiredEntities, groupingIndex: groupingIndex]
+        }
+    }
+    return matcher.asImmutable()
+}
+
+def resolveRoute(row, setType, candidate) {
+    // Named and mixed sets only take rows that belong to one of their groupings,
+    // mixed sets additionally need the sequential dimension on the row
+    def groupName = null
+    if (setType == 'named_set') {
+        groupName = findMatchingIndexedGrouping(row, candidate.groupingIndex)
+        if (!groupName) {
+            return null
+        }
+    } else if (setType == 'mixed_set') {
+        def mixedConfig = candidate.configValue.mixed_set
+        groupName = findMatchingIndexedGrouping(row, candidate.groupingIndex)
+        if (!groupName || !row[mixedConfig.sequential_dimension]) {
+            return null
+        }
+    }
+    return [setType, candidate.configKey, groupName]
+}
+
+def routeRow(row, matcher) {
+    // Resolve every set type that should receive this row as [setType, configKey, groupName].
+    // A row can be routed to several set types, e.g. dwi files feed both the plain 'dwi' set and
+    // the named 'dwi_fullreverse' set.
+    def routes = []
+    def candidatesBySetType = matcher[row.suffix]
+    if (candidatesBySetType == null) {
+        return routes
+    }
+    candidatesBySetType.each { setType, candidates ->
+        // Sequential sets rely on this check: emit_sequential_sets reads the ordering entities
+        // of every routed row without filtering, as each row is counted in its group size
+        def candidate = candidates.find { entry ->
+            entry.requiredEntities.every { entityKey ->
+                def entityValue = row[entityKey]
+                return entityValue && entityValue != "NA"
+            }
+        }
+        def route = candidate ? resolveRoute(row, setType, candidate) : null
+        if (route) {
+            routes << route
+        }
+    }
+    return routes
+}
@@ -0,0 +1,98 @@
+def getNonTaskKey(groupingKey, loopOverEntities) {
+    // Grouping key without the task entity: cross-modal data is shared across tasks
+    def nonTaskKey = []
+    loopOverEntities.eachWithIndex { entity, index ->
+        if (entity != 'task') {
+            nonTaskKey << (groupingKey[index] ?: "NA")
+        }
+    }
+    return nonTaskKey
+}
+
+def buildCrossModalIndex(config) {
+    // Build the include_cross_modal lookups once from the configuration:
+    //   requests:    suffix -> suffixes it pulls in from task="NA" channels
+    //   requestedBy: suffix -> suffixes that request it
+    def requests = [:]
+    def requestedBy = [:]
+    config.each { suffix, suffixConfig ->
+        if (!(suffixConfig instanceof Map)) {
+            return
+        }
+        def setCfg = suffixConfig.plain_set ?: suffixConfig.named_set ?:
+                     suffixConfig.sequential_set ?: suffixConfig.mixed_set
+        if (!setCfg || !setCfg.include_cross_modal) {
+            return
+        }
+        requests[suffix] = setCfg.include_cross_modal.asImmutable()
+        setCfg.include_cross_modal.each { requestedSuffix ->
+            if (requestedSuffix != suffix) {
+                if (!requestedBy.containsKey(requestedSuffix)) {
+                    requestedBy[requestedSuffix] = [] as Set
+                }
+                requestedBy[requestedSuffix] << suffix
+            }
+        }
+    }
+    return [
+        requests: requests.asImmutable(),
+        requestedBy: requestedBy.collectEntries { suffix, requesters -> [(suffix): requesters.asImmutable()] }.asImmutable()
+    ]
+}
+
+def broadcastCrossModal(groupEntries, crossModalIndex, loopOverEntities) {
+    // Apply demand-driven cross-modal broadcasting to all channels sharing one non-task key.
+    // groupEntries: [[groupingKey, enrichedData], ...]
+    def crossModalData = [:]
+    def entries = groupEntries.collect { groupingKey, enrichedData ->
+        def entityValues = [:]
+        loopOverEntities.eachWithIndex { entity, index ->
+            entityValues[entity] = groupingKey[index] ?: "NA"
+        }
+
+        // Collect available cross-modal data (data with task="NA")
+        if (entityValues.task == "NA") {
+            enrichedData.data.each { suffix, suffixData ->
+                crossModalData[suffix] = suffixData
+            }
+        }
+        return [groupingKey, enrichedData, entityValues]
+    }
+
+    def broadcastedResults = []
+
+    entries.each { groupingKey, enrichedData, entityValues ->
+        def shouldKeepChannel = true
+        def enhancedData = enrichedData
+
+        // For task-specific channels, add the cross-modal data their suffixes request. Results are
+        // never modified once emitted, so channels without requested data are passed on as is and
+        // the others get new top-level maps sharing the suffix data by reference.
+        if (entityValues.task != "NA") {
+            def requestedData = [:]
+            enrichedData.data.each { suffix, _suffixData ->
+                crossModalIndex.requests[suffix]?.each { requestedSuffix ->
+                    if (crossModalData.containsKey(requestedSuffix)) {
+                        requestedData[requestedSuffix] = crossModalData[requestedSuffix]
+                    }
+                }
+            }
+            if (requestedData) {
+                enhancedData = enrichedData + [data: enrichedData.data + requestedData]
+            }
+        }
+
+        // Only keep task="NA" channels if they contain data that no other suffix requests
+        if (entityValues.task == "NA") {
+            shouldKeepChannel = enrichedData.data.any { suffix, _suffixData ->
+                !crossModalIndex.requestedBy.containsKey(suffix)
+            }
+        }
+
+        if (shouldKeepChannel) {
+            broadcastedResults << tuple(groupingKey, enhancedData)
+        }
+    }
+
+    return broadcastedResults
+}
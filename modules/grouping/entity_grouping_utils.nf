@@ -1,7 +1,7 @@
-def normalizeEntityValue(value) {
+def computeNormalizedEntityValue(value) {
     // Normalize entity values to handle different zero-padding
     // e.g., "flip-02" and "flip-2" should both match
-    if (value && value.contains('-')) {
+    if (value.contains('-')) {
         def parts = value.split('-')
         if (parts.length == 2) {
             def prefix = parts[0]
@@ -9,40 +9,59 @@ def normalizeEntityValue(value) {
             // If suffix is numeric, remove leading zeros for comparison
             if (suffix.isNumber()) {
                 def numericSuffix = Integer.parseInt(suffix)
-                return "${prefix}-${numericSuffix}"
+                return "${prefix}-${numericSuffix}".toString()
             }
         }
     }
-    return value
+    return value.toString()
 }
 
-def entityValuesMatch(rowValue, configValue) {
-    // Compare entity values with normalization
-    if (!rowValue || !configValue) {
-        return rowValue == configValue
+def normalizeEntityValue(value) {
+    // Normalized values are memoized per run, see lib/EntityValueCache.groovy
+    if (!value) {
+        return value
     }
-    return normalizeEntityValue(rowValue) == normalizeEntityValue(configValue)
+    return EntityValueCache.normalize(value) { computeNormalizedEntityValue(it) }
+}
+
+def compileGroupings(groupings) {
+    // Pre-normalize named groupings once: [[groupName, [[entity, value, normalizedValue], ...]], ...]
+    // in config order, without the 'description' key which never takes part in matching
+    return groupings.findAll { _groupName, groupingConfig -> groupingConfig instanceof Map }.collect { groupName, groupingConfig ->
+        def conditions = groupingConfig
+            .findAll { entity, _value -> entity != 'description' }
+            .collect { entity, value -> [entity, value, normalizeEntityValue(value)].asImmutable() }
+        [groupName, conditions.asImmutable()].asImmutable()
+    }.asImmutable()
 }
 
-def findMatchingGrouping(row, suffixConfig) {
-    if (!suffixConfig.containsKey('named_set')) {
-        return null
+def buildGroupingIndex(compiledGroupings) {
+    // Index compiled groupings by the entities they constrain: one lookup table per entity
+    // signature, keyed on the normalized values of those entities. Each key keeps the first
+    // grouping in config order, so the lowest position over all signatures is the first match.
+    def lookupsBySignature = [:]
+    compiledGroupings.eachWithIndex { grouping, position ->
+        def (groupName, conditions) = grouping
+        def signature = conditions.collect { it[0] }
+        if (!lookupsBySignature.containsKey(signature)) {
+            lookupsBySignature[signature] = [:]
+        }
+        lookupsBySignature[signature].putIfAbsent(conditions.collect { it[2] }, [position, groupName].asImmutable())
     }
-    
-    def matchingEntry = suffixConfig.named_set.find { entry ->
-        def groupingName = entry.key
-        def groupingConfig = entry.value
-        
-        def matches = groupingConfig.every { entity, value ->
-            def rowValue = row[entity]
-            def isMatch = entity == 'description' || entityValuesMatch(rowValue, value)
-            return isMatch
+    return lookupsBySignature.collect { signature, lookup -> [signature.asImmutable(), lookup.asImmutable()].asImmutable() }.asImmutable()
+}
+
+def findMatchingIndexedGrouping(row, groupingIndex) {
+    // Normalizing a missing or empty row value keeps it as is, so it only matches the same
+    // missing or empty config value
+    def match = null
+    groupingIndex.each { signature, lookup ->
+        def candidate = lookup[signature.collect { entity -> normalizeEntityValue(row[entity]) }]
+        if (candidate != null && (match == null || candidate[0] < match[0])) {
+            match = candidate
         }
-        
-        return matches
     }
-    
-    return matchingEntry ? matchingEntry.key : null
+    return match ? match[1] : null
 }
 
 def createFileMap(extFiles) {
@@ -132,6 +151,14 @@ def validateRequiredFilesWithConfig(fileMap, subject, session, run, suffix, grou
     return true
 }
 
+def createLoopOverKey(row, loopOverEntities) {
+    // Values of the loop_over entities for a parsed row, with missing entities as "NA"
+    return loopOverEntities.collect { entity ->
+        def value = row.containsKey(entity) ? row[entity] : "NA"
+        return (value == null || value == "") ? "NA" : value
+    }
+}
+
 def createGroupingKey(subject, session, run) {
     def key = [subject]
     if (session && session != "NA") {
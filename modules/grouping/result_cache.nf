@@ -0,0 +1,108 @@
+include {
+    getTargetSuffix
+} from './config_matcher.nf'
+include {
+    buildCrossModalIndex
+} from './cross_modal_utils.nf'
+include {
+    writeJson
+} from '../utils/json_utils.nf'
+
+// Cache keys hash the inputs of grouping, not its code: bump this version with every change to
+// routing, grouping, merging or broadcasting that can change results, and when the layout of
+// grouping results changes, so entries written by older code are not replayed
+def getResultCacheVersion() {
+    return 'bids2nf-results-2'
+}
+
+def computeBatchCacheKey(rows, config, loopOverEntities, cacheContext) {
+    // Content hash of everything the final results of a batch depend on: its parsed rows in
+    // order, the config sections targeting suffixes found in those rows (in config order, which
+    // decides routing), the include_cross_modal requests of every config section (other
+    // suffixes requesting a suffix decide whether its task="NA" channel is kept), the loop_over
+    // entities and the run context written into every result
+    def digest = java.security.MessageDigest.getInstance('SHA-256')
+    def update = { value ->
+        digest.update(String.valueOf(value).getBytes('UTF-8'))
+        digest.update((byte) 0)
+    }
+
+    update(getResultCacheVersion())
+    loopOverEntities.each { entity -> update(entity) }
+    cacheContext.each { value -> update(value) }
+
+    def suffixes = [] as Set
+    rows.each { row ->
+        update('row')
+        row.each { key, value ->
+            update(key)
+            update(value)
+        }
+        suffixes << row.suffix
+    }
+
+    config.each { configKey, configValue ->
+        if (configValue instanceof Map && suffixes.contains(getTargetSuffix(configKey, configValue))) {
+            update(configKey)
+            update(groovy.json.JsonOutput.toJson(configValue))
+        }
+    }
+
+    buildCrossModalIndex(config).requests.each { suffix, requestedSuffixes ->
+        update('include_cross_modal')
+        update(suffix)
+        requestedSuffixes.each { requestedSuffix -> update(requestedSuffix) }
+    }
+
+    return digest.digest().encodeHex().toString()
+}
+
+def getCachedResultsFile(cacheDir, cacheKey) {
+    return new File(cacheDir.toString(), "${cacheKey}.json")
+}
+
+def toPlainJsonValue(value) {
+    // JsonSlurper returns lazily parsed maps and BigDecimal numbers; replayed results must have
+    // the same types as freshly grouped ones (LinkedHashMap, ArrayList, String, Integer, ...)
+    if (value instanceof Map) {
+        def plainMap = new LinkedHashMap()
+        value.each { key, item -> plainMap[key] = toPlainJsonValue(item) }
+        return plainMap
+    }
+    if (value instanceof List) {
+        return value.collect { item -> toPlainJsonValue(item) }
+    }
+    if (value instanceof BigDecimal) {
+        return value.doubleValue()
+    }
+    return value
+}
+
+def readCachedResults(cacheDir, cacheKey) {
+    // Final results stored for a batch as [groupingKey, enrichedData] tuples, or null when
+    // there is no usable entry
+    def cacheFile = getCachedResultsFile(cacheDir, cacheKey)
+    if (!cacheFile.isFile()) {
+        return null
+    }
+    try {
+        def entries = new groovy.json.JsonSlurper().parse(cacheFile, 'UTF-8')
+        return entries.collect { groupingKey, enrichedData -> tuple(toPlainJsonValue(groupingKey), toPlainJsonValue(enrichedData)) }
+    } catch (Exception e) {
+        log.warn "[result_cache] Ignoring unreadable cache entry ${cacheFile}: ${e.message}"
+        return null
+    }
+}
+
+def writeCachedResults(cacheDir, cacheKey, results) {
+    // Write to a temporary file and move it in place, so an interrupted run never leaves a
+    // truncated entry behind
+    def directory = new File(cacheDir.toString())
+    directory.mkdirs()
+    def tempFile = File.createTempFile(cacheKey, '.tmp', directory)
+    tempFile.withWriter('UTF-8') { writer ->
+        writeJson(results.collect { groupingKey, enrichedData -> [groupingKey, enrichedData] }, writer, false)
+    }
+    java.nio.file.Files.move(tempFile.toPath(), getCachedResultsFile(cacheDir, cacheKey).toPath(),
+        java.nio.file.StandardCopyOption.REPLACE_EXISTING, java.nio.file.StandardCopyOption.ATOMIC_MOVE)
+}
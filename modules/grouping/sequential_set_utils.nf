@@ -0,0 +1,167 @@
+def getSequentialSortKey(value) {
+    // Entity values are ordered by their trailing number, e.g. echo-2 before echo-10
+    def matcher = (value =~ /(\d+)$/)
+    return matcher.find() ? Integer.parseInt(matcher.group(1)) : 0
+}
+
+def compareRanks(int[] a, int[] b) {
+    for (int i = 0; i < a.length; i++) {
+        if (a[i] != b[i]) {
+            return a[i] <=> b[i]
+        }
+    }
+    return 0
+}
+
+def buildSequentialIndex(entityFiles) {
+    // Collect the files of one sequential set in a single pass.
+    //
+    // Each distinct combination of by_entities values is a cell holding its files per extension
+    // (or per extension and part). The values of each entity are ranked once by their trailing
+    // number, ties keeping their order of appearance, and cells are sorted once by their rank
+    // vector. That order is the flat layout, and consecutive cells sharing a prefix form the
+    // nested (hierarchical) layout.
+    def entityKeys = null
+    def orderType = null
+    def partsConfig = null
+    def valueOrders = null
+    def cells = [:]
+    def filePaths = []
+
+    entityFiles.each { keys, sequentialEntityValues, order, extension, filePath, partValue, parts ->
+        if (entityKeys == null) {
+            entityKeys = keys
+            orderType = order
+            valueOrders = keys.collect { [:] }
+        }
+        if (parts && !partsConfig) {
+            partsConfig = parts
+        }
+
+        sequentialEntityValues.eachWithIndex { value, dimension ->
+            valueOrders[dimension].putIfAbsent(value, valueOrders[dimension].size())
+        }
+
+        def extMap = cells[sequentialEntityValues]
+        if (extMap == null) {
+            extMap = [:]
+            cells[sequentialEntityValues] = extMap
+        }
+        if (partsConfig && partValue && partValue != "NA") {
+            // For parts: one file per extension and part
+            extMap["${extension}_${partValue}".toString()] = filePath
+        } else {
+            // Regular processing: files grouped by extension
+            if (!extMap.containsKey(extension)) {
+                extMap[extension] = []
+            }
+            extMap[extension] << filePath
+        }
+        filePaths << filePath
+    }
+
+    if (entityKeys == null) {
+        return [entityKeys: [], orderType: null, partsConfig: null, cells: [], filePaths: filePaths]
+    }
+
+    def ranks = valueOrders.collect { firstSeen ->
+        def sortedValues = firstSeen.keySet().sort { a, b ->
+            getSequentialSortKey(a) <=> getSequentialSortKey(b) ?: firstSeen[a] <=> firstSeen[b]
+        }
+        def rankByValue = [:]
+        sortedValues.eachWithIndex { value, rank -> rankByValue[value] = rank }
+        rankByValue
+    }
+
+    def sortedCells = cells.collect { values, extMap ->
+        int[] cellRanks = new int[values.size()]
+        values.eachWithIndex { value, dimension -> cellRanks[dimension] = ranks[dimension][value] }
+        [cellRanks, extMap]
+    }.sort { a, b -> compareRanks(a[0], b[0]) }
+
+    return [entityKeys: entityKeys, orderType: orderType, partsConfig: partsConfig, cells: sortedCells, filePaths: filePaths]
+}
+
+def resolveSequentialCell(extMap, partsConfig) {
+    // Pick the [nii, json] pair of a cell, or null if the cell has no usable pair.
+    // The JSON sidecar is required; with parts configured the nii entry is a map of
+    // part -> file when every part is present.
+    def jsonFile = null
+    def jsonList = extMap['json']
+    if (jsonList) {
+        jsonFile = jsonList instanceof List ? jsonList[0] : jsonList
+    } else {
+        // Look for json files with part extensions
+        def jsonKey = extMap.keySet().find { it.startsWith('json_') }
+        if (jsonKey) jsonFile = extMap[jsonKey]
+    }
+    if (!jsonFile) {
+        return null
+    }
+
+    if (partsConfig) {
+        def partFilesMap = [:]
+        partsConfig.each { partValue ->
+            def niiKey = extMap.keySet().find { it == "nii_part-${partValue}" || it == "nii.gz_part-${partValue}" }
+            if (niiKey) {
+                partFilesMap[partValue] = extMap[niiKey]
+            }
+        }
+        if (partFilesMap.size() == partsConfig.size()) {
+            return [partFilesMap, jsonFile]
+        }
+        // Fall back to regular processing if not all parts are present
+    }
+
+    def niiFileList = (extMap['nii'] ?: []) + (extMap['nii.gz'] ?: [])
+    return niiFileList ? [niiFileList[0], jsonFile] : null
+}
+
+def collectSequentialFlat(index) {
+    // Flat layout: usable pairs of all cells in sorted order
+    def niiFiles = []
+    def jsonFiles = []
+    index.cells.each { _cellRanks, extMap ->
+        def pair = resolveSequentialCell(extMap, index.partsConfig)
+        if (pair) {
+            niiFiles << pair[0]
+            jsonFiles << pair[1]
+        }
+    }
+    return [nii: niiFiles, json: jsonFiles]
+}
+
+def collectSequentialNested(index) {
+    // Hierarchical layout: one nested list per entity, leaves hold the usable pairs.
+    // Every existing value of an intermediate entity gets an entry, even if it has no usable pair.
+    def lastDimension = index.entityKeys.size() - 1
+    def nest
+    nest = { from, to, dimension ->
+        def niiGroup = []
+        def jsonGroup = []
+        if (dimension == lastDimension) {
+            (from..<to).each { position ->
+                def pair = resolveSequentialCell(index.cells[position][1], index.partsConfig)
+                if (pair) {
+                    niiGroup << pair[0]
+                    jsonGroup << pair[1]
+                }
+            }
+        } else {
+            def start = from
+            while (start < to) {
+                def rank = index.cells[start][0][dimension]
+                def end = start
+                while (end < to && index.cells[end][0][dimension] == rank) {
+                    end++
+                }
+                def child = nest(start, end, dimension + 1)
+                niiGroup << child.nii
+                jsonGroup << child.json
+                start = end
+            }
+        }
+        return [nii: niiGroup, json: jsonGroup]
+    }
+    return nest(0, index.cells.size(), 0)
+}
@@ -3,23 +3,55 @@ process libbids_sh_parse {
   path bids_dir
   path libbids_sh
   val libbids_config_dir
+  val bids_index_dir
 
   output:
   path "parsed.csv"
 
   script:
   def config_arg = libbids_config_dir ? "\"${libbids_config_dir}\"" : ""
-  """
-  if [ -f "${libbids_sh}" ]; then
-    source ${libbids_sh}
-  elif [ -d "${libbids_sh}" ]; then
-    source ${libbids_sh}/libBIDS.sh
+  if (bids_index_dir)
+    """
+    bash "${moduleDir}/libbids_sh_index.sh" "${libbids_sh}" "${bids_dir}" "${bids_index_dir}" parsed.csv ${config_arg}
+    """
   else
-    echo "Error: libBIDS.sh path is neither a file nor a directory: ${libbids_sh}" >&2
-    exit 1
-  fi
+    """
+    if [ -f "${libbids_sh}" ]; then
+      source ${libbids_sh}
+    elif [ -d "${libbids_sh}" ]; then
+      source ${libbids_sh}/libBIDS.sh
+    else
+      echo "Error: libBIDS.sh path is neither a file nor a directory: ${libbids_sh}" >&2
+      exit 1
+    fi
+
+    csv_data=\$(libBIDSsh_parse_bids_to_csv "${bids_dir}" ${config_arg})
+    echo "\$csv_data" > parsed.csv
+    """
+}
+
+process libbids_sh_parse_shard {
+  tag "shard ${shard_index}"
+
+  input:
+  tuple val(shard_index), val(parse_units)
+  path bids_dir
+  path libbids_sh
+  val libbids_config_dir
+
+  output:
+  path "units/*.csv"
+
+  script:
+  def config_arg = libbids_config_dir ? "\"${libbids_config_dir}\"" : ""
+  """
+  source "${moduleDir}/libbids_sh_utils.sh"
+  load_libbids "${libbids_sh}"
 
-  csv_data=\$(libBIDSsh_parse_bids_to_csv "${bids_dir}" ${config_arg})
-  echo "\$csv_data" > parsed.csv
+  # One CSV per top-level unit, so that downstream batching can stream per subject
+  mkdir -p units
+  for unit in ${parse_units.collect { "\"${it}\"" }.join(' ')}; do
+    parse_unit "${bids_dir}" "\${unit}" ${config_arg} > "units/\${unit}.csv"
+  done
   """
 }
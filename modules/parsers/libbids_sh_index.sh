@@ -0,0 +1,91 @@
+#!/usr/bin/env bash
+
+# Persistent, incremental index around libBIDSsh_parse_bids_to_csv.
+#
+# Usage: libbids_sh_index.sh <libbids_sh> <bids_dir> <index_dir> <output_csv> [libbids_config_dir]
+#
+# The dataset is indexed per top-level directory (sub-*, derivatives, ...),
+# plus one unit for the files directly under the dataset root. Each unit is
+# fingerprinted from the (path, mtime, size) of every file it contains. Only
+# units whose fingerprint changed since the previous run are handed to libBIDS
+# again, units that disappeared are dropped from the index, and the cached
+# rows of all units are merged into <output_csv> in a deterministic (sorted)
+# order.
+
+set -eu
+
+if [ $# -lt 4 ]; then
+    echo "Usage: $0 <libbids_sh> <bids_dir> <index_dir> <output_csv> [libbids_config_dir]" >&2
+    exit 1
+fi
+
+LIBBIDS_SH="$1"
+BIDS_DIR="$2"
+INDEX_ROOT="$3"
+OUTPUT_CSV="$4"
+LIBBIDS_CONFIG_DIR="${5:-}"
+
+source "$(dirname "${BASH_SOURCE[0]}")/libbids_sh_utils.sh"
+load_libbids "${LIBBIDS_SH}"
+
+parser_signature() {
+    {
+        cksum < "${LIBBIDS_SCRIPT}"
+        if [ -n "${LIBBIDS_CONFIG_DIR}" ] && [ -d "${LIBBIDS_CONFIG_DIR}" ]; then
+            find "${LIBBIDS_CONFIG_DIR}" -type f -exec cksum {} + | LC_ALL=C sort
+        fi
+    } | cksum | tr ' ' '-'
+}
+
+# Entries are namespaced by the resolved dataset location so that one index
+# directory can serve several datasets
+dataset_key=$(cd "${BIDS_DIR}" && pwd -P | cksum | cut -d' ' -f1)
+INDEX_DIR="${INDEX_ROOT}/${dataset_key}"
+mkdir -p "${INDEX_DIR}/shards"
+
+signature=$(parser_signature)
+if [ "$(cat "${INDEX_DIR}/parser.signature" 2>/dev/null || true)" != "${signature}" ]; then
+    rm -f "${INDEX_DIR}"/shards/*
+    echo "${signature}" > "${INDEX_DIR}/parser.signature"
+fi
+
+reused=0
+parsed=0
+removed=0
+shards=()
+declare -A present=()
+
+while IFS= read -r shard; do
+    shards+=("${shard}")
+    present["${shard}"]=1
+
+    entry="${INDEX_DIR}/shards/${shard}"
+    current=$(unit_fingerprint "${BIDS_DIR}" "${shard}")
+    if [ -f "${entry}.csv" ] && [ "$(cat "${entry}.fingerprint" 2>/dev/null || true)" = "${current}" ]; then
+        reused=$((reused + 1))
+        continue
+    fi
+
+    parse_unit "${BIDS_DIR}" "${shard}" "${LIBBIDS_CONFIG_DIR}" > "${entry}.csv.tmp"
+    mv "${entry}.csv.tmp" "${entry}.csv"
+    echo "${current}" > "${entry}.fingerprint"
+    parsed=$((parsed + 1))
+done < <(list_parse_units "${BIDS_DIR}")
+
+for entry in "${INDEX_DIR}"/shards/*.fingerprint; do
+    [ -f "${entry}" ] || continue
+    shard=$(basename "${entry}" .fingerprint)
+    if [ -z "${present[${shard}]+x}" ]; then
+        rm -f "${INDEX_DIR}/shards/${shard}.csv" "${entry}"
+        removed=$((removed + 1))
+    fi
+done
+
+shard_csvs=()
+for shard in ${shards[@]+"${shards[@]}"}; do
+    shard_csvs+=("${INDEX_DIR}/shards/${shard}.csv")
+done
+
+merge_csv "${OUTPUT_CSV}" ${shard_csvs[@]+"${shard_csvs[@]}"}
+
+echo "[libbids_sh_index] ${parsed} parsed, ${reused} reused, ${removed} removed (index: ${INDEX_DIR})" >&2
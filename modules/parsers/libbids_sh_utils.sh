@@ -0,0 +1,147 @@
+#!/usr/bin/env bash
+
+# Shared helpers for the libBIDS parse scripts (incremental index and sharded parsing).
+# Source this file; it does not run anything on its own.
+
+# Source libBIDS.sh from a file or a directory containing it and remember its location
+load_libbids() {
+    if [ -f "$1" ]; then
+        LIBBIDS_SCRIPT="$1"
+    elif [ -d "$1" ]; then
+        LIBBIDS_SCRIPT="$1/libBIDS.sh"
+    else
+        echo "Error: libBIDS.sh path is neither a file nor a directory: $1" >&2
+        exit 1
+    fi
+    source "${LIBBIDS_SCRIPT}"
+}
+
+# GNU and BSD stat disagree on their format flags
+if stat -c '%n' / >/dev/null 2>&1; then
+    list_files() { find "$1" -type f -exec stat -c '%n|%Y|%s' {} +; }
+else
+    list_files() { find "$1" -type f -exec stat -f '%N|%m|%z' {} +; }
+fi
+
+fingerprint() {
+    list_files "$1" | LC_ALL=C sort | cksum | tr ' ' '-'
+}
+
+# Pseudo unit for the files directly under the dataset root (dataset_description.json,
+# participants.tsv, inherited top-level sidecars, ...), which no top-level directory covers.
+# '@' cannot start a BIDS directory name, so it never collides with a real unit.
+ROOT_FILES_UNIT="@root"
+
+list_root_files() {
+    find "$1" -mindepth 1 -maxdepth 1 -type f ! -name '.*'
+}
+
+# Parse units of a dataset in deterministic order: the root files unit, when the dataset root
+# holds files, and the top-level directories (sub-*, derivatives, ...)
+list_parse_units() {
+    local unit_path
+    {
+        [ -n "$(list_root_files "$1")" ] && echo "${ROOT_FILES_UNIT}"
+        for unit_path in "$1"/*/; do
+            [ -d "${unit_path}" ] && basename "${unit_path}"
+        done
+    } | LC_ALL=C sort
+}
+
+# unit_fingerprint <bids_dir> <unit>
+unit_fingerprint() {
+    if [ "$2" = "${ROOT_FILES_UNIT}" ]; then
+        list_root_files "$1" | while IFS= read -r root_file; do list_files "${root_file}"; done | LC_ALL=C sort | cksum | tr ' ' '-'
+    else
+        fingerprint "$1/$2"
+    fi
+}
+
+# parse_dir <dir> [libbids_config_dir]
+parse_dir() {
+    local csv_data
+    if [ -n "${2:-}" ]; then
+        csv_data=$(libBIDSsh_parse_bids_to_csv "$1" "$2")
+    else
+        csv_data=$(libBIDSsh_parse_bids_to_csv "$1")
+    fi
+    echo "$csv_data"
+}
+
+# parse_unit <bids_dir> <unit> [libbids_config_dir]
+parse_unit() {
+    if [ "$2" != "${ROOT_FILES_UNIT}" ]; then
+        parse_dir "$1/$2" "${3:-}"
+        return
+    fi
+
+    # libBIDS only crawls whole trees, so the root files are parsed from a staging copy of
+    # the dataset root without its directories. libBIDS reads file names only, so empty
+    # placeholders are enough; their paths are mapped back to the dataset afterwards.
+    local staging_root staging_dir root_file
+    staging_root=$(mktemp -d)
+    staging_dir="${staging_root}/$(basename "$1")"
+    mkdir -p "${staging_dir}"
+    list_root_files "$1" | while IFS= read -r root_file; do
+        : > "${staging_dir}/$(basename "${root_file}")"
+    done
+    parse_dir "${staging_dir}" "${3:-}" | awk -v from="${staging_dir}" -v to="$1" '{
+        line = ""
+        while ((i = index($0, from)) > 0) {
+            line = line substr($0, 1, i - 1) to
+            $0 = substr($0, i + length(from))
+        }
+        print line $0
+    }'
+    rm -rf "${staging_root}"
+}
+
+# Merge CSV files into one, keeping the header of the first non-empty file.
+# Files whose header differs are realigned by column name.
+merge_csv() {
+    local out="$1"
+    shift
+    local header="" aligned=true f h
+    for f in "$@"; do
+        [ -s "$f" ] || continue
+        h=$(head -n 1 "$f")
+        if [ -z "$header" ]; then
+            header="$h"
+        elif [ "$h" != "$header" ]; then
+            aligned=false
+        fi
+    done
+
+    if [ -z "$header" ]; then
+        : > "$out"
+        return
+    fi
+
+    if $aligned; then
+        {
+            echo "$header"
+            for f in "$@"; do
+                [ -s "$f" ] && awk 'NR > 1 && NF' "$f"
+            done
+        } > "$out"
+        return
+    fi
+
+    header=$(for f in "$@"; do [ -s "$f" ] && head -n 1 "$f"; done | awk -F, '
+        { for (i = 1; i <= NF; i++) if (!($i in seen)) { seen[$i] = 1; cols = cols (cols == "" ? "" : ",") $i } }
+        END { print cols }')
+    {
+        echo "$header"
+        for f in "$@"; do
+            [ -s "$f" ] || continue
+            awk -F, -v header="$header" '
+                BEGIN { n = split(header, cols, ",") }
+                FNR == 1 { delete pos; for (i = 1; i <= NF; i++) pos[$i] = i; next }
+                NF {
+                    line = ""
+                    for (j = 1; j <= n; j++) line = line (j > 1 ? "," : "") ((cols[j] in pos) ? $(pos[cols[j]]) : "NA")
+                    print line
+                }' "$f"
+        done
+    } > "$out"
+}
@@ -0,0 +1,11 @@
+def readParsedRows(parsedCsv) {
+    // Read a parsed CSV into compact rows (see lib/CompactRow.groovy). Rows sharing a header
+    // share one RowSchema, entity values are dictionary-encoded and "NA" values are not stored,
+    // while lookups behave like the maps of splitCsv(header: true).
+    def records = parsedCsv.splitCsv()
+    if (!records || records[0] == ['']) {
+        return []
+    }
+    def schema = RowSchema.forHeader(records[0])
+    return records.drop(1).collect { record -> CompactRow.of(schema, record) }
+}
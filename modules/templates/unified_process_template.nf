@@ -1,4 +1,4 @@
-include { serializeMapToJson } from '../utils/json_utils'
+include { renderUnifiedJson } from '../utils/json_utils'
 include { logDebug } from '../utils/error_handling'
 
 process unified_process_template {
@@ -18,23 +18,10 @@ process unified_process_template {
   def filePaths = enrichedData.filePaths
   def bidsParentDir = enrichedData.bidsParentDir
   
-  // Create dynamic entity values and filename based on actual entities in enrichedData
-  def entityValues = []
-  def entityFields = []
-  ['subject', 'session', 'run', 'task', 'acquisition'].each { entity ->
-    if (enrichedData.containsKey(entity)) {
-      def _value = enrichedData[entity] ?: "null"
-      entityValues.add(_value)
-      entityFields.add("\"${entity}\": \"${_value}\"")
-    }
-  }
-  
-  def filename = entityValues.join('_') + '_unified.json'
-  def entityJson = entityFields.join(',\n  ')
+  // Create dynamic filename and JSON content based on actual entities in enrichedData
+  def (filename, jsonContent) = renderUnifiedJson(enrichedData, includeBidsParentDir)
 
-  logDebug("unified_process_template", "Unified processing .... ${entityValues.join(' ')}")
-  
-  def jsonString = serializeMapToJson(data)
+  logDebug("unified_process_template", "Unified processing .... ${filename}")
   
   """
   echo "=== Unified bids2nf Processing ==="
@@ -117,10 +104,29 @@ process unified_process_template {
   }.findAll { it != "" }.join('\n')}
   
 cat > ${filename} << 'EOF'
-{
-  ${entityJson}${includeBidsParentDir ? ",\n  \"bidsParentDir\": \"${bidsParentDir}\"" : ""},
-  "data": ${jsonString}
-}
+${jsonContent}
 EOF
   """
-}
\ No newline at end of file
+}
+
+process unified_process_template_batch {
+
+  tag "${batch.name}"
+
+  publishDir { "tests/new_outputs/${bidsBasename}" }, mode: 'copy'
+
+  input:
+  path(batch)
+  val(bidsBasename)
+
+  output:
+  path "*.json", emit: output_file
+
+  script:
+  // The batch is staged as one file holding the JSON files of several grouping keys, each
+  // preceded by a "### <filename>" line (see test_unified_bids2nf.nf), and split here
+  """
+  echo "=== Unified bids2nf Processing (${batch.name}) ==="
+  awk '/^### / { if (out) close(out); out = substr(\$0, 5); print "Writing " out; next } { print > out }' ${batch}
+  """
+}
@@ -1,9 +1,43 @@
 /**
- * Analyze configuration file to determine which workflow types are present
+ * Recursively wrap parsed YAML content into unmodifiable collections
  */
-def analyzeConfiguration(bids2nf_config) {
-    def config = new org.yaml.snakeyaml.Yaml().load(new FileReader(bids2nf_config))
-    
+def freezeConfigValue(value) {
+    if (value instanceof Map) {
+        def frozen = new LinkedHashMap()
+        value.each { key, nestedValue -> frozen[key] = freezeConfigValue(nestedValue) }
+        return frozen.asImmutable()
+    }
+    if (value instanceof List) {
+        return value.collect { freezeConfigValue(it) }.asImmutable()
+    }
+    return value
+}
+
+/**
+ * Validate the structure of a parsed configuration
+ */
+def validateConfigurationData(config, bids2nf_config) {
+    if (!(config instanceof Map) || config.isEmpty()) {
+        throw new IllegalArgumentException("Configuration ${bids2nf_config} must be a non-empty YAML mapping")
+    }
+
+    config.each { suffix, suffixConfig ->
+        if (suffix == 'loop_over') {
+            if (!(suffixConfig instanceof List) || suffixConfig.isEmpty() || !suffixConfig.every { it instanceof String }) {
+                throw new IllegalArgumentException("'loop_over' in ${bids2nf_config} must be a non-empty list of entity names")
+            }
+            return
+        }
+        if (!(suffixConfig instanceof Map)) {
+            throw new IllegalArgumentException("Configuration entry '${suffix}' in ${bids2nf_config} must be a mapping")
+        }
+    }
+}
+
+/**
+ * Determine which workflow types are present in parsed configuration data
+ */
+def buildConfigurationAnalysis(config) {
     def analysis = [
         hasNamedSets: false,
         hasSequentialSets: false,
@@ -14,80 +48,113 @@ def analyzeConfiguration(bids2nf_config) {
         mixedSetSuffixes: [],
         plainSetSuffixes: []
     ]
-    
+
     config.each { suffix, suffixConfig ->
         // Skip global configuration keys that are not set definitions
         if (suffix == 'loop_over') {
             return true
         }
-        
+
         if (suffixConfig.containsKey('named_set')) {
             analysis.hasNamedSets = true
             analysis.namedSetSuffixes << suffix
         }
-        
+
         if (suffixConfig.containsKey('sequential_set')) {
             analysis.hasSequentialSets = true
             analysis.sequentialSetSuffixes << suffix
         }
-        
+
         if (suffixConfig.containsKey('mixed_set')) {
             analysis.hasMixedSets = true
             analysis.mixedSetSuffixes << suffix
         }
-        
+
         if (suffixConfig.containsKey('plain_set')) {
             analysis.hasPlainSets = true
             analysis.plainSetSuffixes << suffix
         }
     }
-    
-    return analysis
+
+    return freezeConfigValue(analysis)
+}
+
+/**
+ * Parse and validate a configuration file once.
+ * The returned object is immutable and is what all other helpers in this module take:
+ * [path, checksum (SHA-256 of the file content), data, loopOver, analysis]
+ */
+def loadBids2nfConfig(bids2nf_config) {
+    def configFile = file(bids2nf_config)
+    def content = configFile.text
+    def checksum = java.security.MessageDigest.getInstance('SHA-256')
+        .digest(content.getBytes('UTF-8'))
+        .encodeHex()
+        .toString()
+
+    def config = new org.yaml.snakeyaml.Yaml().load(content)
+    validateConfigurationData(config, bids2nf_config)
+
+    def loopOver = config.containsKey('loop_over') ? config.loop_over : ['subject', 'session', 'run']
+
+    return [
+        path: configFile.toString(),
+        checksum: checksum,
+        data: freezeConfigValue(config),
+        loopOver: freezeConfigValue(loopOver),
+        analysis: buildConfigurationAnalysis(config)
+    ].asImmutable()
+}
+
+/**
+ * Analyze configuration to determine which workflow types are present
+ */
+def analyzeConfiguration(bids2nfConfig) {
+    return bids2nfConfig.analysis
 }
 
 /**
  * Check if configuration has any named sets
  */
-def hasNamedSets(bids2nf_config) {
-    return analyzeConfiguration(bids2nf_config).hasNamedSets
+def hasNamedSets(bids2nfConfig) {
+    return bids2nfConfig.analysis.hasNamedSets
 }
 
 /**
  * Check if configuration has any sequential sets
  */
-def hasSequentialSets(bids2nf_config) {
-    return analyzeConfiguration(bids2nf_config).hasSequentialSets
+def hasSequentialSets(bids2nfConfig) {
+    return bids2nfConfig.analysis.hasSequentialSets
 }
 
 /**
  * Check if configuration has any mixed sets
  */
-def hasMixedSets(bids2nf_config) {
-    return analyzeConfiguration(bids2nf_config).hasMixedSets
+def hasMixedSets(bids2nfConfig) {
+    return bids2nfConfig.analysis.hasMixedSets
 }
 
 /**
  * Check if configuration has any plain sets
  */
-def hasPlainSets(bids2nf_config) {
-    return analyzeConfiguration(bids2nf_config).hasPlainSets
+def hasPlainSets(bids2nfConfig) {
+    return bids2nfConfig.analysis.hasPlainSets
 }
 
 /**
  * Get loop_over entities from configuration
  */
-def getLoopOverEntities(bids2nf_config) {
-    def config = new org.yaml.snakeyaml.Yaml().load(new FileReader(bids2nf_config))
-    return config.containsKey('loop_over') ? config.loop_over : ['subject', 'session', 'run']
+def getLoopOverEntities(bids2nfConfig) {
+    return bids2nfConfig.loopOver
 }
 
 
 /**
  * Get detailed configuration analysis with counts and types
  */
-def getConfigurationSummary(bids2nf_config) {
-    def analysis = analyzeConfiguration(bids2nf_config)
-    
+def getConfigurationSummary(bids2nfConfig) {
+    def analysis = bids2nfConfig.analysis
+
     def summary = [
         totalPatterns: analysis.namedSetSuffixes.size() + analysis.sequentialSetSuffixes.size() + analysis.mixedSetSuffixes.size() + analysis.plainSetSuffixes.size(),
         namedSets: [
@@ -107,6 +174,6 @@ def getConfigurationSummary(bids2nf_config) {
             suffixes: analysis.plainSetSuffixes
         ]
     ]
-    
+
     return summary
-}
\ No newline at end of file
+}
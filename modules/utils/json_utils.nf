@@ -1,6 +1,109 @@
 def serializeMapToJson(data) {
-    def jsonBuilder = new groovy.json.JsonBuilder(data)
-    return jsonBuilder.toPrettyString()
+    def writer = new StringWriter()
+    writeJson(data, writer, true)
+    return writer.toString()
+}
+
+def writeJson(data, Writer writer, boolean pretty) {
+    // Stream data as JSON to a writer without building the whole document as a string first.
+    // Pretty output has the same layout as JsonBuilder.toPrettyString(), compact output the same
+    // as JsonOutput.toJson()
+    writeJsonValue(data, writer, pretty, '')
+}
+
+def writeJsonValue(value, Writer writer, boolean pretty, String indent) {
+    def childIndent = indent + '    '
+    if (value instanceof Map) {
+        writeJsonContainer(value.entrySet(), '{', '}', writer, pretty, indent) { entry ->
+            writer.write(groovy.json.JsonOutput.toJson(String.valueOf(entry.key)))
+            writer.write(pretty ? ': ' : ':')
+            writeJsonValue(entry.value, writer, pretty, childIndent)
+        }
+    } else if (value instanceof Collection || value instanceof Object[]) {
+        writeJsonContainer(value as List, '[', ']', writer, pretty, indent) { item ->
+            writeJsonValue(item, writer, pretty, childIndent)
+        }
+    } else {
+        // Scalars and any other objects are encoded as JsonOutput does. Objects it encodes as
+        // containers (beans, iterables) are laid out by prettyPrint at the current depth.
+        def json = groovy.json.JsonOutput.toJson(value)
+        if (pretty && (json.startsWith('{') || json.startsWith('['))) {
+            json = groovy.json.JsonOutput.prettyPrint(json).replace('\n', '\n' + indent)
+        }
+        writer.write(json)
+    }
+}
+
+def writeJsonContainer(items, String open, String close, Writer writer, boolean pretty, String indent, Closure writeItem) {
+    // Empty containers keep prettyPrint's layout: the opening line, an indented blank line and
+    // the closing line
+    def childIndent = indent + '    '
+    writer.write(open)
+    if (pretty) {
+        writer.write('\n' + childIndent)
+    }
+    def first = true
+    items.each { item ->
+        if (!first) {
+            writer.write(pretty ? ',\n' + childIndent : ',')
+        }
+        first = false
+        writeItem(item)
+    }
+    if (pretty) {
+        writer.write('\n' + indent)
+    }
+    writer.write(close)
+}
+
+def renderUnifiedJson(enrichedData, includeBidsParentDir) {
+    // Name and content (without trailing newline) of the JSON file written for one grouping key
+    def writer = new StringWriter()
+    def filename = writeUnifiedJson(enrichedData, includeBidsParentDir, writer)
+    return [filename, writer.toString()]
+}
+
+def getUnifiedJsonFilename(enrichedData) {
+    def entityValues = ['subject', 'session', 'run', 'task', 'acquisition']
+        .findAll { entity -> enrichedData.containsKey(entity) }
+        .collect { entity -> enrichedData[entity] ?: "null" }
+    return entityValues.join('_') + '_unified.json'
+}
+
+def writeUnifiedJson(enrichedData, includeBidsParentDir, Writer writer) {
+    // Stream the JSON file of one grouping key (without trailing newline) and return its name
+    def entityFields = []
+    ['subject', 'session', 'run', 'task', 'acquisition'].each { entity ->
+        if (enrichedData.containsKey(entity)) {
+            def _value = enrichedData[entity] ?: "null"
+            entityFields.add("\"${entity}\": \"${_value}\"")
+        }
+    }
+
+    def entityJson = entityFields.join(',\n  ')
+    def bidsParentDirJson = includeBidsParentDir ? ",\n  \"bidsParentDir\": \"${enrichedData.bidsParentDir}\"" : ""
+
+    writer.write("{\n  ${entityJson}${bidsParentDirJson},\n  \"data\": ".toString())
+    writeJson(enrichedData.data, writer, true)
+    writer.write('\n}')
+
+    return getUnifiedJsonFilename(enrichedData)
+}
+
+def writeUnifiedJsonLine(enrichedData, includeBidsParentDir, Writer writer) {
+    // Compact single-line record of one grouping key for NDJSON manifests, with the same fields
+    // as the per-key file plus the name of that file. No line separator is written.
+    def record = [file: getUnifiedJsonFilename(enrichedData)]
+    ['subject', 'session', 'run', 'task', 'acquisition'].each { entity ->
+        if (enrichedData.containsKey(entity)) {
+            record[entity] = enrichedData[entity] ?: "null"
+        }
+    }
+    if (includeBidsParentDir) {
+        record.bidsParentDir = enrichedData.bidsParentDir.toString()
+    }
+    record.data = enrichedData.data
+    writeJson(record, writer, false)
 }
 
 def readJsonFromFile(file) {
@@ -8,32 +111,143 @@ def readJsonFromFile(file) {
     return jsonSlurper.parse(file)
 }
 
-def assertJsonDirectories(expectedDir, newDir) {
-def expectedFiles = []
-def newFiles = []
-new File(expectedDir).eachFileRecurse { file ->
-if (file.name.endsWith('.json')) {
-expectedFiles << file.path.replace(expectedDir + '/', '')
+def readJsonLazily(file) {
+    // Index overlay parsing only records where values are and decodes them on first access,
+    // so picking a few fields out of a large document does not build the whole object tree
+    def jsonSlurper = new groovy.json.JsonSlurper().setType(groovy.json.JsonParserType.INDEX_OVERLAY)
+    return jsonSlurper.parse(new File(file.toString()))
 }
+
+def eachJsonLine(file, Closure action) {
+    // Parse an NDJSON manifest one record at a time
+    def jsonSlurper = new groovy.json.JsonSlurper().setType(groovy.json.JsonParserType.INDEX_OVERLAY)
+    new File(file.toString()).withReader('UTF-8') { reader ->
+        reader.eachLine { line ->
+            if (line.trim()) {
+                action(jsonSlurper.parseText(line))
+            }
+        }
+    }
 }
-new File(newDir).eachFileRecurse { file ->
-if (file.name.endsWith('.json')) {
-newFiles << file.path.replace(newDir + '/', '')
+
+def listJsonFiles(dir) {
+    // Paths of all JSON files below dir, relative to dir
+    def root = new File(dir.toString()).toPath()
+    def jsonFiles = [] as Set
+    root.toFile().eachFileRecurse { file ->
+        if (file.name.endsWith('.json')) {
+            jsonFiles << root.relativize(file.toPath()).toString()
+        }
+    }
+    return jsonFiles
 }
+
+def canonicalizeJson(value) {
+    // Same value with map keys sorted at every level, so equal documents serialize identically
+    if (value instanceof Map) {
+        def sorted = new TreeMap()
+        value.each { key, item -> sorted[key.toString()] = canonicalizeJson(item) }
+        return sorted
+    }
+    if (value instanceof List) {
+        return value.collect { item -> canonicalizeJson(item) }
+    }
+    return value
 }
-expectedFiles.sort()
-newFiles.sort()
-if (expectedFiles != newFiles) {
-throw new Exception("JSON file list mismatch: Expected ${expectedFiles}, New ${newFiles}")
+
+def hashCanonicalJson(value) {
+    def canonical = groovy.json.JsonOutput.toJson(canonicalizeJson(value))
+    return java.security.MessageDigest.getInstance('SHA-256').digest(canonical.getBytes('UTF-8')).encodeHex().toString()
 }
-expectedFiles.each { relPath ->
-def expectedFile = new File(expectedDir, relPath)
-def newFile = new File(newDir, relPath)
-def expectedJson = readJsonFromFile(expectedFile)
-def newJson = readJsonFromFile(newFile)
-if (expectedJson != newJson) {
-throw new Exception("JSON content mismatch in ${relPath}: Expected ${expectedJson}, New ${newJson}")
+
+def formatJsonPath(path) {
+    return path ? path.collect { part -> part instanceof Integer ? "[${part}]" : ".${part}" }.join('') : '<root>'
+}
+
+def abbreviateJson(value) {
+    def text = groovy.json.JsonOutput.toJson(value)
+    return text.length() <= 120 ? text : text.substring(0, 117) + '...'
+}
+
+def diffJsonValues(expected, actual, path, differences, maxDifferences) {
+    // Collect one line per differing key path, up to maxDifferences lines
+    if (differences.size() >= maxDifferences) {
+        return differences
+    }
+    if (expected instanceof Map && actual instanceof Map) {
+        expected.each { key, value ->
+            if (!actual.containsKey(key)) {
+                differences << "${formatJsonPath(path + [key])}: missing in new".toString()
+            } else {
+                diffJsonValues(value, actual[key], path + [key], differences, maxDifferences)
+            }
+        }
+        actual.keySet().findAll { key -> !expected.containsKey(key) }.each { key ->
+            differences << "${formatJsonPath(path + [key])}: extra in new".toString()
+        }
+    } else if (expected instanceof List && actual instanceof List) {
+        if (expected.size() != actual.size()) {
+            differences << "${formatJsonPath(path)}: ${expected.size()} items expected, ${actual.size()} new".toString()
+        }
+        (0..<Math.min(expected.size(), actual.size())).each { index ->
+            diffJsonValues(expected[index], actual[index], path + [index], differences, maxDifferences)
+        }
+    } else if (expected != actual) {
+        differences << "${formatJsonPath(path)}: expected ${abbreviateJson(expected)}, new ${abbreviateJson(actual)}".toString()
+    }
+    return differences.take(maxDifferences)
 }
+
+def compareJsonFiles(expectedFile, newFile) {
+    // Differences between two JSON files, empty if they hold the same JSON
+    def expectedBytes = expectedFile.bytes
+    def newBytes = newFile.bytes
+    if (Arrays.equals(expectedBytes, newBytes)) {
+        return []
+    }
+    def jsonSlurper = new groovy.json.JsonSlurper()
+    def expectedJson = jsonSlurper.parse(expectedBytes, 'UTF-8')
+    def newJson = jsonSlurper.parse(newBytes, 'UTF-8')
+    if (hashCanonicalJson(expectedJson) == hashCanonicalJson(newJson)) {
+        return []
+    }
+    return diffJsonValues(expectedJson, newJson, [], [], 20)
+}
+
+def assertJsonDirectories(expectedDir, newDir) {
+    // Compare the JSON files of two output trees. Files are compared on a thread pool:
+    // byte-identical files pass without parsing, other files pass when their canonical JSON
+    // hashes match, and only files that still differ are diffed key by key.
+    def expectedFiles = listJsonFiles(expectedDir)
+    def newFiles = listJsonFiles(newDir)
+    def problems = []
+
+    def missingFiles = (expectedFiles - newFiles).sort()
+    def extraFiles = (newFiles - expectedFiles).sort()
+    if (missingFiles || extraFiles) {
+        problems << "JSON file list mismatch: Missing ${missingFiles}, Extra ${extraFiles}".toString()
+    }
+
+    def commonFiles = expectedFiles.intersect(newFiles).sort()
+    def executor = java.util.concurrent.Executors.newFixedThreadPool(Runtime.getRuntime().availableProcessors())
+    try {
+        def comparisons = commonFiles.collect { relPath ->
+            executor.submit({
+                compareJsonFiles(new File(expectedDir.toString(), relPath), new File(newDir.toString(), relPath))
+            } as java.util.concurrent.Callable)
+        }
+        commonFiles.eachWithIndex { relPath, index ->
+            def differences = comparisons[index].get()
+            if (differences) {
+                problems << "JSON content mismatch in ${relPath}:\n    ${differences.join('\n    ')}".toString()
+            }
+        }
+    } finally {
+        executor.shutdownNow()
+    }
+
+    if (problems) {
+        throw new Exception(problems.join('\n'))
+    }
+    return true
 }
-return true
-}
\ No newline at end of file
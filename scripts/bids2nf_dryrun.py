@@ -0,0 +1,731 @@
+#!/usr/bin/env python3
+"""
+Dry-run the bids2nf grouping engine in Python.
+
+Reads the parsed CSV(s) written by libBIDS.sh (the `parsed.csv` of `libbids_sh_parse`, or the
+per-unit CSVs of sharded parsing) and a bids2nf.yaml, and writes the `*_unified.json` files
+`tests/integration/test_unified_bids2nf.nf` would write, without starting Nextflow. It
+follows the routing of `modules/grouping/config_matcher.nf`, the plain, named, sequential and
+mixed set workflows in `subworkflows/` and the merging and cross-modal broadcasting of
+`main.nf`. Rows are processed in the same batches as `route_parsed_rows`: one per subject
+when `subject` is in `loop_over`, evaluated in parallel worker processes.
+
+pandas is used to load and partition the CSVs when installed, the csv module otherwise.
+
+Usage:
+    python scripts/bids2nf_dryrun.py parsed.csv --output-dir tests/new_outputs/ds-dwi
+"""
+
+import argparse
+import csv
+import json
+import os
+import re
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import yaml
+
+SET_TYPES = ('named_set', 'sequential_set', 'mixed_set', 'plain_set')
+UNIFIED_ENTITIES = ('subject', 'session', 'run', 'task', 'acquisition')
+DEFAULT_LOOP_OVER = ['subject', 'session', 'run']
+
+TRAILING_NUMBER = re.compile(r'(\d+)$')
+
+Row = Dict[str, Optional[str]]
+
+
+def warn(message: str) -> None:
+    print(f"WARN: {message}", file=sys.stderr)
+
+
+# ---------------------------------------------------------------------------
+# Entity matching (modules/grouping/entity_grouping_utils.nf)
+# ---------------------------------------------------------------------------
+
+def normalize_entity_value(value: Any) -> Any:
+    """Drop zero-padding of numeric entity labels, e.g. flip-02 -> flip-2."""
+    if not value:
+        return value
+    value = str(value)
+    parts = value.split('-')
+    if len(parts) == 2 and parts[1].isdigit():
+        return f"{parts[0]}-{int(parts[1])}"
+    return value
+
+
+def compile_groupings(groupings: Dict[str, Any]) -> List[Tuple[str, List[Tuple[str, Any, Any]]]]:
+    return [
+        (group_name, [(entity, value, normalize_entity_value(value))
+                      for entity, value in grouping.items() if entity != 'description'])
+        for group_name, grouping in groupings.items() if isinstance(grouping, dict)
+    ]
+
+
+def build_grouping_index(compiled) -> List[Tuple[Tuple[str, ...], Dict[Tuple, Tuple[int, str]]]]:
+    lookups: Dict[Tuple[str, ...], Dict[Tuple, Tuple[int, str]]] = {}
+    for position, (group_name, conditions) in enumerate(compiled):
+        signature = tuple(entity for entity, _, _ in conditions)
+        lookups.setdefault(signature, {}).setdefault(
+            tuple(normalized for _, _, normalized in conditions), (position, group_name))
+    return list(lookups.items())
+
+
+def find_matching_grouping(row: Row, grouping_index) -> Optional[str]:
+    match = None
+    for signature, lookup in grouping_index:
+        candidate = lookup.get(tuple(normalize_entity_value(row.get(entity)) for entity in signature))
+        if candidate is not None and (match is None or candidate[0] < match[0]):
+            match = candidate
+    return match[1] if match else None
+
+
+def create_loop_over_key(row: Row, loop_over: List[str]) -> Tuple[str, ...]:
+    values = []
+    for entity in loop_over:
+        value = row[entity] if entity in row else 'NA'
+        values.append('NA' if value is None or value == '' else value)
+    return tuple(values)
+
+
+def get_trailing_number(value: str) -> int:
+    match = TRAILING_NUMBER.search(value)
+    return int(match.group(1)) if match else 0
+
+
+# ---------------------------------------------------------------------------
+# Routing (modules/grouping/config_matcher.nf)
+# ---------------------------------------------------------------------------
+
+def compile_config_matcher(config: Dict[str, Any]) -> Dict[str, Dict[str, List[Dict[str, Any]]]]:
+    matcher: Dict[str, Dict[str, List[Dict[str, Any]]]] = {}
+    for config_key, config_value in config.items():
+        if not isinstance(config_value, dict):
+            continue
+        target_suffix = config_value.get('suffix_maps_to', config_key)
+        for set_type in SET_TYPES:
+            if set_type not in config_value:
+                continue
+            required_entities: List[str] = []
+            grouping_index: List = []
+            if set_type == 'sequential_set':
+                seq_config = config_value['sequential_set']
+                required_entities = seq_config['by_entities'] if 'by_entities' in seq_config else [seq_config['by_entity']]
+            elif set_type == 'named_set':
+                grouping_index = build_grouping_index(compile_groupings(config_value['named_set']))
+            elif set_type == 'mixed_set':
+                grouping_index = build_grouping_index(compile_groupings(config_value['mixed_set']['named_groups']))
+            candidates = matcher.setdefault(target_suffix, {name: [] for name in SET_TYPES})
+            candidates[set_type].append({
+                'configKey': config_key,
+                'configValue': config_value,
+                'requiredEntities': required_entities,
+                'groupingIndex': grouping_index,
+            })
+    return matcher
+
+
+def route_row(row: Row, matcher) -> List[Tuple[str, str, Optional[str]]]:
+    """Every [setType, configKey, groupName] that receives the row."""
+    routes = []
+    candidates_by_set_type = matcher.get(row.get('suffix'))
+    if candidates_by_set_type is None:
+        return routes
+    for set_type, candidates in candidates_by_set_type.items():
+        candidate = next((entry for entry in candidates
+                          if all(row.get(entity) and row.get(entity) != 'NA' for entity in entry['requiredEntities'])), None)
+        if candidate is None:
+            continue
+        group_name = None
+        if set_type in ('named_set', 'mixed_set'):
+            group_name = find_matching_grouping(row, candidate['groupingIndex'])
+            if not group_name:
+                continue
+            if set_type == 'mixed_set' and not row.get(candidate['configValue']['mixed_set']['sequential_dimension']):
+                continue
+        routes.append((set_type, candidate['configKey'], group_name))
+    return routes
+
+
+# ---------------------------------------------------------------------------
+# Channel data (modules/grouping/entity_grouping_utils.nf, plain_set_utils.nf)
+# ---------------------------------------------------------------------------
+
+def create_file_map_with_data_type(ext_files: Iterable[Tuple[str, str, str]]) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+    file_map: Dict[str, Any] = {}
+    data_type_map: Dict[str, Any] = {}
+    for extension, file_path, data_type in ext_files:
+        if extension in file_map:
+            if not isinstance(file_map[extension], list):
+                file_map[extension] = [file_map[extension]]
+                data_type_map[extension] = [data_type_map[extension]]
+            file_map[extension].append(file_path)
+            data_type_map[extension].append(data_type)
+        else:
+            file_map[extension] = file_path
+            data_type_map[extension] = data_type
+    return file_map, data_type_map
+
+
+def extract_additional_files(file_map: Dict[str, Any], suffix_config: Dict[str, Any]) -> Dict[str, Any]:
+    additional_files = {}
+    extension_lists = [suffix_config.get('additional_extensions')]
+    for set_type in ('plain_set', 'mixed_set', 'sequential_set'):
+        set_config = suffix_config.get(set_type)
+        if isinstance(set_config, dict):
+            extension_lists.append(set_config.get('additional_extensions'))
+    for extensions in extension_lists:
+        for extension in extensions or []:
+            if extension in file_map:
+                additional_files[extension] = file_map[extension]
+    return additional_files
+
+
+def get_group_by_modality(suffix_config: Dict[str, Any], set_types: Tuple[str, ...]) -> bool:
+    if 'group_by_modality' in suffix_config:
+        return bool(suffix_config['group_by_modality'])
+    for set_type in set_types:
+        set_config = suffix_config.get(set_type)
+        if isinstance(set_config, dict) and 'group_by_modality' in set_config:
+            return bool(set_config['group_by_modality'])
+    return False
+
+
+def build_channel_data(file_map: Dict[str, Any], suffix_config: Dict[str, Any], data_type_map: Dict[str, Any]) -> Dict[str, Any]:
+    if get_group_by_modality(suffix_config, ('plain_set', 'named_set')) and data_type_map:
+        def by_modality(files, data_types, target):
+            if isinstance(files, list):
+                for index, file_path in enumerate(files):
+                    modality = data_types[index] if isinstance(data_types, list) and index < len(data_types) else 'unknown'
+                    target[modality] = file_path
+            else:
+                target[data_types or 'unknown'] = files
+
+        modality_groups: Dict[str, Dict[str, Any]] = {}
+        for extension in ('nii.gz', 'nii'):
+            if extension in file_map:
+                by_modality(file_map[extension], data_type_map.get(extension), modality_groups.setdefault('nii', {}))
+        if 'json' in file_map:
+            by_modality(file_map['json'], data_type_map.get('json'), modality_groups.setdefault('json', {}))
+        for extension, files in extract_additional_files(file_map, suffix_config).items():
+            target = modality_groups.setdefault(extension, {})
+            if isinstance(files, list) and isinstance(data_type_map.get(extension), list):
+                by_modality(files, data_type_map[extension], target)
+            else:
+                target[data_type_map.get(extension) or 'unknown'] = files
+        return modality_groups
+
+    # Flat structure: with several files per extension the last one is kept
+    channel_data: Dict[str, Any] = {}
+    nii_file = file_map['nii.gz'] if 'nii.gz' in file_map else file_map.get('nii')
+    if nii_file:
+        channel_data['nii'] = nii_file[-1] if isinstance(nii_file, list) else nii_file
+    if 'json' in file_map:
+        json_file = file_map['json']
+        channel_data['json'] = json_file[-1] if isinstance(json_file, list) else json_file
+    for extension, files in extract_additional_files(file_map, suffix_config).items():
+        channel_data[extension] = files[-1] if isinstance(files, list) else files
+    return channel_data
+
+
+def build_sequential_channel_data(nii_files: List[Any], json_files: List[Any]) -> Dict[str, Any]:
+    channel_data = {}
+    if nii_files:
+        channel_data['nii'] = nii_files
+    if json_files:
+        channel_data['json'] = json_files
+    return channel_data
+
+
+def has_valid_files(file_map: Dict[str, Any], additional_extensions: List[str]) -> bool:
+    has_nii = 'nii' in file_map or 'nii.gz' in file_map
+    return has_nii or 'json' in file_map or any(extension in file_map for extension in additional_extensions)
+
+
+def validate_required_files_with_config(file_map, entity_map, suffix, group_name, suffix_config) -> bool:
+    additional_extensions = suffix_config.get('additional_extensions') or []
+    if not has_valid_files(file_map, additional_extensions):
+        warn(f"Subject {entity_map.get('subject') or 'NA'}, Session {entity_map.get('session') or 'NA'}, "
+             f"Run {entity_map.get('run') or 'NA'}, Suffix {suffix}, grouping {group_name}: No valid files found. "
+             f"Available: {list(file_map)}, Expected: nii/nii.gz, json, or {additional_extensions}")
+        return False
+    return True
+
+
+def validate_plain_set_files(file_map, entity_map, suffix, suffix_config) -> bool:
+    plain_set_config = suffix_config.get('plain_set') or {}
+    required_extensions = plain_set_config.get('required_extensions', [])
+    additional_extensions = plain_set_config.get('additional_extensions', [])
+    description = (f"Subject {entity_map.get('subject') or 'NA'}, Session {entity_map.get('session') or 'NA'}, "
+                   f"Run {entity_map.get('run') or 'NA'}, Suffix {suffix}")
+    if not has_valid_files(file_map, additional_extensions):
+        warn(f"{description}: No valid files found. Available: {list(file_map)}")
+        return False
+    missing_required = [extension for extension in required_extensions if extension not in file_map]
+    if missing_required:
+        warn(f"{description}: Missing required extensions: {missing_required}. Available: {list(file_map)}")
+        return False
+    return True
+
+
+def collect_parts(ext_part_files: Iterable[Tuple[str, str, str]]) -> Dict[str, str]:
+    """Files keyed by extension, or by <extension>_<part> for rows with a part."""
+    files_by_ext_and_part = {}
+    for extension, file_path, part_value in ext_part_files:
+        key = f"{extension}_{part_value}" if part_value and part_value != 'NA' else extension
+        files_by_ext_and_part[key] = file_path
+    return files_by_ext_and_part
+
+
+def find_part_files(files_by_ext_and_part: Dict[str, str], parts_config: List[str], key_prefix: str) -> Dict[str, str]:
+    part_files = {}
+    for part_value in parts_config:
+        nii_key = next((key for key in files_by_ext_and_part
+                        if key in (f"nii_{key_prefix}{part_value}", f"nii.gz_{key_prefix}{part_value}")), None)
+        if nii_key:
+            part_files[part_value] = files_by_ext_and_part[nii_key]
+    return part_files
+
+
+# ---------------------------------------------------------------------------
+# Set types (subworkflows/emit_*_sets.nf)
+# ---------------------------------------------------------------------------
+
+def entity_map_for(loop_key: Tuple[str, ...], loop_over: List[str]) -> Dict[str, str]:
+    return {entity: loop_key[index] or 'NA' for index, entity in enumerate(loop_over)}
+
+
+def group_routes(routes, key_function) -> Dict[Any, List[Tuple]]:
+    groups: Dict[Any, List[Tuple]] = {}
+    for route in routes:
+        groups.setdefault(key_function(route), []).append(route)
+    return groups
+
+
+def emit_plain_sets(routes, config, loop_over) -> Dict[Tuple[str, ...], Dict[str, Any]]:
+    results: Dict[Tuple[str, ...], Dict[str, Any]] = {}
+    for (loop_key, config_key), rows in group_routes(routes, lambda route: (route[0], route[1])).items():
+        suffix_config = config[config_key]
+        entity_map = entity_map_for(loop_key, loop_over)
+        plain_set = suffix_config.get('plain_set') or {}
+        data = results.setdefault(loop_key, {})
+        if 'parts' in plain_set:
+            files_by_ext_and_part = collect_parts(
+                (row['extension'], row['path'], row.get('part') or 'NA') for _, _, _, row in rows)
+            regular_file_map = {key: path for key, path in files_by_ext_and_part.items() if '_' not in key}
+            if not validate_plain_set_files(regular_file_map, entity_map, config_key, suffix_config):
+                continue
+            all_files = {}
+            if files_by_ext_and_part.get('json'):
+                all_files['json'] = files_by_ext_and_part['json']
+            part_files = find_part_files(files_by_ext_and_part, plain_set['parts'], '')
+            if len(part_files) == len(plain_set['parts']):
+                all_files['nii'] = part_files
+            else:
+                regular_nii = [path for key, path in files_by_ext_and_part.items() if key in ('nii', 'nii.gz')]
+                if not regular_nii:
+                    continue
+                all_files['nii'] = regular_nii[0]
+            data[config_key] = all_files
+        else:
+            file_map, data_type_map = create_file_map_with_data_type(
+                (row['extension'], row['path'], row.get('data_type') or 'NA') for _, _, _, row in rows)
+            if validate_plain_set_files(file_map, entity_map, config_key, suffix_config):
+                data[config_key] = build_channel_data(file_map, suffix_config, data_type_map)
+    return results
+
+
+def emit_named_sets(routes, config, loop_over) -> Dict[Tuple[str, ...], Dict[str, Any]]:
+    grouping_maps: Dict[Tuple[str, ...], Dict[str, Dict[str, Any]]] = {}
+    for (loop_key, config_key, group_name), rows in group_routes(routes, lambda route: route[:3]).items():
+        suffix_config = config[config_key]
+        file_map, data_type_map = create_file_map_with_data_type(
+            (row['extension'], row['path'], row.get('data_type') or 'NA') for _, _, _, row in rows)
+        suffix_maps = grouping_maps.setdefault(loop_key, {})
+        if validate_required_files_with_config(file_map, entity_map_for(loop_key, loop_over), config_key, group_name, suffix_config):
+            suffix_maps.setdefault(config_key, {})[group_name] = build_channel_data(file_map, suffix_config, data_type_map)
+
+    results = {}
+    for loop_key, suffix_maps in grouping_maps.items():
+        valid_maps = {}
+        for config_key, grouping_map in suffix_maps.items():
+            required = config[config_key].get('required', [])
+            if all(group in grouping_map for group in required):
+                valid_maps[config_key] = grouping_map
+            else:
+                warn(f"Entities {entity_map_for(loop_key, loop_over)}, Suffix {config_key}: Missing required groupings. "
+                     f"Available: {list(grouping_map)}, Required: {required}")
+        results[loop_key] = valid_maps
+    return results
+
+
+def build_sequential_index(entity_files: List[Tuple]) -> Dict[str, Any]:
+    """Cells of one sequential set sorted by the rank of their entity values
+    (modules/grouping/sequential_set_utils.nf)."""
+    entity_keys = None
+    parts_config = None
+    value_orders: List[Dict[str, int]] = []
+    cells: Dict[Tuple[str, ...], Dict[str, Any]] = {}
+    for keys, sequential_values, extension, file_path, part_value, parts in entity_files:
+        if entity_keys is None:
+            entity_keys = keys
+            value_orders = [{} for _ in keys]
+        if parts and not parts_config:
+            parts_config = parts
+        for dimension, value in enumerate(sequential_values):
+            value_orders[dimension].setdefault(value, len(value_orders[dimension]))
+        ext_map = cells.setdefault(tuple(sequential_values), {})
+        if parts_config and part_value and part_value != 'NA':
+            ext_map[f"{extension}_{part_value}"] = file_path
+        else:
+            ext_map.setdefault(extension, []).append(file_path)
+
+    ranks = []
+    for first_seen in value_orders:
+        sorted_values = sorted(first_seen, key=lambda value: (get_trailing_number(value), first_seen[value]))
+        ranks.append({value: rank for rank, value in enumerate(sorted_values)})
+    sorted_cells = sorted(
+        ([ranks[dimension][value] for dimension, value in enumerate(values)], ext_map) for values, ext_map in cells.items())
+    return {'entityKeys': entity_keys or [], 'partsConfig': parts_config, 'cells': sorted_cells}
+
+
+def resolve_sequential_cell(ext_map: Dict[str, Any], parts_config) -> Optional[Tuple[Any, Any]]:
+    json_file = None
+    json_list = ext_map.get('json')
+    if json_list:
+        json_file = json_list[0] if isinstance(json_list, list) else json_list
+    else:
+        json_key = next((key for key in ext_map if key.startswith('json_')), None)
+        if json_key:
+            json_file = ext_map[json_key]
+    if not json_file:
+        return None
+    if parts_config:
+        part_files = find_part_files(ext_map, parts_config, 'part-')
+        if len(part_files) == len(parts_config):
+            return part_files, json_file
+    nii_files = (ext_map.get('nii') or []) + (ext_map.get('nii.gz') or [])
+    return (nii_files[0], json_file) if nii_files else None
+
+
+def collect_sequential_nested(index: Dict[str, Any], start: int, end: int, dimension: int) -> Tuple[List, List]:
+    cells = index['cells']
+    nii_group, json_group = [], []
+    if dimension == len(index['entityKeys']) - 1:
+        for _, ext_map in cells[start:end]:
+            pair = resolve_sequential_cell(ext_map, index['partsConfig'])
+            if pair:
+                nii_group.append(pair[0])
+                json_group.append(pair[1])
+        return nii_group, json_group
+    position = start
+    while position < end:
+        rank = cells[position][0][dimension]
+        child_end = position
+        while child_end < end and cells[child_end][0][dimension] == rank:
+            child_end += 1
+        child_nii, child_json = collect_sequential_nested(index, position, child_end, dimension + 1)
+        nii_group.append(child_nii)
+        json_group.append(child_json)
+        position = child_end
+    return nii_group, json_group
+
+
+def emit_sequential_sets(routes, config, loop_over) -> Dict[Tuple[str, ...], Dict[str, Any]]:
+    results: Dict[Tuple[str, ...], Dict[str, Any]] = {}
+    for (loop_key, config_key), rows in group_routes(routes, lambda route: (route[0], route[1])).items():
+        seq_config = config[config_key]['sequential_set']
+        entity_keys = seq_config['by_entities'] if 'by_entities' in seq_config else [seq_config['by_entity']]
+        order_type = seq_config.get('order', 'hierarchical')
+        parts_config = seq_config.get('parts')
+        entity_files = [
+            (entity_keys, [row[entity] for entity in entity_keys], row['extension'], row['path'],
+             (row.get('part') or 'NA') if parts_config is not None else 'NA', parts_config)
+            for _, _, _, row in rows
+        ]
+        index = build_sequential_index(entity_files)
+        if len(index['entityKeys']) == 1 or order_type == 'flat':
+            pairs = [resolve_sequential_cell(ext_map, index['partsConfig']) for _, ext_map in index['cells']]
+            nii_files = [pair[0] for pair in pairs if pair]
+            json_files = [pair[1] for pair in pairs if pair]
+        else:
+            nii_files, json_files = collect_sequential_nested(index, 0, len(index['cells']), 0)
+        data = results.setdefault(loop_key, {})
+        if nii_files:
+            data[config_key] = {'nii': nii_files, 'json': json_files}
+        else:
+            warn(f"Entities {entity_map_for(loop_key, loop_over)}, Suffix {config_key}: No valid file pairs found")
+    return results
+
+
+def emit_mixed_sets(routes, config, loop_over) -> Dict[Tuple[str, ...], Dict[str, Any]]:
+    suffix_groups: Dict[Tuple[str, ...], Dict[str, Dict[str, List]]] = {}
+
+    def stage_key(route):
+        loop_key, config_key, group_name, row = route
+        return loop_key, config_key, group_name, row[config[config_key]['mixed_set']['sequential_dimension']]
+
+    for (loop_key, config_key, group_name, sequential_value), rows in group_routes(routes, stage_key).items():
+        suffix_config = config[config_key]
+        mixed_config = suffix_config['mixed_set']
+        groups = suffix_groups.setdefault(loop_key, {})
+        entity_map = entity_map_for(loop_key, loop_over)
+        if 'parts' in mixed_config:
+            files_by_ext_and_part = collect_parts(
+                (row['extension'], row['path'], row.get('part') or 'NA') for _, _, _, row in rows)
+            regular_file_map = {key: path for key, path in files_by_ext_and_part.items() if '_' not in key}
+            if not validate_required_files_with_config(regular_file_map, entity_map, config_key,
+                                                       f"{group_name}_{sequential_value}", suffix_config):
+                continue
+            json_file = files_by_ext_and_part.get('json')
+            part_files = find_part_files(files_by_ext_and_part, mixed_config['parts'], '')
+            if len(part_files) == len(mixed_config['parts']):
+                nii_data = part_files
+            else:
+                regular_nii = [path for key, path in files_by_ext_and_part.items() if key in ('nii', 'nii.gz')]
+                if not regular_nii:
+                    continue
+                nii_data = regular_nii[0]
+        else:
+            file_map = {row['extension']: row['path'] for _, _, _, row in rows}
+            if not validate_required_files_with_config(file_map, entity_map, config_key,
+                                                       f"{group_name}_{sequential_value}", suffix_config):
+                continue
+            nii_data = file_map['nii.gz'] if 'nii.gz' in file_map else file_map.get('nii')
+            json_file = file_map.get('json')
+        groups.setdefault(config_key, {}).setdefault(group_name, []).append((sequential_value, nii_data, json_file))
+
+    results = {}
+    for loop_key, groups in suffix_groups.items():
+        grouping_maps = {}
+        for config_key, named_groups in groups.items():
+            grouping_maps[config_key] = {}
+            for group_name, sequential_files in named_groups.items():
+                sorted_files = sorted(sequential_files, key=lambda entry: get_trailing_number(entry[0]))
+                grouping_maps[config_key][group_name] = build_sequential_channel_data(
+                    [entry[1] for entry in sorted_files], [entry[2] for entry in sorted_files])
+
+        complete = True
+        for config_key, grouping_map in grouping_maps.items():
+            mixed_config = config[config_key]['mixed_set']
+            required = mixed_config['required'] if 'required' in mixed_config else list(mixed_config['named_groups'])
+            if not all(group in grouping_map for group in required):
+                warn(f"Entities {entity_map_for(loop_key, loop_over)}, Suffix {config_key}: Missing required named groups. "
+                     f"Available: {list(grouping_map)}, Required: {required}")
+                complete = False
+                break
+        results[loop_key] = grouping_maps if complete else {}
+    return results
+
+
+# ---------------------------------------------------------------------------
+# Merging and cross-modal broadcasting (main.nf, modules/grouping/cross_modal_utils.nf)
+# ---------------------------------------------------------------------------
+
+def build_cross_modal_index(config: Dict[str, Any]) -> Tuple[Dict[str, List[str]], Dict[str, set]]:
+    requests: Dict[str, List[str]] = {}
+    requested_by: Dict[str, set] = {}
+    for suffix, suffix_config in config.items():
+        if not isinstance(suffix_config, dict):
+            continue
+        set_config = (suffix_config.get('plain_set') or suffix_config.get('named_set') or
+                      suffix_config.get('sequential_set') or suffix_config.get('mixed_set'))
+        if not set_config or not set_config.get('include_cross_modal'):
+            continue
+        requests[suffix] = set_config['include_cross_modal']
+        for requested_suffix in set_config['include_cross_modal']:
+            if requested_suffix != suffix:
+                requested_by.setdefault(requested_suffix, set()).add(suffix)
+    return requests, requested_by
+
+
+def broadcast_cross_modal(entries, cross_modal_index, loop_over) -> List[Tuple[Tuple[str, ...], Dict[str, Any]]]:
+    """Share task="NA" data with the task-specific loop keys of one non-task key."""
+    requests, requested_by = cross_modal_index
+    task_index = loop_over.index('task') if 'task' in loop_over else None
+    get_task = (lambda key: key[task_index] or 'NA') if task_index is not None else (lambda key: None)
+
+    cross_modal_data = {}
+    for loop_key, data in entries:
+        if get_task(loop_key) == 'NA':
+            cross_modal_data.update(data)
+
+    results = []
+    for loop_key, data in entries:
+        task = get_task(loop_key)
+        if task != 'NA':
+            requested_data = {}
+            for suffix in data:
+                for requested_suffix in requests.get(suffix, []):
+                    if requested_suffix in cross_modal_data:
+                        requested_data[requested_suffix] = cross_modal_data[requested_suffix]
+            if requested_data:
+                data = {**data, **requested_data}
+            results.append((loop_key, data))
+        elif any(suffix not in requested_by for suffix in data):
+            results.append((loop_key, data))
+    return results
+
+
+def group_batch(rows: List[Row], config: Dict[str, Any], loop_over: List[str]) -> List[Tuple[Tuple[str, ...], Dict[str, Any]]]:
+    """Final [loopKey, data] results of one batch of rows, before dropping empty ones."""
+    matcher = compile_config_matcher(config)
+    routes_by_set_type: Dict[str, List[Tuple]] = {set_type: [] for set_type in SET_TYPES}
+    for row in rows:
+        loop_key = create_loop_over_key(row, loop_over)
+        for set_type, config_key, group_name in route_row(row, matcher):
+            routes_by_set_type[set_type].append((loop_key, config_key, group_name, row))
+
+    merged: Dict[Tuple[str, ...], Dict[str, Any]] = {}
+    for set_type, emit in (('named_set', emit_named_sets), ('sequential_set', emit_sequential_sets),
+                           ('mixed_set', emit_mixed_sets), ('plain_set', emit_plain_sets)):
+        for loop_key, data in emit(routes_by_set_type[set_type], config, loop_over).items():
+            merged.setdefault(loop_key, {}).update(data)
+
+    non_task_positions = [index for index, entity in enumerate(loop_over) if entity != 'task']
+    by_non_task_key: Dict[Tuple[str, ...], List] = {}
+    for loop_key, data in merged.items():
+        non_task_key = tuple(loop_key[index] or 'NA' for index in non_task_positions)
+        by_non_task_key.setdefault(non_task_key, []).append((loop_key, data))
+
+    cross_modal_index = build_cross_modal_index(config)
+    results = []
+    for entries in by_non_task_key.values():
+        results.extend(broadcast_cross_modal(entries, cross_modal_index, loop_over))
+    return results
+
+
+# ---------------------------------------------------------------------------
+# Output (modules/utils/json_utils.nf)
+# ---------------------------------------------------------------------------
+
+def pretty_json(value: Any, indent: str = '') -> str:
+    """Same layout as Groovy's JsonBuilder.toPrettyString()."""
+    child_indent = indent + '    '
+    if isinstance(value, dict):
+        items = [f"{json.dumps(str(key))}: {pretty_json(item, child_indent)}" for key, item in value.items()]
+    elif isinstance(value, (list, tuple)):
+        items = [pretty_json(item, child_indent) for item in value]
+    else:
+        return json.dumps(value)
+    open_bracket, close_bracket = ('{', '}') if isinstance(value, dict) else ('[', ']')
+    return f"{open_bracket}\n{child_indent}" + f",\n{child_indent}".join(items) + f"\n{indent}{close_bracket}"
+
+
+def render_unified_json(loop_key, data, loop_over, bids_parent_dir: Optional[str]) -> Tuple[str, str]:
+    """Name and content of the JSON file written for one loop key."""
+    entity_values = {entity: loop_key[index] or 'NA' for index, entity in enumerate(loop_over)}
+    present = [entity for entity in UNIFIED_ENTITIES if entity in entity_values]
+    values = [entity_values[entity] or 'null' for entity in present]
+    entity_json = ',\n  '.join(f'"{entity}": "{value}"' for entity, value in zip(present, values))
+    parent_json = f',\n  "bidsParentDir": "{bids_parent_dir}"' if bids_parent_dir is not None else ''
+    content = f'{{\n  {entity_json}{parent_json},\n  "data": {pretty_json(data)}\n}}\n'
+    return '_'.join(values) + '_unified.json', content
+
+
+# ---------------------------------------------------------------------------
+# Batching and driver
+# ---------------------------------------------------------------------------
+
+def get_batch_key(subject: Optional[str]) -> str:
+    """Batch of a row: its subject, with missing and empty subjects batched as 'NA'."""
+    return subject or 'NA'
+
+
+def read_rows(csv_files: List[Path]) -> Iterable[Tuple[str, List[Row]]]:
+    """Rows of the parsed CSVs in file order, batched per subject like route_parsed_rows."""
+    try:
+        import pandas as pd
+    except ImportError:
+        pd = None
+
+    if pd is not None:
+        frames = [pd.read_csv(csv_file, dtype=str, keep_default_na=False, na_filter=False, skip_blank_lines=True)
+                  for csv_file in csv_files]
+        frame = pd.concat(frames, ignore_index=True, sort=False) if frames else pd.DataFrame()
+        # Columns missing from some CSVs read as None, like unknown columns of a compact row
+        frame = frame.astype(object).where(frame.notna(), None)
+        if 'subject' not in frame.columns:
+            yield 'dataset', frame.to_dict('records')
+            return
+        for subject, batch in frame.groupby(frame['subject'].map(get_batch_key), sort=False):
+            yield subject, batch.to_dict('records')
+        return
+
+    batches: Dict[str, List[Row]] = {}
+    for csv_file in csv_files:
+        with open(csv_file, newline='') as f:
+            for row in csv.DictReader(f):
+                if any(row.values()):
+                    batches.setdefault(get_batch_key(row.get('subject')), []).append(row)
+    yield from batches.items()
+
+
+def process_batch(task) -> List[Tuple[str, str]]:
+    rows, config, loop_over, bids_parent_dir = task
+    return [
+        render_unified_json(loop_key, data, loop_over, bids_parent_dir)
+        for loop_key, data in group_batch(rows, config, loop_over)
+        if data
+    ]
+
+
+def run_dry_run(csv_files: List[Path], config: Dict[str, Any], output_dir: Path,
+                bids_parent_dir: Optional[str] = None, workers: Optional[int] = None) -> int:
+    """Write the unified JSON files of a dataset and return how many were written."""
+    loop_over = config.get('loop_over', DEFAULT_LOOP_OVER)
+    if 'subject' in loop_over:
+        batches = [rows for _, rows in read_rows(csv_files)]
+    else:
+        # Without subject in loop_over a loop key can span subjects, so all rows form one batch
+        batches = [[row for _, rows in read_rows(csv_files) for row in rows]]
+
+    tasks = [(rows, config, loop_over, bids_parent_dir) for rows in batches]
+    output_dir.mkdir(parents=True, exist_ok=True)
+
+    def write_results(results) -> int:
+        written = 0
+        for rendered in results:
+            for filename, content in rendered:
+                (output_dir / filename).write_text(content)
+                written += 1
+        return written
+
+    if workers == 1 or len(tasks) <= 1:
+        return write_results(map(process_batch, tasks))
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        chunk_size = max(1, len(tasks) // ((workers or os.cpu_count() or 1) * 4))
+        return write_results(executor.map(process_batch, tasks, chunksize=chunk_size))
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description='Dry-run the bids2nf grouping engine on parsed libBIDS.sh CSVs.')
+    parser.add_argument('parsed_csv', nargs='+', type=Path, help='parsed.csv, or the per-unit CSVs of a sharded parse')
+    parser.add_argument('--config', type=Path, default=Path(__file__).resolve().parents[1] / 'bids2nf.yaml',
+                        help='bids2nf.yaml to group with')
+    parser.add_argument('--output-dir', type=Path, required=True, help='Directory the *_unified.json files are written to')
+    parser.add_argument('--bids-parent-dir', help='Include this bidsParentDir in every output, as --includeBidsParentDir does')
+    parser.add_argument('--workers', type=int, default=None, help='Worker processes (default: number of CPUs, 1 to disable)')
+    args = parser.parse_args()
+
+    for csv_file in args.parsed_csv:
+        if not csv_file.exists():
+            print(f"Error: {csv_file} not found")
+            return 1
+    with open(args.config, 'r') as f:
+        config = yaml.safe_load(f)
+
+    start = time.perf_counter()
+    written = run_dry_run(args.parsed_csv, config, args.output_dir, args.bids_parent_dir, args.workers)
+    if written == 0:
+        print("Error: No data groups were processed!")
+        return 1
+    print(f"Wrote {written} unified JSON files to {args.output_dir} in {time.perf_counter() - start:.2f} s")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
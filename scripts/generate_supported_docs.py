@@ -5,8 +5,11 @@ Generate supported.md documentation from bids2nf.yaml configuration.
 
 import yaml
 import argparse
-import requests
+import hashlib
 import json
+import os
+import pickle
+from functools import lru_cache
 from pathlib import Path
 from typing import Dict, List, Tuple, Any, Optional
 
@@ -300,16 +303,65 @@ def generate_mixed_set_mermaid(name: str, config_data: Dict[str, Any]) -> List[s
     return lines
 
 
-def fetch_bids_suffixes() -> Dict[str, Any]:
-    """Fetch suffix information from BIDS specification."""
-    url = "https://raw.githubusercontent.com/bids-standard/bids-specification/refs/heads/master/src/schema/objects/suffixes.yaml"
+# BIDS specification release the suffix descriptions are taken from
+BIDS_SCHEMA_VERSION = "v1.10.0"
+BIDS_SUFFIXES_URL = "https://raw.githubusercontent.com/bids-standard/bids-specification/{version}/src/schema/objects/suffixes.yaml"
+# Fetched schemas are kept per version; commit a version directory to vendor it for offline builds
+DEFAULT_SCHEMA_CACHE_DIR = Path(__file__).resolve().parent / "bids_schema"
+DEFAULT_CARD_CACHE_FILE = Path(__file__).resolve().parent / ".supported_cards_cache.json"
+
+
+def fetch_bids_suffixes(version: str) -> str:
+    """Fetch suffixes.yaml of a BIDS specification release."""
+    import requests  # only needed when the schema is not cached yet
+
+    response = requests.get(BIDS_SUFFIXES_URL.format(version=version), timeout=10)
+    response.raise_for_status()
+    return response.text
+
+
+def load_bids_suffixes(version: str = BIDS_SCHEMA_VERSION, cache_dir: Path = DEFAULT_SCHEMA_CACHE_DIR,
+                       offline: bool = False) -> Dict[str, Any]:
+    """Load suffix information from the BIDS specification, fetching it at most once per version.
+
+    The YAML is cached in <cache_dir>/<version>/, next to a pickle of the parsed schema that is
+    loaded instead of the YAML while it is up to date.
+    """
+    version_dir = Path(cache_dir) / version
+    yaml_path = version_dir / "suffixes.yaml"
+    pickle_path = version_dir / "suffixes.pickle"
+
+    if yaml_path.exists() and pickle_path.exists() and pickle_path.stat().st_mtime >= yaml_path.stat().st_mtime:
+        try:
+            with open(pickle_path, 'rb') as f:
+                return pickle.load(f)
+        except (OSError, EOFError, pickle.UnpicklingError):
+            pass
+
+    if not yaml_path.exists():
+        if offline:
+            print(f"Warning: BIDS suffixes schema {version} is not cached in {version_dir} and --offline is set")
+            return {}
+        try:
+            schema_text = fetch_bids_suffixes(version)
+        except Exception as e:
+            print(f"Warning: Could not fetch BIDS suffixes schema: {e}")
+            return {}
+        version_dir.mkdir(parents=True, exist_ok=True)
+        yaml_path.write_text(schema_text)
+
+    with open(yaml_path, 'r') as f:
+        bids_suffixes = yaml.load(f, Loader=getattr(yaml, 'CSafeLoader', yaml.SafeLoader)) or {}
+
     try:
-        response = requests.get(url, timeout=10)
-        response.raise_for_status()
-        return yaml.safe_load(response.text)
-    except Exception as e:
-        print(f"Warning: Could not fetch BIDS suffixes schema: {e}")
-        return {}
+        temp_path = pickle_path.with_suffix(f".{os.getpid()}.tmp")
+        with open(temp_path, 'wb') as f:
+            pickle.dump(bids_suffixes, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(temp_path, pickle_path)
+    except OSError as e:
+        print(f"Warning: Could not cache parsed BIDS suffixes schema: {e}")
+
+    return bids_suffixes
 
 
 def get_bids_info(name: str, bids_suffixes: Dict[str, Any]) -> Tuple[str, str]:
@@ -387,23 +439,28 @@ def get_heading_class(set_type: str) -> str:
     return heading_classes.get(set_type, 'custom-heading')
 
 
-def load_example_data(config_data: Dict[str, Any], name: str) -> Optional[Dict[str, Any]]:
-    """Load example data from JSON file if available."""
-    if 'example_output' not in config_data:
-        return None
-    
-    example_file = Path(config_data['example_output'])
+@lru_cache(maxsize=None)
+def read_example_file(example_output: str) -> Optional[Dict[str, Any]]:
+    """Parse an example output JSON once, as several suffixes often share the same file."""
+    example_file = Path(example_output)
     if not example_file.exists():
         return None
     
     try:
         with open(example_file, 'r') as f:
-            example_data = json.load(f)
-        
-        if 'data' in example_data and name in example_data['data']:
-            return example_data['data'][name]
+            return json.load(f)
     except (json.JSONDecodeError, FileNotFoundError):
-        pass
+        return None
+
+
+def load_example_data(config_data: Dict[str, Any], name: str) -> Optional[Dict[str, Any]]:
+    """Load example data from JSON file if available."""
+    if 'example_output' not in config_data:
+        return None
+    
+    example_data = read_example_file(config_data['example_output'])
+    if example_data and 'data' in example_data and name in example_data['data']:
+        return example_data['data'][name]
     
     return None
 
@@ -653,15 +710,16 @@ def generate_mermaid_diagram(name: str, config_data: Dict[str, Any], set_type: s
         return []
 
 
+def has_example_output(config_data: Dict[str, Any]) -> bool:
+    """Whether the example output of a suffix exists in this checkout, and so on GitHub."""
+    return 'example_output' in config_data and Path(config_data['example_output']).is_file()
+
+
 def add_example_button(content: List[str], config_data: Dict[str, Any]) -> None:
     """Add example button if example output is available."""
-    if 'example_output' in config_data:
+    if has_example_output(config_data):
         tmp_url = f"https://github.com/agahkarakuzu/bids2nf/blob/main/{config_data['example_output']}"
-        try:
-            if requests.get(tmp_url).status_code == 200:
-                content.append(f"{{button}}`Example channel data structure <{tmp_url}>`")
-        except:
-            pass
+        content.append(f"{{button}}`Example channel data structure <{tmp_url}>`")
 
 
 def add_note(content: List[str], config_data: Dict[str, Any]) -> None:
@@ -834,14 +892,61 @@ def generate_suffix_card(name: str, config_data: Dict[str, Any], set_type: str,
     return content
 
 
-def generate_supported_docs(yaml_file: Path, output_file: Path) -> None:
-    """Generate supported.md from bids2nf.yaml configuration."""
+@lru_cache(maxsize=None)
+def get_generator_hash() -> str:
+    """Hash of this script, so that cached cards are re-rendered when rendering changes."""
+    return hashlib.sha256(Path(__file__).read_bytes()).hexdigest()
+
+
+def get_card_cache_key(name: str, config_data: Dict[str, Any], set_type: str, bids_suffixes: Dict[str, Any]) -> str:
+    """Hash of everything a suffix card is rendered from."""
+    digest = hashlib.sha256()
+    for part in (get_generator_hash(), name, set_type,
+                 json.dumps(config_data, sort_keys=True, default=str),
+                 json.dumps(get_bids_info(name, bids_suffixes)),
+                 json.dumps(load_example_data(config_data, name), sort_keys=True, default=str),
+                 str(has_example_output(config_data))):
+        digest.update(part.encode('utf-8'))
+        digest.update(b'\0')
+    return digest.hexdigest()
+
+
+def load_card_cache(cache_file: Path) -> Dict[str, List[str]]:
+    """Load rendered cards of a previous run, keyed by their cache key."""
+    try:
+        with open(cache_file, 'r') as f:
+            return json.load(f)
+    except (OSError, json.JSONDecodeError):
+        return {}
+
+
+def save_card_cache(cache_file: Path, cards: Dict[str, List[str]]) -> None:
+    """Store the cards of this run only, so entries of removed or changed suffixes are dropped."""
+    cache_file.parent.mkdir(parents=True, exist_ok=True)
+    temp_file = cache_file.with_suffix(f".{os.getpid()}.tmp")
+    with open(temp_file, 'w') as f:
+        json.dump(cards, f)
+    os.replace(temp_file, cache_file)
+
+
+def generate_supported_docs(yaml_file: Path, output_file: Path, bids_version: str = BIDS_SCHEMA_VERSION,
+                            schema_cache_dir: Path = DEFAULT_SCHEMA_CACHE_DIR, offline: bool = False,
+                            card_cache_file: Optional[Path] = None) -> None:
+    """Generate supported.md from bids2nf.yaml configuration.
+
+    With a card cache file, suffix cards whose configuration, example data and BIDS
+    information are unchanged since the previous run are reused instead of re-rendered.
+    """
     
     with open(yaml_file, 'r') as f:
         config = yaml.safe_load(f)
     
-    # Fetch BIDS suffixes information
-    bids_suffixes = fetch_bids_suffixes()
+    # Load BIDS suffixes information from the local schema cache
+    bids_suffixes = load_bids_suffixes(bids_version, schema_cache_dir, offline)
+    
+    cached_cards = load_card_cache(card_cache_file) if card_cache_file else {}
+    rendered_cards = {}
+    reused_count = 0
     
     content = []
     content.append("# Supported BIDS Suffixes")
@@ -889,7 +994,16 @@ def generate_supported_docs(yaml_file: Path, output_file: Path) -> None:
             content.append("")
             
             for name, config_data in sets_list:
-                card_content = generate_suffix_card(name, config_data, set_type, bids_suffixes)
+                if card_cache_file:
+                    cache_key = get_card_cache_key(name, config_data, set_type, bids_suffixes)
+                    card_content = cached_cards.get(cache_key)
+                    if card_content is None:
+                        card_content = generate_suffix_card(name, config_data, set_type, bids_suffixes)
+                    else:
+                        reused_count += 1
+                    rendered_cards[cache_key] = card_content
+                else:
+                    card_content = generate_suffix_card(name, config_data, set_type, bids_suffixes)
                 content.extend(card_content)
     
     # Add comprehensive mermaid legend at the bottom
@@ -935,6 +1049,10 @@ def generate_supported_docs(yaml_file: Path, output_file: Path) -> None:
     # Write to output file
     with open(output_file, 'w') as f:
         f.write('\n'.join(content))
+    
+    if card_cache_file:
+        save_card_cache(card_cache_file, rendered_cards)
+        print(f"Reused {reused_count} of {len(rendered_cards)} suffix cards from {card_cache_file}")
 
 
 def main() -> int:
@@ -943,6 +1061,16 @@ def main() -> int:
                        help='Path to bids2nf.yaml file')
     parser.add_argument('--output-file', type=Path, default='docs/supported.md',
                        help='Path to output supported.md file')
+    parser.add_argument('--bids-version', default=BIDS_SCHEMA_VERSION,
+                       help='BIDS specification release (git ref) to take suffix descriptions from')
+    parser.add_argument('--schema-cache-dir', type=Path, default=DEFAULT_SCHEMA_CACHE_DIR,
+                       help='Directory of cached BIDS schemas, one subdirectory per release')
+    parser.add_argument('--offline', action='store_true',
+                       help='Only use cached BIDS schemas, never fetch them')
+    parser.add_argument('--incremental', action='store_true',
+                       help='Only re-render suffix cards that changed since the previous incremental run')
+    parser.add_argument('--card-cache-file', type=Path, default=DEFAULT_CARD_CACHE_FILE,
+                       help='Rendered cards of previous incremental runs')
     
     args = parser.parse_args()
     
@@ -953,7 +1081,9 @@ def main() -> int:
     # Ensure output directory exists
     args.output_file.parent.mkdir(parents=True, exist_ok=True)
     
-    generate_supported_docs(args.yaml_file, args.output_file)
+    card_cache_file = args.card_cache_file if args.incremental else None
+    generate_supported_docs(args.yaml_file, args.output_file, args.bids_version, args.schema_cache_dir, args.offline,
+                            card_cache_file)
     print(f"Generated {args.output_file} from {args.yaml_file}")
     
     return 0
@@ -0,0 +1,254 @@
+#!/usr/bin/env python3
+"""
+Generate zero-byte synthetic BIDS datasets from bids2nf.yaml.
+
+Every configured suffix is expanded into the entity combinations its set type groups
+(one file set per named group, every by_entities / sequential_dimension value and part of
+sequential and mixed sets) for every subject, session, run and task, so the dataset matches
+what the grouping engine expects. Subjects are created in parallel worker processes.
+
+Usage:
+    python scripts/generate_synthetic_bids.py /tmp/synthetic --subjects 10000 --sessions 2
+    python scripts/generate_synthetic_bids.py /tmp/synthetic --spec tests/benchmarks/specs/large.yaml
+"""
+
+import argparse
+import itertools
+import json
+import os
+import shutil
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+import yaml
+
+# Order of entities in generated filenames, with their BIDS key
+ENTITY_PREFIXES = [
+    ("subject", "sub"),
+    ("session", "ses"),
+    ("task", "task"),
+    ("acquisition", "acq"),
+    ("ceagent", "ce"),
+    ("reconstruction", "rec"),
+    ("direction", "dir"),
+    ("run", "run"),
+    ("echo", "echo"),
+    ("flip", "flip"),
+    ("inversion", "inv"),
+    ("mtransfer", "mt"),
+    ("part", "part"),
+]
+ENTITY_KEYS = dict(ENTITY_PREFIXES)
+
+DATA_TYPES = {
+    "dwi": "dwi",
+    "sbref": "func",
+    "bold": "func",
+    "events": "func",
+    "epi": "fmap",
+    "TB1TFL": "fmap",
+    "TB1AFI": "fmap",
+    "TB1DAM": "fmap",
+    "TB1SRGE": "fmap",
+    "TB1EPI": "fmap",
+    "RB1COR": "fmap",
+    "asl": "perf",
+    "aslcontext": "perf",
+    "m0scan": "perf",
+    "eeg": "eeg",
+    "channels": "eeg",
+    "mrsref": "mrs",
+    "svs": "mrs",
+}
+TASK_SUFFIXES = {"bold", "events", "eeg", "channels", "mrsref", "svs"}
+# Suffixes that can be generated without an entry in bids2nf.yaml
+UNCONFIGURED_SUFFIXES = {"bold": {"plain_set": {}}, "events": {"plain_set": {"additional_extensions": ["tsv"]}}}
+
+SET_TYPES = ("named_set", "sequential_set", "mixed_set", "plain_set")
+
+
+def load_yaml(path: Path) -> Dict[str, Any]:
+    with open(path, "r") as f:
+        return yaml.safe_load(f)
+
+
+def get_set_config(entry: Dict[str, Any]) -> Tuple[str, Dict[str, Any]]:
+    """Return the set type and set configuration of a bids2nf.yaml entry."""
+    for set_type in SET_TYPES:
+        if set_type in entry:
+            return set_type, entry[set_type] or {}
+    raise ValueError(f"Configuration entry has no set type: {entry}")
+
+
+def get_configured_suffixes(config: Dict[str, Any]) -> List[str]:
+    """Keys of bids2nf.yaml that define a set type, in configuration order."""
+    return [key for key, entry in config.items()
+            if isinstance(entry, dict) and any(set_type in entry for set_type in SET_TYPES)]
+
+
+def entity_value(entity: str, index: int) -> str:
+    return f"{ENTITY_KEYS[entity]}-{index}"
+
+
+def iter_file_entities(entry: Dict[str, Any], sequential_length: int) -> Iterator[Dict[str, str]]:
+    """Yield the entity combinations a configuration entry groups, e.g. one per named group."""
+    set_type, set_config = get_set_config(entry)
+
+    if set_type == "plain_set":
+        yield {}
+    elif set_type == "named_set":
+        for group_name, group in set_config.items():
+            if isinstance(group, dict):
+                yield {entity: value for entity, value in group.items() if entity in ENTITY_KEYS}
+    elif set_type == "sequential_set":
+        entities = set_config.get("by_entities") or [set_config["by_entity"]]
+        parts = set_config.get("parts") or [None]
+        for indices in itertools.product(range(1, sequential_length + 1), repeat=len(entities)):
+            for part in parts:
+                combination = {entity: entity_value(entity, index) for entity, index in zip(entities, indices)}
+                if part:
+                    combination["part"] = f"part-{part}"
+                yield combination
+    elif set_type == "mixed_set":
+        sequential_dimension = set_config["sequential_dimension"]
+        parts = set_config.get("parts") or [None]
+        for group in set_config.get("named_groups", {}).values():
+            named = {entity: value for entity, value in group.items() if entity in ENTITY_KEYS}
+            for index in range(1, sequential_length + 1):
+                for part in parts:
+                    combination = {**named, sequential_dimension: entity_value(sequential_dimension, index)}
+                    if part:
+                        combination["part"] = f"part-{part}"
+                    yield combination
+
+
+def get_extensions(entry: Dict[str, Any]) -> List[str]:
+    _, set_config = get_set_config(entry)
+    additional = set_config.get("additional_extensions", entry.get("additional_extensions", []))
+    return ["nii.gz", "json"] + list(additional)
+
+
+def build_filename(entities: Dict[str, str], suffix: str, extension: str) -> str:
+    labels = [entities[entity] for entity, _ in ENTITY_PREFIXES if entity in entities]
+    return "_".join(labels + [suffix]) + "." + extension
+
+
+def build_templates(spec: Dict[str, Any], config: Dict[str, Any]) -> List[Tuple[str, str, List[Dict[str, str]], List[str]]]:
+    """Resolve every suffix once: target suffix, data type, entity combinations and extensions."""
+    sequential_length = spec.get("sequential_length", 3)
+    templates = []
+    for key in spec.get("suffixes") or get_configured_suffixes(config):
+        entry = config.get(key) or UNCONFIGURED_SUFFIXES.get(key)
+        if not isinstance(entry, dict):
+            raise ValueError(f"Suffix '{key}' is not configured in bids2nf.yaml")
+        suffix = entry.get("suffix_maps_to", key)
+        combinations = list(iter_file_entities(entry, sequential_length))
+        templates.append((suffix, DATA_TYPES.get(suffix, "anat"), combinations, get_extensions(entry)))
+    return templates
+
+
+def list_subject_files(subject: str, spec: Dict[str, Any], templates) -> Dict[str, List[str]]:
+    """Relative directory -> file names of one subject. Entries sharing a target suffix
+    (e.g. dwi and dwi_fullreverse) produce each file once."""
+    sessions = [None] if spec.get("sessions", 0) <= 1 else [f"ses-{i}" for i in range(1, spec["sessions"] + 1)]
+    runs = [None] if spec.get("runs", 1) <= 1 else [f"run-{i}" for i in range(1, spec["runs"] + 1)]
+    tasks = [f"task-{i}" for i in range(1, spec.get("tasks", 0) + 1)]
+
+    files: Dict[str, Dict[str, None]] = {}
+    for session in sessions:
+        session_dir = os.path.join(subject, session) if session else subject
+        for suffix, data_type, combinations, extensions in templates:
+            data_dir = os.path.join(session_dir, data_type)
+            dir_files = files.setdefault(data_dir, {})
+            suffix_tasks = tasks if suffix in TASK_SUFFIXES and tasks else [None]
+            for task, run, combination in itertools.product(suffix_tasks, runs, combinations):
+                entities = {"subject": subject, **combination}
+                for entity, value in (("session", session), ("task", task), ("run", run)):
+                    if value:
+                        entities[entity] = value
+                for extension in extensions:
+                    dir_files[build_filename(entities, suffix, extension)] = None
+    return {data_dir: list(names) for data_dir, names in files.items()}
+
+
+def create_subject(task: Tuple[str, str, Dict[str, Any], Any]) -> int:
+    """Create the zero-byte files of one subject and return how many were created."""
+    dataset_dir, subject, spec, templates = task
+    file_count = 0
+    for data_dir, names in list_subject_files(subject, spec, templates).items():
+        directory = os.path.join(dataset_dir, data_dir)
+        os.makedirs(directory, exist_ok=True)
+        for name in names:
+            os.close(os.open(os.path.join(directory, name), os.O_CREAT | os.O_WRONLY, 0o644))
+        file_count += len(names)
+    return file_count
+
+
+def generate_dataset(spec: Dict[str, Any], config: Dict[str, Any], dataset_dir: Path,
+                     workers: Optional[int] = None, force: bool = False) -> int:
+    """Create a zero-byte BIDS tree for the spec and return the number of files created.
+    An existing non-empty dataset_dir is only replaced with force."""
+    templates = build_templates(spec, config)
+
+    if dataset_dir.exists() and any(dataset_dir.iterdir()):
+        if not force:
+            raise ValueError(f"{dataset_dir} exists and is not empty, pass --force to replace it")
+        shutil.rmtree(dataset_dir)
+    dataset_dir.mkdir(parents=True, exist_ok=True)
+    (dataset_dir / "dataset_description.json").write_text(
+        json.dumps({"Name": spec.get("name", "synthetic"), "BIDSVersion": "1.9.0", "DatasetType": "raw"}, indent=2)
+    )
+
+    subjects = [f"sub-{index:05d}" for index in range(1, spec["subjects"] + 1)]
+    tasks = [(str(dataset_dir), subject, spec, templates) for subject in subjects]
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        chunk_size = max(1, len(tasks) // ((workers or os.cpu_count() or 1) * 4))
+        return sum(executor.map(create_subject, tasks, chunksize=chunk_size))
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Generate a zero-byte synthetic BIDS dataset from bids2nf.yaml.")
+    parser.add_argument("output", help="Directory of the generated dataset, must not exist or be empty unless --force is given.")
+    parser.add_argument("--config", default=str(Path(__file__).resolve().parents[1] / "bids2nf.yaml"),
+                        help="bids2nf.yaml to generate the dataset for.")
+    parser.add_argument("--spec", help="Benchmark spec YAML (see tests/benchmarks/run_benchmark.py); overrides the options below.")
+    parser.add_argument("--subjects", type=int, default=10, help="Number of subjects (default: 10).")
+    parser.add_argument("--sessions", type=int, default=1, help="Sessions per subject, 0 or 1 for no sessions (default: 1).")
+    parser.add_argument("--runs", type=int, default=1, help="Runs per file set, > 1 adds run-<n> (default: 1).")
+    parser.add_argument("--tasks", type=int, default=1, help="Tasks of task-based suffixes (default: 1).")
+    parser.add_argument("--sequential-length", type=int, default=3,
+                        help="Values per by_entities / sequential_dimension entity (default: 3).")
+    parser.add_argument("--suffixes", nargs="+", help="Configuration keys to generate (default: every configured suffix).")
+    parser.add_argument("--workers", type=int, default=None, help="Worker processes (default: number of CPUs).")
+    parser.add_argument("--force", action="store_true", help="Delete and replace the output directory if it is not empty.")
+    args = parser.parse_args()
+
+    config = load_yaml(Path(args.config))
+    if args.spec:
+        spec = load_yaml(Path(args.spec))
+    else:
+        spec = {
+            "name": Path(args.output).name,
+            "subjects": args.subjects,
+            "sessions": args.sessions,
+            "runs": args.runs,
+            "tasks": args.tasks,
+            "sequential_length": args.sequential_length,
+            "suffixes": args.suffixes,
+        }
+
+    try:
+        start = time.perf_counter()
+        file_count = generate_dataset(spec, config, Path(args.output), args.workers, args.force)
+    except ValueError as e:
+        print(f"Error: {e}")
+        return 1
+    print(f"Generated {file_count} files in {args.output} in {time.perf_counter() - start:.1f} s")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
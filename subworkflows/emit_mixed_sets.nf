@@ -1,9 +1,9 @@
 include { 
-    findMatchingGrouping; 
     createFileMap; 
     validateRequiredFiles;
     validateRequiredFilesWithConfig; 
     createGroupingKey;
+    createLoopOverKey;
     buildChannelData;
     buildSequentialChannelData
 } from '../modules/grouping/entity_grouping_utils.nf'
@@ -14,66 +14,9 @@ include {
     tryWithContext
 } from '../modules/utils/error_handling.nf'
 
-def getTargetSuffix(configKey, configValue) {
-    return (configValue instanceof Map && configValue.containsKey('suffix_maps_to')) ? configValue.suffix_maps_to : configKey
-}
-
-def findMatchingVirtualConfig(row, config) {
-    def candidateConfigs = config.findAll { configKey, configValue ->
-        def targetSuffix = getTargetSuffix(configKey, configValue)
-        return targetSuffix == row.suffix && configValue instanceof Map && configValue.containsKey('mixed_set')
-    }
-    
-    // For mixed sets, any candidate can process the file (no strict entity requirements)
-    return candidateConfigs.size() > 0 ? [configKey: candidateConfigs.entrySet().first().key, configValue: candidateConfigs.entrySet().first().value] : null
-}
-
-def normalizeEntityValue(value) {
-    // Normalize entity values to handle different zero-padding
-    // e.g., "flip-02" and "flip-2" should both match
-    if (value && value.contains('-')) {
-        def parts = value.split('-')
-        if (parts.length == 2) {
-            def prefix = parts[0]
-            def suffix = parts[1]
-            // If suffix is numeric, remove leading zeros for comparison
-            if (suffix.isNumber()) {
-                def numericSuffix = Integer.parseInt(suffix)
-                return "${prefix}-${numericSuffix}"
-            }
-        }
-    }
-    return value
-}
-
-def entityValuesMatch(rowValue, configValue) {
-    // Compare entity values with normalization
-    if (!rowValue || !configValue) {
-        return rowValue == configValue
-    }
-    return normalizeEntityValue(rowValue) == normalizeEntityValue(configValue)
-}
-
-def findMatchingMixedGrouping(row, mixedConfig) {
-    def namedGroups = mixedConfig.named_groups
-    
-    def matchingEntry = namedGroups.find { entry ->
-        def groupingName = entry.key
-        def groupingConfig = entry.value
-        
-        def matches = groupingConfig.every { entity, value ->
-            entity == 'description' || entityValuesMatch(row[entity], value)
-        }
-        
-        return matches
-    }
-    
-    return matchingEntry ? matchingEntry.key : null
-}
-
 workflow emit_mixed_sets {
     take:
-    parsed_csv
+    routed_rows
     config
     loopOverEntities
 
@@ -82,48 +25,29 @@ workflow emit_mixed_sets {
     // Input validation and parsing now done by calling workflow
     logDebug("emit_mixed_sets", "Creating mixed set channels ...")
 
-    // Process files with mixed set configuration
-    input_files = parsed_csv
-        .splitCsv(header: true)
-        .filter { row -> 
-            def matchingConfig = findMatchingVirtualConfig(row, config)
-            return matchingConfig != null
-        }
-        .map { row -> 
-            def matchingConfig = findMatchingVirtualConfig(row, config)
-            def virtualSuffixKey = matchingConfig.configKey
-            def suffixConfig = matchingConfig.configValue
-            def mixedConfig = suffixConfig.mixed_set
-            def groupName = findMatchingMixedGrouping(row, mixedConfig)
+    // Process files with mixed set configuration. Rows arrive pre-routed as
+    // [virtualSuffixKey, groupName, row, groupSizes] by route_parsed_rows, which already dropped rows
+    // without a matching named group or sequential dimension value
+    input_files = routed_rows
+        .map { virtualSuffixKey, groupName, row, groupSizes -> 
+            def mixedConfig = config[virtualSuffixKey].mixed_set
             
-            if (groupName) {
-                // Extract sequential dimension value (e.g., echo number)
-                def sequentialDimension = mixedConfig.sequential_dimension
-                def sequentialValue = row[sequentialDimension]
-                
-                if (sequentialValue) {
-                    // Check if parts configuration exists
-                    def hasPartsConfig = mixedConfig.containsKey('parts')
-                    def partValue = hasPartsConfig ? (row.part ?: "NA") : "NA"
-                    
-                    // Create dynamic grouping key based on loop_over entities
-                    def entityValues = loopOverEntities.collect { entity -> 
-                        def value = row.containsKey(entity) ? row[entity] : "NA"
-                        return (value == null || value == "") ? "NA" : value
-                    }
-                    tuple(entityValues + [virtualSuffixKey, groupName, sequentialValue, row.extension], [row.path, partValue, hasPartsConfig])
-                } else {
-                    null
-                }
-            } else {
-                null
-            }
+            // Extract sequential dimension value (e.g., echo number)
+            def sequentialValue = row[mixedConfig.sequential_dimension]
+            
+            // Check if parts configuration exists
+            def hasPartsConfig = mixedConfig.containsKey('parts')
+            def partValue = hasPartsConfig ? (row.part ?: "NA") : "NA"
+            
+            // Create dynamic grouping key based on loop_over entities
+            def entityValues = createLoopOverKey(row, loopOverEntities)
+            tuple(entityValues + [virtualSuffixKey, groupName, sequentialValue, row.extension], [row.path, partValue, hasPartsConfig], groupSizes)
         }
-        .filter { it != null }
 
-    // Group by sequential dimension within each named group
+    // Group by sequential dimension value within each named group (groupSizes.rows), then the
+    // sequential values of all named groups of each loop key below (groupSizes.stages)
     sequential_groups = input_files
-        .map { groupingKeyWithExtras, fileData ->
+        .map { groupingKeyWithExtras, fileData, groupSizes ->
             def entityCount = loopOverEntities.size()
             def entityValues = groupingKeyWithExtras[0..entityCount-1]
             def virtualSuffixKey = groupingKeyWithExtras[entityCount]
@@ -132,10 +56,13 @@ workflow emit_mixed_sets {
             def extension = groupingKeyWithExtras[entityCount+3]
             def (filePath, partValue, hasPartsConfig) = fileData
             
-            tuple(entityValues + [virtualSuffixKey, groupName, sequentialValue], [extension, filePath, partValue, hasPartsConfig])
+            tuple(groupKey(entityValues + [virtualSuffixKey, groupName, sequentialValue], groupSizes.rows), [extension, filePath, partValue, hasPartsConfig], groupSizes.stages)
         }
         .groupTuple()
-        .map { groupingKeyWithGroupSeq, extFiles ->
+        .map { key, extFiles, stageCounts ->
+            // Invalid sequential values are emitted with null data, skipped when the named groups are merged
+            def groupingKeyWithGroupSeq = key.getGroupTarget()
+            def stageCount = stageCounts[0]
             def entityCount = loopOverEntities.size()
             def entityValues = groupingKeyWithGroupSeq[0..entityCount-1]
             def virtualSuffixKey = groupingKeyWithGroupSeq[entityCount]
@@ -188,7 +115,7 @@ workflow emit_mixed_sets {
                     
                     if (niiPartsMap.size() == partsConfig.size()) {
                         // All parts present - use parts structure
-                        tuple(entityValues + [virtualSuffixKey, groupName], [sequentialValue, niiPartsMap, jsonFile])
+                        tuple(entityValues + [virtualSuffixKey, groupName], [sequentialValue, niiPartsMap, jsonFile], stageCount)
                     } else {
                         // Fall back to regular processing if not all parts are present
                         def regularNiiFiles = filesByExtAndPart.findAll { key, path -> 
@@ -196,13 +123,13 @@ workflow emit_mixed_sets {
                         }
                         if (regularNiiFiles.size() > 0) {
                             def niiFile = regularNiiFiles.values().first()
-                            tuple(entityValues + [virtualSuffixKey, groupName], [sequentialValue, niiFile, jsonFile])
+                            tuple(entityValues + [virtualSuffixKey, groupName], [sequentialValue, niiFile, jsonFile], stageCount)
                         } else {
-                            null
+                            tuple(entityValues + [virtualSuffixKey, groupName], null, stageCount)
                         }
                     }
                 } else {
-                    null
+                    tuple(entityValues + [virtualSuffixKey, groupName], null, stageCount)
                 }
             } else {
                 // Regular processing without parts
@@ -214,28 +141,31 @@ workflow emit_mixed_sets {
                 if (validateRequiredFilesWithConfig(fileMap, entityMap.subject ?: "NA", entityMap.session ?: "NA", entityMap.run ?: "NA", virtualSuffixKey, "${groupName}_${sequentialValue}", suffixConfig)) {
                     def niiFile = fileMap.containsKey('nii.gz') ? fileMap['nii.gz'] : fileMap['nii']
                     def jsonFile = fileMap['json']
-                    tuple(entityValues + [virtualSuffixKey, groupName], [sequentialValue, niiFile, jsonFile])
+                    tuple(entityValues + [virtualSuffixKey, groupName], [sequentialValue, niiFile, jsonFile], stageCount)
                 } else {
-                    null
+                    tuple(entityValues + [virtualSuffixKey, groupName], null, stageCount)
                 }
             }
         }
-        .filter { it != null }
 
     // Group by named groups and create sequential arrays
     named_groups = sequential_groups
-        .map { groupingKeyWithSuffixGroup, seqNiiJson ->
+        .map { groupingKeyWithSuffixGroup, seqNiiJson, stageCount ->
             def entityCount = loopOverEntities.size()
             def entityValues = groupingKeyWithSuffixGroup[0..entityCount-1]
             def virtualSuffixKey = groupingKeyWithSuffixGroup[entityCount]
             def groupName = groupingKeyWithSuffixGroup[entityCount+1]
+            if (seqNiiJson == null) {
+                return tuple(groupKey(entityValues, stageCount), null)
+            }
             def (sequentialValue, niiFile, jsonFile) = seqNiiJson
             
             // Use only entity values as grouping key
-            tuple(entityValues, [virtualSuffixKey, groupName, sequentialValue, niiFile, jsonFile])
+            tuple(groupKey(entityValues, stageCount), [virtualSuffixKey, groupName, sequentialValue, niiFile, jsonFile])
         }
         .groupTuple()
-        .map { groupingKey, suffixGroupingFiles ->
+        .map { key, suffixGroupingFiles ->
+            def groupingKey = key.getGroupTarget()
             // Create entity map from grouping key
             def entityMap = [:]
             loopOverEntities.eachWithIndex { entity, index ->
@@ -248,7 +178,7 @@ workflow emit_mixed_sets {
             
             // Group files by suffix and named group
             def suffixGroups = [:]
-            suffixGroupingFiles.each { virtualSuffixKey, groupName, sequentialValue, niiData, jsonFile ->
+            suffixGroupingFiles.findAll { it != null }.each { virtualSuffixKey, groupName, sequentialValue, niiData, jsonFile ->
                 if (!suffixGroups.containsKey(virtualSuffixKey)) {
                     suffixGroups[virtualSuffixKey] = [:]
                 }
@@ -311,10 +241,10 @@ workflow emit_mixed_sets {
             if (allComplete) {
                 tuple(groupingKey, [allGroupingMaps, allFilePaths])
             } else {
-                null
+                // Incomplete loop keys are emitted with empty data and dropped after cross-modal broadcasting
+                tuple(groupingKey, [[:], []])
             }
         }
-        .filter { it != null }
 
     emit:
     named_groups
@@ -1,9 +1,10 @@
 include { 
-    findMatchingGrouping; 
     createFileMap; 
+    createFileMapWithDataType;
     validateRequiredFiles;
     validateRequiredFilesWithConfig; 
     createGroupingKey;
+    createLoopOverKey;
     buildChannelData
 } from '../modules/grouping/entity_grouping_utils.nf'
 include {
@@ -13,23 +14,9 @@ include {
     tryWithContext
 } from '../modules/utils/error_handling.nf'
 
-def getTargetSuffix(configKey, configValue) {
-    return (configValue instanceof Map && configValue.containsKey('suffix_maps_to')) ? configValue.suffix_maps_to : configKey
-}
-
-def findMatchingVirtualConfig(row, config) {
-    def candidateConfigs = config.findAll { configKey, configValue ->
-        def targetSuffix = getTargetSuffix(configKey, configValue)
-        return targetSuffix == row.suffix && configValue instanceof Map && configValue.containsKey('named_set')
-    }
-    
-    // For named sets, any candidate can process the file (no strict entity requirements)
-    return candidateConfigs.size() > 0 ? [configKey: candidateConfigs.entrySet().first().key, configValue: candidateConfigs.entrySet().first().value] : null
-}
-
 workflow emit_named_sets {
     take:
-    parsed_csv
+    routed_rows
     config
     loopOverEntities
 
@@ -38,33 +25,19 @@ workflow emit_named_sets {
     // Input validation and parsing now done by calling workflow
     logDebug("emit_named_sets", "Creating named set channels ...")
 
-    input_files = parsed_csv
-        .splitCsv(header: true)
-        .filter { row -> 
-            def matchingConfig = findMatchingVirtualConfig(row, config)
-            return matchingConfig != null
-        }
-        .map { row -> 
-            def matchingConfig = findMatchingVirtualConfig(row, config)
-            def virtualSuffixKey = matchingConfig.configKey
-            def suffixConfig = matchingConfig.configValue
-            def groupName = findMatchingGrouping(row, suffixConfig)
-            
-            if (groupName) {
-                def entityValues = loopOverEntities.collect { entity ->
-                    def value = row.containsKey(entity) ? row[entity] : "NA"
-                    return (value == null || value == "") ? "NA" : value
-                }
-                def dataType = row.containsKey('data_type') ? row.data_type : 'NA'
-                tuple(entityValues + [virtualSuffixKey, groupName, row.extension], [row.path, dataType])
-            } else {
-                null
-            }
+    // Rows arrive pre-routed as [virtualSuffixKey, groupName, row, groupSizes] by route_parsed_rows,
+    // which already dropped rows that match none of the named groupings
+    input_files = routed_rows
+        .map { virtualSuffixKey, groupName, row, groupSizes -> 
+            def entityValues = createLoopOverKey(row, loopOverEntities)
+            def dataType = row.containsKey('data_type') ? row.data_type : 'NA'
+            tuple(entityValues + [virtualSuffixKey, groupName, row.extension], [row.path, dataType], groupSizes)
         }
-        .filter { it != null }
 
+    // Collect the files of each named group (groupSizes.rows), then the named groups of each
+    // loop key below (groupSizes.stages)
     input_pairs = input_files
-        .map { groupingKeyWithExtras, pathWithDataType ->
+        .map { groupingKeyWithExtras, pathWithDataType, groupSizes ->
             def entityCount = loopOverEntities.size()
             def entityValues = groupingKeyWithExtras[0..entityCount-1]
             def suffix = groupingKeyWithExtras[entityCount]
@@ -73,10 +46,11 @@ workflow emit_named_sets {
             def filePath = pathWithDataType[0]
             def dataType = pathWithDataType[1]
 
-            tuple(entityValues + [suffix, groupName], [extension, filePath, dataType])
+            tuple(groupKey(entityValues + [suffix, groupName], groupSizes.rows), [extension, filePath, dataType], groupSizes.stages)
         }
         .groupTuple()
-        .map { groupingKeyWithSuffixGroup, extFiles ->
+        .map { key, extFiles, stageCounts ->
+            def groupingKeyWithSuffixGroup = key.getGroupTarget()
             def entityCount = loopOverEntities.size()
             def entityValues = groupingKeyWithSuffixGroup[0..entityCount-1]
             def suffix = groupingKeyWithSuffixGroup[entityCount]
@@ -92,24 +66,25 @@ workflow emit_named_sets {
 
             if (validateRequiredFilesWithConfig(fileMap, entityMap.subject ?: "NA", entityMap.session ?: "NA", entityMap.run ?: "NA", suffix, groupName, suffixConfig)) {
                 def channelData = buildChannelData(fileMap, suffixConfig, dataTypeMap)
-                tuple(entityValues + [suffix, groupName], channelData)
+                tuple(entityValues + [suffix, groupName], channelData, stageCounts[0])
             } else {
-                null
+                // Incomplete named group: skipped when the named groups are merged below
+                tuple(entityValues + [suffix, groupName], null, stageCounts[0])
             }
         }
-        .filter { it != null }
 
     finalGroups = input_pairs
-        .map { groupingKeyWithSuffixGroup, channelData ->
+        .map { groupingKeyWithSuffixGroup, channelData, stageCount ->
             def entityCount = loopOverEntities.size()
             def entityValues = groupingKeyWithSuffixGroup[0..entityCount-1]
             def suffix = groupingKeyWithSuffixGroup[entityCount]
             def groupName = groupingKeyWithSuffixGroup[entityCount+1]
             
-            tuple(entityValues, [suffix, groupName, channelData])
+            tuple(groupKey(entityValues, stageCount), [suffix, groupName, channelData])
         }
         .groupTuple()
-        .map { groupingKey, suffixGroupingFiles ->
+        .map { key, suffixGroupingFiles ->
+            def groupingKey = key.getGroupTarget()
             def entityMap = [:]
             loopOverEntities.eachWithIndex { entity, index ->
                 entityMap[entity] = groupingKey[index] ?: "NA"
@@ -119,6 +94,9 @@ workflow emit_named_sets {
             def allFilePaths = []
             
             suffixGroupingFiles.each { suffix, groupName, channelData ->
+                if (channelData == null) {
+                    return
+                }
                 if (!allGroupingMaps.containsKey(suffix)) {
                     allGroupingMaps[suffix] = [:]
                 }
@@ -145,15 +123,9 @@ workflow emit_named_sets {
                 }
             }
             
-            def allComplete = validGroupingMaps.size() > 0
-            
-            if (allComplete) {
-                tuple(groupingKey, [validGroupingMaps, validFilePaths])
-            } else {
-                null
-            }
+            // Incomplete loop keys are emitted with empty data and dropped after cross-modal broadcasting
+            tuple(groupingKey, [validGroupingMaps, validFilePaths])
         }
-        .filter { it != null }
 
     emit:
     finalGroups
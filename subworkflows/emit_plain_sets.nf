@@ -2,25 +2,12 @@ include {
     createFileMap;
     createFileMapWithDataType;
     createGroupingKey;
+    createLoopOverKey;
     buildChannelData
 } from '../modules/grouping/entity_grouping_utils.nf'
 include {
     validatePlainSetFiles
 } from '../modules/grouping/plain_set_utils.nf'
-
-def getTargetSuffix(configKey, configValue) {
-    return (configValue instanceof Map && configValue.containsKey('suffix_maps_to')) ? configValue.suffix_maps_to : configKey
-}
-
-def findMatchingVirtualConfig(row, config) {
-    def candidateConfigs = config.findAll { configKey, configValue ->
-        def targetSuffix = getTargetSuffix(configKey, configValue)
-        return targetSuffix == row.suffix && configValue instanceof Map && configValue.containsKey('plain_set')
-    }
-    
-    // For plain sets, any candidate can process the file (no entity requirements)
-    return candidateConfigs.size() > 0 ? [configKey: candidateConfigs.entrySet().first().key, configValue: candidateConfigs.entrySet().first().value] : null
-}
 include {
     handleError;
     logDebug;
@@ -29,7 +16,7 @@ include {
 
 workflow emit_plain_sets {
     take:
-    parsed_csv
+    routed_rows
     config
     loopOverEntities
 
@@ -38,22 +25,12 @@ workflow emit_plain_sets {
     // Input validation and parsing now done by calling workflow
     logDebug("emit_plain_sets", "Creating plain set channels ...")
 
-    input_files = parsed_csv
-        .splitCsv(header: true)
-        .filter { row -> 
-            def matchingConfig = findMatchingVirtualConfig(row, config)
-            return matchingConfig != null
-        }
-        .map { row -> 
-            def entityValues = loopOverEntities.collect { entity -> 
-                def value = row.containsKey(entity) ? row[entity] : "NA"
-                return (value == null || value == "") ? "NA" : value
-            }
+    // Rows arrive pre-routed as [virtualSuffixKey, groupName, row, groupSizes] by route_parsed_rows
+    input_files = routed_rows
+        .map { virtualSuffixKey, _groupName, row, groupSizes -> 
+            def entityValues = createLoopOverKey(row, loopOverEntities)
             
-            // Find the matching virtual configuration
-            def matchingConfig = findMatchingVirtualConfig(row, config)
-            def virtualSuffixKey = matchingConfig.configKey
-            def suffixConfig = matchingConfig.configValue
+            def suffixConfig = config[virtualSuffixKey]
             
             // Check if parts configuration exists
             def hasPartsConfig = suffixConfig.containsKey('plain_set') &&
@@ -61,20 +38,25 @@ workflow emit_plain_sets {
             def partValue = hasPartsConfig ? (row.part ?: "NA") : "NA"
             def dataType = row.containsKey('data_type') ? row.data_type : 'NA'
 
-            tuple(entityValues + [virtualSuffixKey, row.extension], [row.path, partValue, hasPartsConfig, dataType])
+            tuple(entityValues + [virtualSuffixKey, row.extension], [row.path, partValue, hasPartsConfig, dataType], groupSizes)
         }
 
+    // Collect the files of each plain set config (groupSizes.rows), then the configs of each
+    // loop key below (groupSizes.stages)
     input_pairs = input_files
-        .map { groupingKeyWithSuffixExt, fileData ->
+        .map { groupingKeyWithSuffixExt, fileData, groupSizes ->
             def entityCount = loopOverEntities.size()
             def entityValues = groupingKeyWithSuffixExt[0..entityCount-1]
             def suffix = groupingKeyWithSuffixExt[entityCount]
             def extension = groupingKeyWithSuffixExt[entityCount+1]
             def (filePath, partValue, hasPartsConfig, dataType) = fileData
-            tuple(entityValues + [suffix], [extension, filePath, partValue, hasPartsConfig, dataType])
+            tuple(groupKey(entityValues + [suffix], groupSizes.rows), [extension, filePath, partValue, hasPartsConfig, dataType], groupSizes.stages)
         }
         .groupTuple()
-        .map { groupingKeyWithSuffix, extFiles ->
+        .map { key, extFiles, stageCounts ->
+            // Invalid groups are emitted with a null file map, skipped when the configs are merged
+            def groupingKeyWithSuffix = key.getGroupTarget()
+            def stageCount = stageCounts[0]
             def entityCount = loopOverEntities.size()
             def entityValues = groupingKeyWithSuffix[0..entityCount-1]
             def virtualSuffixKey = groupingKeyWithSuffix[entityCount]
@@ -136,7 +118,7 @@ workflow emit_plain_sets {
                     if (niiPartsMap.size() == partsConfig.size()) {
                         // All parts present - use parts structure
                         allFiles['nii'] = niiPartsMap
-                        tuple(entityValues + [virtualSuffixKey], allFiles)
+                        tuple(entityValues + [virtualSuffixKey], allFiles, stageCount)
                     } else {
                         // Fall back to regular processing if not all parts are present
                         def regularNiiFiles = filesByExtAndPart.findAll { key, _path -> 
@@ -145,13 +127,13 @@ workflow emit_plain_sets {
                         if (regularNiiFiles.size() > 0) {
                             // Always use 'nii' key for consistency
                             allFiles['nii'] = regularNiiFiles.values().first()
-                            tuple(entityValues + [virtualSuffixKey], allFiles)
+                            tuple(entityValues + [virtualSuffixKey], allFiles, stageCount)
                         } else {
-                            null
+                            tuple(entityValues + [virtualSuffixKey], null, stageCount)
                         }
                     }
                 } else {
-                    null
+                    tuple(entityValues + [virtualSuffixKey], null, stageCount)
                 }
             } else {
                 // Regular plain set processing
@@ -163,24 +145,24 @@ workflow emit_plain_sets {
 
                 if (validatePlainSetFiles(fileMap, entityMap.subject ?: "NA", entityMap.session ?: "NA", entityMap.run ?: "NA", virtualSuffixKey, suffixConfig)) {
                     def allFiles = buildChannelData(fileMap, suffixConfig, dataTypeMap)
-                    tuple(entityValues + [virtualSuffixKey], allFiles)
+                    tuple(entityValues + [virtualSuffixKey], allFiles, stageCount)
                 } else {
-                    null
+                    tuple(entityValues + [virtualSuffixKey], null, stageCount)
                 }
             }
         }
-        .filter { it != null }
 
     finalGroups = input_pairs
-        .map { groupingKeyWithSuffix, fileMap ->
+        .map { groupingKeyWithSuffix, fileMap, stageCount ->
             def entityCount = loopOverEntities.size()
             def entityValues = groupingKeyWithSuffix[0..entityCount-1]
             def virtualSuffixKey = groupingKeyWithSuffix[entityCount]
             
-            tuple(entityValues, [virtualSuffixKey, fileMap])
+            tuple(groupKey(entityValues, stageCount), [virtualSuffixKey, fileMap])
         }
         .groupTuple()
-        .map { groupingKey, suffixFileMaps ->
+        .map { key, suffixFileMaps ->
+            def groupingKey = key.getGroupTarget()
             def entityMap = [:]
             loopOverEntities.eachWithIndex { entity, index ->
                 entityMap[entity] = groupingKey[index] ?: "NA"
@@ -190,6 +172,9 @@ workflow emit_plain_sets {
             def allFilePaths = []
             
             suffixFileMaps.each { virtualSuffixKey, fileMap ->
+                if (fileMap == null) {
+                    return
+                }
                 allPlainMaps[virtualSuffixKey] = fileMap
                 allFilePaths.addAll(fileMap.values())
             }
@@ -0,0 +1,95 @@
+include {
+    libbids_sh_parse;
+    libbids_sh_parse_shard
+} from '../modules/parsers/lib_bids_sh_parser.nf'
+include {
+    logProgress;
+    logDebug
+} from '../modules/utils/error_handling.nf'
+
+// Pseudo unit for the files directly under the dataset root, see libbids_sh_utils.sh
+def getRootFilesUnit() {
+    return '@root'
+}
+
+def listParseUnits(bids_dir) {
+    // Parse units of the dataset in deterministic order, matching libbids_sh_utils.sh: the root
+    // files unit when the dataset root holds files, and the top-level directories (sub-*, derivatives, ...)
+    def entries = file(bids_dir).listFiles().findAll { !it.name.startsWith('.') }
+    def units = entries.findAll { it.isDirectory() }.collect { it.name }
+    if (entries.any { it.isFile() }) {
+        units << getRootFilesUnit()
+    }
+    return units.sort()
+}
+
+def isSubjectUnit(unitName) {
+    return unitName ==~ /sub-[^\/]+/
+}
+
+def splitIntoShards(parseUnits, shardCount) {
+    // Contiguous chunks keep the units of each shard in dataset order
+    if (!parseUnits) {
+        return []
+    }
+    def chunkSize = (int) Math.ceil(parseUnits.size() / (double) shardCount)
+    def shards = []
+    parseUnits.collate(chunkSize).eachWithIndex { units, index ->
+        shards << [index, units]
+    }
+    return shards
+}
+
+workflow parse_bids_dataset {
+    take:
+    bids_dir
+    libbids_sh
+    libbids_config_dir
+    bids_index_dir
+
+    main:
+
+    def shardCount = params.parse_shards as int
+
+    if (shardCount > 1) {
+        if (bids_index_dir) {
+            log.warn "[bids2nf] bids_index_dir is ignored when parse_shards > 1"
+        }
+
+        // Units outside sub-* directories (root files, derivatives, ...) can hold rows of any
+        // subject, so they form their own leading shard: subject batches wait for that shard
+        // only, never for the shards of other subjects
+        def parseUnits = listParseUnits(bids_dir)
+        def sharedUnits = parseUnits.findAll { !isSubjectUnit(it) }
+        def subjectUnits = parseUnits.findAll { isSubjectUnit(it) }
+        def shards = splitIntoShards(subjectUnits, sharedUnits ? shardCount - 1 : shardCount)
+            .collect { index, units -> [index + 1, units] }
+        if (sharedUnits) {
+            shards = [[0, sharedUnits]] + shards
+        }
+        logProgress("parse_bids_dataset", "Parsing ${parseUnits.size()} top-level units in ${shards.size()} shards")
+        shards.each { index, units -> logDebug("parse_bids_dataset", "Shard ${index}: ${units.join(', ')}") }
+
+        // Units are emitted as soon as their shard finishes, named after their top-level directory
+        parsed_units = libbids_sh_parse_shard(Channel.fromList(shards), bids_dir, libbids_sh, libbids_config_dir)
+            .flatten()
+            .map { unit_csv -> tuple(unit_csv.baseName, unit_csv) }
+            .branch { unitName, _unitCsv ->
+                subject: isSubjectUnit(unitName)
+                shared: true
+            }
+
+        subject_csvs = parsed_units.subject
+        // The shared channel completes with its last unit instead of with the last shard
+        shared_csvs = sharedUnits ? parsed_units.shared.take(sharedUnits.size()) : Channel.empty()
+    } else {
+        // A single CSV covering the whole dataset
+        subject_csvs = Channel.empty()
+        shared_csvs = libbids_sh_parse(bids_dir, libbids_sh, libbids_config_dir, bids_index_dir)
+            .map { parsed_csv -> tuple('dataset', parsed_csv) }
+    }
+
+    emit:
+    subject_csvs    // [unitName, csv] of each sub-* directory
+    shared_csvs     // [unitName, csv] of every other unit, or of the whole dataset when not sharded
+}
@@ -0,0 +1,203 @@
+include {
+    compileConfigMatcher;
+    routeRow
+} from '../modules/grouping/config_matcher.nf'
+include {
+    createLoopOverKey
+} from '../modules/grouping/entity_grouping_utils.nf'
+include {
+    getNonTaskKey
+} from '../modules/grouping/cross_modal_utils.nf'
+include {
+    readParsedRows
+} from '../modules/parsers/parsed_rows.nf'
+include {
+    computeBatchCacheKey;
+    readCachedResults
+} from '../modules/grouping/result_cache.nf'
+include {
+    logDebug
+} from '../modules/utils/error_handling.nf'
+
+def getStageKey(setType, configKey, groupName, row, config) {
+    // Key of the first grouping stage of each set type below the loop key:
+    // one group per config for plain and sequential sets, per named group for named sets
+    // and per named group and sequential value for mixed sets
+    if (setType == 'named_set') {
+        return [configKey, groupName]
+    }
+    if (setType == 'mixed_set') {
+        return [configKey, groupName, row[config[configKey].mixed_set.sequential_dimension]]
+    }
+    return [configKey]
+}
+
+def routeBatch(rows, matcher, config, loopOverEntities, cacheKey, sizeRegistry) {
+    // Route every row of a batch and derive the group sizes needed downstream. A batch holds
+    // all rows of the loop keys it contains, so sizes are known as soon as the batch is routed.
+    def routes = []
+    def rowCounts = [:]
+    def stageKeys = [:]
+    def resultSlots = [:]
+
+    rows.each { row ->
+        def loopKey = createLoopOverKey(row, loopOverEntities)
+        routeRow(row, matcher).each { setType, configKey, groupName ->
+            def stageKey = getStageKey(setType, configKey, groupName, row, config)
+            routes << [setType, configKey, groupName, row, loopKey, stageKey]
+
+            def rowCountKey = [setType, loopKey, stageKey]
+            rowCounts[rowCountKey] = (rowCounts[rowCountKey] ?: 0) + 1
+
+            def stageKeysKey = [setType, loopKey]
+            if (!stageKeys.containsKey(stageKeysKey)) {
+                stageKeys[stageKeysKey] = [] as Set
+            }
+            stageKeys[stageKeysKey] << stageKey
+
+            // The set type workflows emit one result per routed loop key, except
+            // emit_sequential_sets which emits one per sequential config
+            if (!resultSlots.containsKey(loopKey)) {
+                resultSlots[loopKey] = [] as Set
+            }
+            resultSlots[loopKey] << (setType == 'sequential_set' ? setType + ':' + configKey : setType)
+        }
+    }
+
+    // Every grouping stage of the set type workflows and of main.nf builds its groupKey from
+    // the sizes derived here, so it releases a group as soon as the last item arrives and only
+    // holds the groups in flight. In return, no stage may drop an item: invalid groups are
+    // still forwarded, with a null or empty payload, or the group downstream never completes.
+    //
+    // Group sizes shared by all rows of a first stage group:
+    //   rows:   rows of the first stage group
+    //   stages: first stage groups of the set type for the loop key
+    def groupSizesByKey = [:]
+    def routedRows = routes.collect { setType, configKey, groupName, row, loopKey, stageKey ->
+        def rowCountKey = [setType, loopKey, stageKey]
+        def groupSizes = groupSizesByKey[rowCountKey]
+        if (groupSizes == null) {
+            groupSizes = [rows: rowCounts[rowCountKey], stages: stageKeys[[setType, loopKey]].size()].asImmutable()
+            groupSizesByKey[rowCountKey] = groupSizes
+        }
+        tuple(setType, configKey, groupName, row, groupSizes)
+    }
+
+    // Register the sizes of the merging stages in main.nf before any row of the batch is emitted
+    resultSlots.each { loopKey, slots -> sizeRegistry.put(GroupSizeRegistry.RESULTS, loopKey, slots.size()) }
+
+    def loopKeysByNonTaskKey = resultSlots.keySet().groupBy { loopKey -> getNonTaskKey(loopKey, loopOverEntities) }
+    loopKeysByNonTaskKey.each { nonTaskKey, loopKeys ->
+        sizeRegistry.put(GroupSizeRegistry.LOOP_KEYS, nonTaskKey, loopKeys.size())
+        // With the result cache enabled, each non-task key carries the cache key of its batch and
+        // the number of non-task keys in the batch, so the batch results can be stored once complete
+        if (cacheKey) {
+            sizeRegistry.put(GroupSizeRegistry.CACHE_BATCHES, nonTaskKey, [cacheKey, loopKeysByNonTaskKey.size()].asImmutable())
+        }
+    }
+
+    return routedRows
+}
+
+workflow route_parsed_rows {
+    take:
+    subject_csvs    // [unitName, csv] of each sub-* directory
+    shared_csvs     // [unitName, csv] of every other unit, or of the whole dataset
+    config
+    loopOverEntities
+    result_cache    // null, or [dir: cache directory, context: values written into every result]
+    size_registry   // GroupSizeRegistry receiving the sizes of the merging stages in main.nf
+
+    main:
+
+    // Read each parsed CSV once and send every row only to the set types that can handle it
+    logDebug("route_parsed_rows", "Routing parsed rows to set type workflows ...")
+
+    def matcher = compileConfigMatcher(config)
+    logDebug("route_parsed_rows", "Compiled config matcher for suffixes: ${matcher.keySet().join(', ')}")
+
+    if (loopOverEntities.contains('subject')) {
+        // Batch rows per subject so that each subject streams downstream as soon as its
+        // sub-* directory is parsed. Rows from other units (root files, derivatives, ...) or from
+        // an unsharded parse are attached to the batch of their subject, so subject batches also
+        // wait for the shared units. These are parsed by their own shard and shared_csvs
+        // completes with them, independently of the other subject shards.
+        shared_rows = shared_csvs
+            .flatMap { unitName, unitCsv -> readParsedRows(unitCsv).collect { row -> [unitName, row] } }
+            .toList()
+            .map { entries -> entries.sort { it[0] }.groupBy { it[1].subject ?: 'NA' } }
+
+        subject_batches = subject_csvs
+            .combine(shared_rows)
+            .map { unitName, unitCsv, sharedBySubject ->
+                // Keep the order of a single crawl: units sorted by name
+                def sharedEntries = sharedBySubject[unitName] ?: []
+                def rows = sharedEntries.findAll { it[0] < unitName }.collect { it[1] } +
+                    readParsedRows(unitCsv) +
+                    sharedEntries.findAll { it[0] > unitName }.collect { it[1] }
+                tuple(unitName, rows)
+            }
+
+        subject_names = subject_csvs
+            .map { unitName, _unitCsv -> unitName }
+            .collect()
+            .ifEmpty([])
+            .map { unitNames -> unitNames as Set }
+
+        // Subjects without a sub-* directory of their own are batched once all units are parsed
+        remaining_batches = shared_rows
+            .combine(subject_names)
+            .flatMap { sharedBySubject, subjectNames ->
+                sharedBySubject
+                    .findAll { subject, _entries -> !subjectNames.contains(subject) }
+                    .collect { subject, entries -> tuple(subject, entries.collect { it[1] }) }
+            }
+
+        batches = subject_batches.mix(remaining_batches)
+    } else {
+        // Without subject in loop_over a loop key can span subjects, so all rows form one batch
+        batches = subject_csvs
+            .mix(shared_csvs)
+            .flatMap { _unitName, unitCsv -> readParsedRows(unitCsv) }
+            .toList()
+            .map { rows -> tuple('dataset', rows) }
+    }
+
+    // Batches whose rows and relevant config sections are unchanged since a previous run are
+    // replayed from the result cache instead of being routed and grouped again
+    keyed_batches = batches
+        .map { batchKey, rows ->
+            def cacheKey = result_cache ? computeBatchCacheKey(rows, config, loopOverEntities, result_cache.context) : null
+            def cachedResults = cacheKey ? readCachedResults(result_cache.dir, cacheKey) : null
+            tuple(batchKey, rows, cacheKey, cachedResults)
+        }
+        .branch { _batchKey, _rows, _cacheKey, cachedResults ->
+            cached: cachedResults != null
+            uncached: true
+        }
+
+    cached_results = keyed_batches.cached
+        .flatMap { batchKey, _rows, _cacheKey, cachedResults ->
+            logDebug("route_parsed_rows", "Replaying batch ${batchKey} from the result cache: ${cachedResults.size()} results")
+            cachedResults
+        }
+
+    routed_rows = keyed_batches.uncached
+        .flatMap { batchKey, rows, cacheKey, _cachedResults ->
+            logDebug("route_parsed_rows", "Routing batch ${batchKey}: ${rows.size()} rows")
+            routeBatch(rows, matcher, config, loopOverEntities, cacheKey, size_registry)
+        }
+        .branch { route ->
+            named: route[0] == 'named_set'
+            sequential: route[0] == 'sequential_set'
+            mixed: route[0] == 'mixed_set'
+            plain: route[0] == 'plain_set'
+        }
+
+    emit:
+    named = routed_rows.named.map { _setType, configKey, groupName, row, groupSizes -> tuple(configKey, groupName, row, groupSizes) }
+    sequential = routed_rows.sequential.map { _setType, configKey, groupName, row, groupSizes -> tuple(configKey, groupName, row, groupSizes) }
+    mixed = routed_rows.mixed.map { _setType, configKey, groupName, row, groupSizes -> tuple(configKey, groupName, row, groupSizes) }
+    plain = routed_rows.plain.map { _setType, configKey, groupName, row, groupSizes -> tuple(configKey, groupName, row, groupSizes) }
+    cached_results
+}
@@ -0,0 +1,64 @@
+include {
+    getUnifiedJsonFilename;
+    writeUnifiedJson;
+    writeUnifiedJsonLine
+} from '../modules/utils/json_utils.nf'
+include {
+    logProgress
+} from '../modules/utils/error_handling.nf'
+
+workflow write_unified_results {
+    take:
+    unified_results
+    output_dir
+    output_format
+    include_bids_parent_dir
+
+    main:
+
+    // Write results from the driver as they are emitted, without a task per grouping key:
+    //   json:   one <entities>_unified.json per key, identical to unified_process_template
+    //   ndjson: one unified_manifest.ndjson with a line per key
+    def outputDir = file(output_dir)
+    outputDir.mkdirs()
+
+    if (output_format == 'ndjson') {
+        def manifest = outputDir.resolve('unified_manifest.ndjson')
+        def writer = manifest.newWriter('UTF-8')
+        def count = 0
+        unified_results.subscribe(
+            onNext: { result ->
+                def (_groupingKey, enrichedData) = result
+                synchronized (writer) {
+                    writeUnifiedJsonLine(enrichedData, include_bids_parent_dir, writer)
+                    writer.write('\n')
+                    count++
+                }
+            },
+            onComplete: {
+                synchronized (writer) {
+                    writer.close()
+                }
+                logProgress("write_unified_results", "Wrote ${count} grouping keys to ${manifest}")
+            }
+        )
+    } else if (output_format == 'json') {
+        def count = 0
+        unified_results.subscribe(
+            onNext: { result ->
+                def (_groupingKey, enrichedData) = result
+                def filename = getUnifiedJsonFilename(enrichedData)
+                outputDir.resolve(filename).withWriter('UTF-8') { writer ->
+                    writeUnifiedJson(enrichedData, include_bids_parent_dir, writer)
+                    writer.write('\n')
+                }
+                count++
+            },
+            onComplete: {
+                logProgress("write_unified_results", "Wrote ${count} JSON files to ${outputDir}")
+            }
+        )
+    } else {
+        throw new IllegalArgumentException("Unknown output format '${output_format}', expected 'json' or 'ndjson'")
+    }
+}
@@ -0,0 +1,19 @@
+// Timing and result checks shared by the benchmarks in this directory.
+
+def timeMillis(Closure operation) {
+    // [elapsed milliseconds, result] of one call of the operation
+    def start = System.nanoTime()
+    def result = operation.call()
+    return [(System.nanoTime() - start) / 1.0e6d, result]
+}
+
+def assertSameResult(expected, actual, message) {
+    // Benchmarks only report timings of implementations that agree with their baseline
+    if (expected != actual) {
+        throw new IllegalStateException(message)
+    }
+}
+
+def speedup(baselineMs, optimizedMs) {
+    return baselineMs / Math.max(optimizedMs, 0.001d)
+}
@@ -0,0 +1,46 @@
+// Entry workflow used by run_benchmark.py: runs bids2nf on a dataset and writes driver-side
+// metrics (peak heap, result emission times) to params.benchmark_metrics on completion.
+
+import java.lang.management.ManagementFactory
+import java.lang.management.MemoryType
+import java.util.concurrent.atomic.AtomicLong
+
+include { bids2nf } from '../../main.nf'
+
+params.benchmark_metrics = "benchmark_metrics.json"
+
+def peakHeapBytes() {
+    // Peak usage of every heap pool since the driver JVM started
+    return ManagementFactory.getMemoryPoolMXBeans()
+        .findAll { pool -> pool.type == MemoryType.HEAP }
+        .sum(0L) { pool -> pool.peakUsage.used }
+}
+
+workflow {
+    def resultCount = new AtomicLong(0)
+    def firstResultMillis = new AtomicLong(0)
+    def lastResultMillis = new AtomicLong(0)
+
+    bids2nf(params.bids_dir)
+        .subscribe { _groupingKey, _enrichedData ->
+            def now = System.currentTimeMillis()
+            firstResultMillis.compareAndSet(0, now)
+            lastResultMillis.set(now)
+            resultCount.incrementAndGet()
+        }
+
+    workflow.onComplete {
+        def startMillis = workflow.start.toInstant().toEpochMilli()
+        def sinceStart = { millis -> millis ? millis - startMillis : null }
+        def metrics = [
+            success: workflow.success,
+            results: resultCount.get(),
+            peak_heap_bytes: peakHeapBytes(),
+            max_heap_bytes: Runtime.getRuntime().maxMemory(),
+            first_result_ms: sinceStart(firstResultMillis.get()),
+            last_result_ms: sinceStart(lastResultMillis.get()),
+            duration_ms: workflow.duration.toMillis()
+        ]
+        file(params.benchmark_metrics).text = groovy.json.JsonOutput.toJson(metrics)
+    }
+}
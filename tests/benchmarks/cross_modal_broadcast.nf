@@ -0,0 +1,134 @@
+// Benchmark of cross-modal broadcasting on a synthetic cohort.
+//
+// Compares the indexed broadcastCrossModal against the previous implementation, which
+// scanned the whole configuration for every suffix of every task="NA" channel.
+//
+// Usage:
+//   nextflow run tests/benchmarks/cross_modal_broadcast.nf \
+//     --bids2nf_config bids2nf.yaml --n_subjects 5000 --n_tasks 10
+
+include {
+    getNonTaskKey;
+    buildCrossModalIndex;
+    broadcastCrossModal
+} from '../../modules/grouping/cross_modal_utils.nf'
+include {
+    loadBids2nfConfig;
+    getLoopOverEntities
+} from '../../modules/utils/config_analyzer.nf'
+include {
+    timeMillis;
+    assertSameResult;
+    speedup
+} from './benchmark_utils.nf'
+
+params.bids2nf_config = "${projectDir}/../../bids2nf.yaml"
+params.n_subjects = 2000
+params.n_tasks = 10
+params.repetitions = 3
+
+def baselineBroadcast(groupEntries, config, loopOverEntities) {
+    // Previous implementation: nested config scans per suffix of each task="NA" channel
+    def crossModalData = [:]
+    groupEntries.each { groupingKey, enrichedData ->
+        if (groupingKey[loopOverEntities.indexOf('task')] == "NA") {
+            enrichedData.data.each { suffix, suffixData -> crossModalData[suffix] = suffixData }
+        }
+    }
+
+    def results = []
+    groupEntries.each { groupingKey, enrichedData ->
+        def enhancedData = enrichedData.clone()
+        enhancedData.data = enhancedData.data.clone()
+        def shouldKeepChannel = true
+        if (groupingKey[loopOverEntities.indexOf('task')] != "NA") {
+            enrichedData.data.each { suffix, _suffixData ->
+                def suffixConfig = config[suffix]
+                if (suffixConfig) {
+                    def setCfg = suffixConfig.plain_set ?: suffixConfig.named_set ?:
+                               suffixConfig.sequential_set ?: suffixConfig.mixed_set
+                    if (setCfg && setCfg.include_cross_modal) {
+                        setCfg.include_cross_modal.each { requestedSuffix ->
+                            if (crossModalData.containsKey(requestedSuffix)) {
+                                enhancedData.data[requestedSuffix] = crossModalData[requestedSuffix]
+                            }
+                        }
+                    }
+                }
+            }
+        } else {
+            shouldKeepChannel = enrichedData.data.any { suffix, _suffixData ->
+                def wasRequested = false
+                config.each { otherSuffix, otherSuffixConfig ->
+                    if (otherSuffix != suffix && otherSuffixConfig instanceof Map) {
+                        def otherSetCfg = otherSuffixConfig.plain_set ?: otherSuffixConfig.named_set ?:
+                                         otherSuffixConfig.sequential_set ?: otherSuffixConfig.mixed_set
+                        if (otherSetCfg && otherSetCfg.include_cross_modal &&
+                            otherSetCfg.include_cross_modal.contains(suffix)) {
+                            wasRequested = true
+                        }
+                    }
+                }
+                return !wasRequested
+            }
+        }
+        if (shouldKeepChannel) {
+            results << tuple(groupingKey, enhancedData)
+        }
+    }
+    return results
+}
+
+def buildSyntheticCohort(config, loopOverEntities, nSubjects, nTasks) {
+    // One task="NA" channel per subject carrying every non-task suffix of the config,
+    // plus one channel per task carrying every suffix that requests cross-modal data
+    def configSuffixes = config.findAll { _suffix, suffixConfig -> suffixConfig instanceof Map }.keySet() as List
+    def consumerSuffixes = buildCrossModalIndex(config).requests.keySet() as List
+    def donorSuffixes = configSuffixes - consumerSuffixes
+
+    def groups = [:]
+    (1..nSubjects).each { subjectIndex ->
+        def subject = "sub-${subjectIndex}"
+        def taskValues = ["NA"] + (1..nTasks).collect { "task-${it}" }
+        taskValues.each { task ->
+            def groupingKey = loopOverEntities.collect { entity ->
+                entity == 'subject' ? subject : (entity == 'task' ? task : "NA")
+            }
+            def suffixes = task == "NA" ? donorSuffixes : consumerSuffixes
+            def data = suffixes.collectEntries { suffix ->
+                [(suffix): [nii: "${subject}_${suffix}.nii.gz", json: "${subject}_${suffix}.json"]]
+            }
+            def nonTaskKey = getNonTaskKey(groupingKey, loopOverEntities)
+            groups.get(nonTaskKey, []) << [groupingKey, [data: data, filePaths: []]]
+        }
+    }
+    return groups.values() as List
+}
+
+workflow {
+    def bids2nfConfig = loadBids2nfConfig(params.bids2nf_config)
+    def config = bids2nfConfig.data
+    def loopOverEntities = getLoopOverEntities(bids2nfConfig)
+    if (!loopOverEntities.contains('task')) {
+        throw new IllegalArgumentException("Cross-modal benchmark requires 'task' in loop_over")
+    }
+
+    def groups = buildSyntheticCohort(config, loopOverEntities, params.n_subjects as int, params.n_tasks as int)
+    def channelCount = groups.sum { it.size() }
+    log.info "[benchmark] ${params.n_subjects} subjects x ${params.n_tasks} tasks: ${groups.size()} groups, ${channelCount} channels, ${config.size()} config entries"
+
+    def crossModalIndex = null
+    (1..(params.repetitions as int)).each { repetition ->
+        def (indexMs, index) = timeMillis { buildCrossModalIndex(config) }
+        crossModalIndex = index
+        def (baselineMs, baselineResults) = timeMillis {
+            groups.collectMany { baselineBroadcast(it, config, loopOverEntities) }
+        }
+        def (indexedMs, indexedResults) = timeMillis {
+            groups.collectMany { broadcastCrossModal(it, crossModalIndex, loopOverEntities) }
+        }
+        assertSameResult(baselineResults, indexedResults, "Indexed broadcasting differs from the baseline implementation")
+        log.info String.format("[benchmark] run %d: baseline %.1f ms, indexed %.1f ms (+ %.3f ms index build), speedup %.1fx, %d channels emitted",
+            repetition, baselineMs, indexedMs, indexMs, speedup(baselineMs, indexedMs), indexedResults.size())
+    }
+}
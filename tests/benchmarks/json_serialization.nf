@@ -0,0 +1,68 @@
+// Microbenchmark of JSON serialization of large sequential-set style documents.
+//
+// Checks that the streaming writer produces the same text as JsonBuilder.toPrettyString() and
+// JsonOutput.toJson(), and compares their time and the lazy and eager parsing of the result.
+//
+// Usage:
+//   nextflow run tests/benchmarks/json_serialization.nf --n_files 200000
+
+include {
+    writeJson;
+    readJsonFromFile;
+    readJsonLazily
+} from '../../modules/utils/json_utils.nf'
+include {
+    timeMillis;
+    assertSameResult
+} from './benchmark_utils.nf'
+
+params.n_files = 100000
+params.repetitions = 3
+
+def buildDocument(nFiles) {
+    // Nested echo/flip layout with nii/json lists, plus empty containers and scalars
+    def flips = (1..Math.max(1, nFiles.intdiv(1000))).collect { flip ->
+        (1..10).collect { echo ->
+            "sub-01/anat/sub-01_flip-${flip}_echo-${echo}_MEGRE.nii.gz".toString()
+        }
+    }
+    return [
+        MEGRE: [
+            nii: flips,
+            json: flips.collect { files -> files.collect { it.replace('.nii.gz', '.json') } },
+            extra: [:],
+            empty: [],
+            count: nFiles,
+            ratio: 0.5d,
+            valid: true,
+            missing: null,
+            note: 'quotes " and \\ backslashes\ttabs'
+        ]
+    ]
+}
+
+workflow {
+    def document = buildDocument(params.n_files as int)
+    def tempFile = File.createTempFile('bids2nf_json_benchmark', '.json')
+    tempFile.deleteOnExit()
+
+    (1..(params.repetitions as int)).each { repetition ->
+        def (builderMs, builderJson) = timeMillis { new groovy.json.JsonBuilder(document).toPrettyString() }
+        def (streamMs, streamJson) = timeMillis {
+            def writer = new StringWriter()
+            writeJson(document, writer, true)
+            writer.toString()
+        }
+        def compactWriter = new StringWriter()
+        writeJson(document, compactWriter, false)
+        assertSameResult(builderJson, streamJson, "Streaming JSON output differs from JsonBuilder")
+        assertSameResult(groovy.json.JsonOutput.toJson(document), compactWriter.toString(), "Compact streaming JSON output differs from JsonOutput")
+
+        tempFile.text = streamJson
+        def (eagerMs, eagerJson) = timeMillis { readJsonFromFile(tempFile) }
+        def (lazyMs, lazyCount) = timeMillis { readJsonLazily(tempFile).MEGRE.count }
+        assertSameResult(eagerJson.MEGRE.count, lazyCount, "Lazy parsing differs from JsonSlurper")
+        log.info String.format("[benchmark] run %d: %d chars, toPrettyString %.1f ms, streaming %.1f ms, eager parse %.1f ms, lazy field access %.1f ms",
+            repetition, streamJson.length(), builderMs, streamMs, eagerMs, lazyMs)
+    }
+}
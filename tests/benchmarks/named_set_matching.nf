@@ -0,0 +1,121 @@
+// Microbenchmark of named and mixed set matching on MPM/MTS-style rows.
+//
+// Compares the previous implementation, which normalized both sides of every comparison for
+// every row, with the pre-normalized linear scan and the grouping index used for routing.
+//
+// Usage:
+//   nextflow run tests/benchmarks/named_set_matching.nf --n_rows 500000
+
+include {
+    normalizeEntityValue;
+    compileGroupings;
+    buildGroupingIndex;
+    findMatchingIndexedGrouping
+} from '../../modules/grouping/entity_grouping_utils.nf'
+include {
+    timeMillis;
+    assertSameResult;
+    speedup
+} from './benchmark_utils.nf'
+
+params.n_rows = 200000
+params.n_variants = 12
+params.repetitions = 3
+
+def baselineNormalize(value) {
+    if (value && value.contains('-')) {
+        def parts = value.split('-')
+        if (parts.length == 2 && parts[1].isNumber()) {
+            return "${parts[0]}-${Integer.parseInt(parts[1])}"
+        }
+    }
+    return value
+}
+
+def baselineFindMatchingGrouping(row, groupings) {
+    // Previous implementation: normalize row and config values on every comparison
+    def matchingEntry = groupings.find { entry ->
+        entry.value.every { entity, value ->
+            def rowValue = row[entity]
+            if (entity == 'description') {
+                return true
+            }
+            if (!rowValue || !value) {
+                return rowValue == value
+            }
+            return baselineNormalize(rowValue) == baselineNormalize(value)
+        }
+    }
+    return matchingEntry ? matchingEntry.key : null
+}
+
+def findMatchingCompiledGrouping(row, compiledGroupings) {
+    // Linear scan over pre-normalized groupings: first grouping whose conditions all match the row
+    def match = compiledGroupings.find { _groupName, conditions ->
+        conditions.every { entity, value, normalizedValue ->
+            def rowValue = row[entity]
+            if (!rowValue || !value) {
+                return rowValue == value
+            }
+            return normalizeEntityValue(rowValue) == normalizedValue
+        }
+    }
+    return match ? match[0] : null
+}
+
+def buildGroupings(nVariants) {
+    // MPM/MTS-like named groups: one per acquisition, flip and mt combination
+    def groupings = [:]
+    (1..nVariants).each { flip ->
+        ['on', 'off'].each { mt ->
+            groupings["${mt == 'on' ? 'MTw' : 'PDw'}${flip}".toString()] = [
+                description: "Flip ${flip}, MT ${mt}",
+                acquisition: "acq-${mt == 'on' ? 'MTw' : 'PDw'}",
+                flip: "flip-${flip}",
+                mtransfer: "mt-${mt}"
+            ]
+        }
+    }
+    return groupings
+}
+
+def buildRows(nRows, nVariants) {
+    // Zero-padded row values, as found in the files, against unpadded config values
+    def random = new Random(42)
+    return (0..<nRows).collect { index ->
+        def mt = random.nextBoolean() ? 'on' : 'off'
+        [
+            subject: "sub-${String.format('%04d', index % 1000)}",
+            acquisition: "acq-${mt == 'on' ? 'MTw' : 'PDw'}",
+            flip: "flip-${String.format('%02d', random.nextInt(nVariants + 2) + 1)}",
+            mtransfer: "mt-${mt}",
+            echo: "echo-${random.nextInt(8) + 1}",
+            suffix: 'MPM'
+        ].collectEntries { key, value -> [(key): value.toString()] }
+    }
+}
+
+workflow {
+    def groupings = buildGroupings(params.n_variants as int)
+    def rows = buildRows(params.n_rows as int, params.n_variants as int)
+    log.info "[benchmark] ${rows.size()} rows against ${groupings.size()} named groups"
+
+    (1..(params.repetitions as int)).each { repetition ->
+        def (compileMs, compiledGroupings) = timeMillis { compileGroupings(groupings) }
+        def (indexMs, groupingIndex) = timeMillis { buildGroupingIndex(compiledGroupings) }
+        def (baselineMs, baselineMatches) = timeMillis {
+            rows.collect { row -> baselineFindMatchingGrouping(row, groupings) }
+        }
+        def (compiledMs, compiledMatches) = timeMillis {
+            rows.collect { row -> findMatchingCompiledGrouping(row, compiledGroupings) }
+        }
+        def (indexedMs, indexedMatches) = timeMillis {
+            rows.collect { row -> findMatchingIndexedGrouping(row, groupingIndex) }
+        }
+        assertSameResult(baselineMatches, compiledMatches, "Compiled matching differs from the baseline implementation")
+        assertSameResult(baselineMatches, indexedMatches, "Indexed matching differs from the baseline implementation")
+        log.info String.format("[benchmark] run %d: baseline %.1f ms, compiled %.1f ms (+ %.3f ms compile), indexed %.1f ms (+ %.3f ms index), speedup %.1fx, %d matched, %d cached values",
+            repetition, baselineMs, compiledMs, compileMs, indexedMs, indexMs, speedup(baselineMs, indexedMs),
+            indexedMatches.count { it != null }, EntityValueCache.size())
+    }
+}
@@ -0,0 +1,94 @@
+// Benchmark of the driver heap held by parsed rows on a synthetic cohort.
+//
+// Compares the header-keyed maps produced by splitCsv(header: true) with the compact rows
+// returned by readParsedRows, and checks that both give the same value for every column.
+//
+// Usage:
+//   nextflow run tests/benchmarks/parsed_rows_heap.nf --n_rows 1000000
+
+include {
+    readParsedRows
+} from '../../modules/parsers/parsed_rows.nf'
+include {
+    timeMillis
+} from './benchmark_utils.nf'
+
+params.n_rows = 500000
+params.n_subjects = 1000
+
+def getBenchmarkHeader() {
+    return ['subject', 'session', 'run', 'task', 'acquisition', 'ceagent', 'reconstruction', 'direction',
+            'echo', 'flip', 'inversion', 'mtransfer', 'part', 'chunk', 'space', 'description',
+            'data_type', 'suffix', 'extension', 'path']
+}
+
+def writeSyntheticCsv(csvFile, nRows, nSubjects) {
+    // Typical anatomical and functional rows: a handful of entities set, the rest "NA"
+    def suffixes = [['anat', 'T1w'], ['anat', 'MEGRE'], ['func', 'bold'], ['dwi', 'dwi'], ['fmap', 'TB1map']]
+    def extensions = ['nii.gz', 'json']
+    csvFile.withWriter { writer ->
+        writer.writeLine(getBenchmarkHeader().join(','))
+        (0..<nRows).each { index ->
+            def subject = "sub-${String.format('%05d', index % nSubjects)}"
+            def (dataType, suffix) = suffixes[index % suffixes.size()]
+            def extension = extensions[index % extensions.size()]
+            def values = getBenchmarkHeader().collect { 'NA' }
+            values[0] = subject
+            values[1] = "ses-${index.intdiv(nSubjects) % 2 + 1}"
+            if (suffix == 'bold') {
+                values[3] = "task-${index % 7}"
+                values[2] = "run-${index % 3 + 1}"
+            }
+            if (suffix == 'MEGRE') {
+                values[8] = "echo-${index % 6 + 1}"
+            }
+            values[16] = dataType
+            values[17] = suffix
+            values[18] = extension
+            values[19] = "/data/${subject}/${dataType}/${subject}_${index}_${suffix}.${extension}"
+            writer.writeLine(values.join(','))
+        }
+    }
+}
+
+def usedHeapBytes() {
+    def runtime = Runtime.getRuntime()
+    (1..3).each {
+        System.gc()
+        sleep(100)
+    }
+    return runtime.totalMemory() - runtime.freeMemory()
+}
+
+def measureRows(Closure loadRows) {
+    def baseline = usedHeapBytes()
+    def (elapsedMs, rows) = timeMillis(loadRows)
+    def retained = usedHeapBytes() - baseline
+    return [rows, retained, elapsedMs]
+}
+
+workflow {
+    def csvFile = file("${workDir}/benchmark-parsed-rows.csv")
+    writeSyntheticCsv(csvFile, params.n_rows as int, params.n_subjects as int)
+    log.info "[benchmark] ${params.n_rows} rows written to ${csvFile} (${csvFile.size() >> 20} MB)"
+
+    def (mapRows, mapBytes, mapMs) = measureRows { csvFile.splitCsv(header: true) }
+    log.info String.format("[benchmark] splitCsv maps: %.1f MB retained, %.0f bytes/row, loaded in %.0f ms",
+        mapBytes / 1048576.0d, mapBytes / (double) mapRows.size(), mapMs)
+
+    def (compactRows, compactBytes, compactMs) = measureRows { readParsedRows(csvFile) }
+    log.info String.format("[benchmark] compact rows: %.1f MB retained, %.0f bytes/row, loaded in %.0f ms (%d dictionary values)",
+        compactBytes / 1048576.0d, compactBytes / (double) compactRows.size(), compactMs, RowSchema.dictionarySize())
+
+    if (mapRows.size() != compactRows.size()) {
+        throw new IllegalStateException("Compact rows count ${compactRows.size()} differs from ${mapRows.size()}")
+    }
+    mapRows.eachWithIndex { mapRow, index ->
+        def compactRow = compactRows[index]
+        if (!(getBenchmarkHeader() + ['unknown']).every { column -> mapRow[column] == compactRow[column] && mapRow.containsKey(column) == compactRow.containsKey(column) }) {
+            throw new IllegalStateException("Compact row ${index} differs from ${mapRow}")
+        }
+    }
+    log.info String.format("[benchmark] heap reduction %.1fx", mapBytes / (double) Math.max(compactBytes, 1L))
+    csvFile.delete()
+}
@@ -0,0 +1,235 @@
+#!/usr/bin/env python3
+"""
+End-to-end benchmark harness for bids2nf.
+
+Generates a synthetic zero-byte BIDS dataset from a benchmark spec, runs the bids2nf
+workflow on it and records wall time, peak driver heap, per-process timings and rows/s.
+Results are appended to a history file keyed by git commit (tests/benchmarks/runs/history.jsonl
+by default, next to the untracked runs), and compared with the last
+run of the same spec on another commit.
+
+Spec format (YAML):
+
+    name: medium
+    subjects: 500
+    sessions: 2            # 0 or 1 for datasets without sessions
+    runs: 1                # > 1 adds run-<n> to every file
+    tasks: 2               # task-<n> values for task-based suffixes
+    suffixes: [T1w, MTS, VFA, MPM, dwi, dwi_fullreverse, bold]
+    sequential_length: 3   # values per by_entities / sequential_dimension entity
+    parse_shards: 4        # optional, forwarded to --parse_shards
+
+Suffixes are keys of bids2nf.yaml, plus a few task-based suffixes (bold, events) that
+need no configuration entry to be generated. Datasets are created by
+scripts/generate_synthetic_bids.py.
+
+Usage:
+    python tests/benchmarks/run_benchmark.py tests/benchmarks/specs/small.yaml --profile amd64_test
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+PROJECT_ROOT = Path(__file__).resolve().parents[2]
+BENCHMARK_WORKFLOW = PROJECT_ROOT / "tests" / "benchmarks" / "bids2nf_benchmark.nf"
+DEFAULT_HISTORY = PROJECT_ROOT / "tests" / "benchmarks" / "runs" / "history.jsonl"
+
+sys.path.insert(0, str(PROJECT_ROOT / "scripts"))
+from generate_synthetic_bids import generate_dataset, load_yaml  # noqa: E402
+
+
+def read_trace(trace_file: Path) -> Dict[str, Dict[str, float]]:
+    """Summarize a raw Nextflow trace per process: task count, summed realtime and span."""
+    processes: Dict[str, Dict[str, float]] = {}
+    if not trace_file.exists():
+        return processes
+    lines = trace_file.read_text().splitlines()
+    header = lines[0].split("\t")
+    for line in lines[1:]:
+        task = dict(zip(header, line.split("\t")))
+        process = task["name"].split(" (")[0]
+        stats = processes.setdefault(process, {"tasks": 0, "realtime_ms": 0, "first_start": None, "last_complete": None})
+        stats["tasks"] += 1
+        stats["realtime_ms"] += int(task.get("realtime") or 0)
+        start, complete = int(task.get("start") or 0), int(task.get("complete") or 0)
+        if start and (stats["first_start"] is None or start < stats["first_start"]):
+            stats["first_start"] = start
+        if complete and (stats["last_complete"] is None or complete > stats["last_complete"]):
+            stats["last_complete"] = complete
+    for stats in processes.values():
+        first_start, last_complete = stats.pop("first_start"), stats.pop("last_complete")
+        stats["span_ms"] = last_complete - first_start if first_start and last_complete else None
+    return processes
+
+
+def run_bids2nf(spec: Dict[str, Any], dataset_dir: Path, run_dir: Path, args: argparse.Namespace) -> Dict[str, Any]:
+    """Run the benchmark workflow and collect wall time, driver RSS and workflow metrics."""
+    trace_file = run_dir / "trace.txt"
+    metrics_file = run_dir / "metrics.json"
+    trace_config = run_dir / "benchmark.config"
+    trace_config.write_text(
+        "trace {\n"
+        "    enabled = true\n"
+        "    overwrite = true\n"
+        "    raw = true\n"
+        f"    file = '{trace_file}'\n"
+        "    fields = 'name,status,start,complete,realtime,peak_rss'\n"
+        "}\n"
+    )
+
+    command = [
+        args.nextflow, "run", str(BENCHMARK_WORKFLOW),
+        "-profile", args.profile,
+        "-c", str(trace_config),
+        "-work-dir", str(run_dir / "work"),
+        "--bids_dir", str(dataset_dir),
+        "--bids_validation", "false",
+        "--output_dir", str(run_dir / "outputs"),
+        "--benchmark_metrics", str(metrics_file),
+    ]
+    if args.bids2nf_config:
+        command += ["--bids2nf_config", str(Path(args.bids2nf_config).resolve())]
+    if spec.get("parse_shards"):
+        command += ["--parse_shards", str(spec["parse_shards"])]
+
+    env = dict(os.environ)
+    if args.driver_heap:
+        env["NXF_OPTS"] = f"{env.get('NXF_OPTS', '')} -Xmx{args.driver_heap}".strip()
+
+    print(f"Running: {' '.join(command)}")
+    start = time.perf_counter()
+    with open(run_dir / "nextflow.out", "w") as output:
+        process = subprocess.Popen(command, cwd=run_dir, env=env, stdout=output, stderr=subprocess.STDOUT)
+        # Reap the Nextflow process itself to get its own peak RSS. RUSAGE_CHILDREN would report
+        # the largest child of this script so far, including earlier specs and generator workers.
+        _, status, usage = os.wait4(process.pid, 0)
+    wall_time = time.perf_counter() - start
+    returncode = process.returncode = os.waitstatus_to_exitcode(status)
+
+    if returncode != 0:
+        raise RuntimeError(f"bids2nf failed with exit code {returncode}, see {run_dir / 'nextflow.out'}")
+
+    metrics = json.loads(metrics_file.read_text()) if metrics_file.exists() else {}
+    return {
+        "wall_time_s": round(wall_time, 3),
+        # The launcher execs the driver JVM, so this is the driver's peak RSS (KiB on Linux,
+        # bytes on macOS). Reaped descendants (local task wrappers) only count if larger.
+        "driver_max_rss_mb": round(usage.ru_maxrss / (2**20 if sys.platform == "darwin" else 1024), 1),
+        "workflow": metrics,
+        "processes": read_trace(trace_file),
+    }
+
+
+def get_git_revision() -> Dict[str, Any]:
+    def git(*git_args: str) -> str:
+        return subprocess.run(["git", *git_args], cwd=PROJECT_ROOT, capture_output=True, text=True).stdout.strip()
+
+    return {"commit": git("rev-parse", "HEAD"), "dirty": bool(git("status", "--porcelain", "--untracked-files=no"))}
+
+
+def find_previous(history_file: Path, spec_name: str, commit: str) -> Optional[Dict[str, Any]]:
+    """Last recorded run of the same spec on a different commit."""
+    if not history_file.exists():
+        return None
+    previous = None
+    for line in history_file.read_text().splitlines():
+        record = json.loads(line)
+        if record["spec"]["name"] == spec_name and record["git"]["commit"] != commit:
+            previous = record
+    return previous
+
+
+def report(record: Dict[str, Any], previous: Optional[Dict[str, Any]], threshold: float) -> bool:
+    """Print a summary of the run and return False if wall time regressed beyond the threshold."""
+    results = record["results"]
+    workflow = results["workflow"]
+    print(f"\nBenchmark {record['spec']['name']} @ {record['git']['commit'][:10]}{' (dirty)' if record['git']['dirty'] else ''}")
+    print(f"  files:        {record['rows']}")
+    print(f"  wall time:    {results['wall_time_s']:.1f} s ({record['rows_per_s']:.0f} rows/s)")
+    print(f"  driver RSS:   {results['driver_max_rss_mb']:.0f} MB")
+    if workflow:
+        print(f"  peak heap:    {workflow['peak_heap_bytes'] / 2**20:.0f} MB of {workflow['max_heap_bytes'] / 2**20:.0f} MB")
+        print(f"  results:      {workflow['results']} (first after {workflow['first_result_ms']} ms, last after {workflow['last_result_ms']} ms)")
+    for process, stats in sorted(results["processes"].items()):
+        print(f"  {process}: {stats['tasks']} tasks, {stats['realtime_ms'] / 1000:.1f} s realtime, {(stats['span_ms'] or 0) / 1000:.1f} s span")
+
+    if previous is None:
+        return True
+    previous_wall = previous["results"]["wall_time_s"]
+    change = (results["wall_time_s"] - previous_wall) / previous_wall * 100 if previous_wall else 0.0
+    print(f"  vs {previous['git']['commit'][:10]}: wall time {previous_wall:.1f} s -> {results['wall_time_s']:.1f} s ({change:+.1f}%)")
+    previous_heap = previous["results"]["workflow"].get("peak_heap_bytes")
+    if previous_heap and workflow:
+        heap_change = (workflow["peak_heap_bytes"] - previous_heap) / previous_heap * 100
+        print(f"  vs {previous['git']['commit'][:10]}: peak heap {heap_change:+.1f}%")
+    return threshold <= 0 or change <= threshold
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run bids2nf on synthetic BIDS datasets and track performance across commits.")
+    parser.add_argument("specs", nargs="+", help="Benchmark spec YAML files.")
+    parser.add_argument("--profile", default="arm64_test", help="Nextflow profile to run with.")
+    parser.add_argument("--bids2nf-config", help="bids2nf.yaml to generate and run with (default: the profile's).")
+    parser.add_argument("--work-root", default=str(PROJECT_ROOT / "tests" / "benchmarks" / "runs"), help="Where datasets and runs are created.")
+    parser.add_argument("--history", default=str(DEFAULT_HISTORY), help="JSON lines file the results are appended to.")
+    parser.add_argument("--nextflow", default="nextflow", help="Nextflow executable.")
+    parser.add_argument("--driver-heap", help="Maximum driver heap, e.g. 4g (sets -Xmx in NXF_OPTS).")
+    parser.add_argument("--reuse-dataset", action="store_true", help="Reuse a previously generated dataset for the spec.")
+    parser.add_argument("--fail-threshold", type=float, default=0.0,
+                        help="Exit with an error if wall time regresses by more than this percentage (0 disables).")
+    args = parser.parse_args()
+
+    config_path = Path(args.bids2nf_config) if args.bids2nf_config else PROJECT_ROOT / "bids2nf.yaml"
+    config = load_yaml(config_path)
+    history_file = Path(args.history)
+    history_file.parent.mkdir(parents=True, exist_ok=True)
+    git_revision = get_git_revision()
+
+    passed = True
+    for spec_path in args.specs:
+        spec = load_yaml(Path(spec_path))
+        work_root = Path(args.work_root).resolve() / spec["name"]
+        dataset_dir = work_root / "dataset"
+        run_dir = work_root / datetime.now(timezone.utc).strftime("run-%Y%m%dT%H%M%S")
+        run_dir.mkdir(parents=True, exist_ok=True)
+
+        count_file = work_root / "dataset.count"
+        if args.reuse_dataset and dataset_dir.exists() and count_file.exists():
+            rows = int(count_file.read_text())
+            print(f"Reusing dataset {dataset_dir} ({rows} files)")
+        else:
+            start = time.perf_counter()
+            # The dataset directory belongs to the benchmark run tree, so it is always regenerated
+            rows = generate_dataset(spec, config, dataset_dir, force=True)
+            count_file.write_text(str(rows))
+            print(f"Generated {rows} files in {dataset_dir} in {time.perf_counter() - start:.1f} s")
+
+        results = run_bids2nf(spec, dataset_dir, run_dir, args)
+        record = {
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "git": git_revision,
+            "spec": spec,
+            "profile": args.profile,
+            "rows": rows,
+            "rows_per_s": rows / results["wall_time_s"] if results["wall_time_s"] else 0.0,
+            "results": results,
+        }
+        previous = find_previous(history_file, spec["name"], git_revision["commit"])
+        with open(history_file, "a") as f:
+            f.write(json.dumps(record) + "\n")
+        passed = report(record, previous, args.fail_threshold) and passed
+
+    if not passed:
+        print(f"\nWall time regressed by more than {args.fail_threshold}%")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,163 @@
+#!/usr/bin/env python3
+"""Compare the JSON outputs of two directory trees.
+
+Files present in both trees are compared in parallel worker processes: byte-identical files
+pass without parsing, other files pass when their canonical JSON (sorted keys, compact
+separators) has the same SHA-256 hash. Only files whose hashes differ get a structural diff,
+reported per JSON key path.
+
+Usage: python3 tests/compare_json_outputs.py <expected_dir> <new_dir> [--jobs N]
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+
+def list_json_files(root):
+    json_files = set()
+    for directory, _dirs, files in os.walk(root):
+        for file_name in files:
+            if file_name.endswith('.json'):
+                json_files.add(os.path.relpath(os.path.join(directory, file_name), root))
+    return json_files
+
+
+def canonical_hash(data):
+    canonical = json.dumps(data, sort_keys=True, separators=(',', ':'), ensure_ascii=False)
+    return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+
+
+def format_path(path):
+    return ''.join(f'[{part}]' if isinstance(part, int) else f'.{part}' for part in path) or '<root>'
+
+
+def short_json(value, limit=120):
+    text = json.dumps(value)
+    return text if len(text) <= limit else text[:limit - 3] + '...'
+
+
+def diff_json(expected, new, path=(), max_lines=20):
+    """Structural differences between two parsed JSON values, one line per key path."""
+    lines = []
+
+    def walk(expected_value, new_value, current):
+        if len(lines) >= max_lines:
+            return
+        if isinstance(expected_value, dict) and isinstance(new_value, dict):
+            for key in expected_value:
+                if key not in new_value:
+                    lines.append(f'{format_path(current + (key,))}: missing in new')
+                else:
+                    walk(expected_value[key], new_value[key], current + (key,))
+            for key in new_value:
+                if key not in expected_value:
+                    lines.append(f'{format_path(current + (key,))}: extra in new')
+        elif isinstance(expected_value, list) and isinstance(new_value, list):
+            if len(expected_value) != len(new_value):
+                lines.append(f'{format_path(current)}: {len(expected_value)} items expected, {len(new_value)} new')
+            for index, (expected_item, new_item) in enumerate(zip(expected_value, new_value)):
+                walk(expected_item, new_item, current + (index,))
+        elif expected_value != new_value or type(expected_value) is not type(new_value):
+            lines.append(f'{format_path(current)}: expected {short_json(expected_value)}, new {short_json(new_value)}')
+
+    walk(expected, new, tuple(path))
+    return lines[:max_lines]
+
+
+def compare_file(task):
+    """Compare one relative path of both trees; returns (path, status, diff lines)."""
+    relative_path, expected_dir, new_dir, max_lines = task
+    try:
+        with open(os.path.join(expected_dir, relative_path), 'rb') as handle:
+            expected_bytes = handle.read()
+        with open(os.path.join(new_dir, relative_path), 'rb') as handle:
+            new_bytes = handle.read()
+        if expected_bytes == new_bytes:
+            return relative_path, 'identical', []
+        expected = json.loads(expected_bytes)
+        new = json.loads(new_bytes)
+        if canonical_hash(expected) == canonical_hash(new):
+            return relative_path, 'equivalent', []
+        return relative_path, 'differs', diff_json(expected, new, max_lines=max_lines)
+    except (OSError, ValueError) as error:
+        return relative_path, 'error', [str(error)]
+
+
+def compare_directories(expected_dir, new_dir, jobs=None, max_lines=20):
+    expected_files = list_json_files(expected_dir)
+    new_files = list_json_files(new_dir)
+    common = sorted(expected_files & new_files)
+    tasks = [(relative_path, expected_dir, new_dir, max_lines) for relative_path in common]
+
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        chunk_size = max(1, len(tasks) // ((jobs or os.cpu_count() or 1) * 8))
+        results = list(executor.map(compare_file, tasks, chunksize=chunk_size))
+
+    return {
+        'missing': sorted(expected_files - new_files),
+        'extra': sorted(new_files - expected_files),
+        'results': results,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare JSON files between expected and new output directories.")
+    parser.add_argument("expected_dir", help="Directory with the expected outputs.")
+    parser.add_argument("new_dir", help="Directory with the new outputs.")
+    parser.add_argument("--jobs", type=int, default=None, help="Worker processes (default: number of CPUs).")
+    parser.add_argument("--max-diff-lines", type=int, default=20, help="Differences reported per file (default: 20).")
+    parser.add_argument("--verbose", action="store_true", help="Also list matching files.")
+    args = parser.parse_args()
+
+    for directory in (args.expected_dir, args.new_dir):
+        if not os.path.isdir(directory):
+            print(f"Error: {directory} does not exist or is not a directory.")
+            return 1
+
+    print("Comparing JSON files between:")
+    print(f"  Expected: {args.expected_dir}")
+    print(f"  New:      {args.new_dir}")
+    print()
+
+    comparison = compare_directories(args.expected_dir, args.new_dir, args.jobs, args.max_diff_lines)
+    error_count = 0
+
+    if comparison['missing']:
+        print("❌ MISSING files (in expected but not in new):")
+        for relative_path in comparison['missing']:
+            print(f"  {relative_path}")
+        print()
+        error_count += len(comparison['missing'])
+
+    if comparison['extra']:
+        print("⚠️  EXTRA files (in new but not in expected):")
+        for relative_path in comparison['extra']:
+            print(f"  {relative_path}")
+        print()
+        error_count += len(comparison['extra'])
+
+    print(f"📋 Comparing {len(comparison['results'])} matching JSON files:")
+    for relative_path, status, lines in comparison['results']:
+        if status in ('identical', 'equivalent'):
+            if args.verbose:
+                print(f"  ✅ {relative_path}: {status}")
+            continue
+        error_count += 1
+        print(f"  ❌ {relative_path}: {status}")
+        for line in lines:
+            print(f"      {line}")
+
+    print()
+    if error_count > 0:
+        print(f"❌ Found {error_count} issues. Exiting with error.")
+        return 1
+    print("✅ All JSON files match!")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
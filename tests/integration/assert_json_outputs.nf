@@ -1,30 +1,11 @@
-include { COMPARE_JSON_FILES } from '../../modules/utils/json_assert'
+include { assertJsonDirectories } from '../../modules/utils/json_utils'
 
 workflow {
-    
-    main:
-
-    expected_jsons_ch = Channel
-        .fromPath("${params.expected_dir}/**/*.json")
-        .map { file -> 
-        def relativePath = file.toString().replaceFirst("^${params.expected_dir}/", "")
-        tuple(relativePath, file)
-        }
 
-    new_jsons_ch = Channel
-        .fromPath("${params.new_dir}/**/*.json") 
-        .map { file ->
-        def relativePath = file.toString().replaceFirst("^${params.new_dir}/", "")
-        tuple(relativePath, file)
-        }
-
-    // Find matched pairs for comparison
-    paired_jsons_ch = expected_jsons_ch
-        .join(new_jsons_ch, by: 0)
-        .map { relativePath, expectedFile, newFile ->
-        tuple(relativePath, expectedFile, newFile)
-        }
+    main:
 
-    COMPARE_JSON_FILES(paired_jsons_ch)
-    COMPARE_JSON_FILES.out.result.view()
-}
\ No newline at end of file
+    // Compare all expected and new JSON outputs in the driver: files are hashed and compared
+    // on a thread pool instead of one task per file, and mismatching files are diffed per key
+    assertJsonDirectories(params.expected_dir, params.new_dir)
+    log.info "✅ ${params.expected_dir} and ${params.new_dir}: JSON files match"
+}
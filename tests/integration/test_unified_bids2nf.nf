@@ -1,5 +1,7 @@
 include { bids2nf } from '../../main.nf'
-include { unified_process_template } from '../../modules/templates/unified_process_template.nf'
+include { unified_process_template; unified_process_template_batch } from '../../modules/templates/unified_process_template.nf'
+include { write_unified_results } from '../../subworkflows/write_unified_results.nf'
+include { renderUnifiedJson; getUnifiedJsonFilename } from '../../modules/utils/json_utils.nf'
 
 include { 
     getLoopOverEntities
@@ -18,6 +20,25 @@ workflow {
     tuple(groupingKey, updatedData)
   }
   
-  // Process all results with a unified template
-  unified_process_template(unified_results_with_basename, params.includeBidsParentDir)
+  // Process all results with a unified template, optionally packing several grouping keys per task
+  // or writing them directly from the driver
+  if (params.unified_output_mode != 'process') {
+    write_unified_results(unified_results_with_basename, "tests/new_outputs/${bids_basename}", params.unified_output_mode, params.includeBidsParentDir)
+  } else if (params.unified_batch_size > 1) {
+    // Stage each batch as a single file: the JSON file of every grouping key, preceded by a
+    // "### <filename>" line, named after the first key of the batch
+    unified_batches = unified_results_with_basename
+      .collate(params.unified_batch_size as int)
+      .flatMap { entries ->
+        def batchName = getUnifiedJsonFilename(entries[0][1]) - '_unified.json'
+        entries.collect { _groupingKey, enrichedData ->
+          def (filename, jsonContent) = renderUnifiedJson(enrichedData, params.includeBidsParentDir)
+          tuple("${batchName}.batch".toString(), "### ${filename}\n${jsonContent}\n".toString())
+        }
+      }
+      .collectFile()
+    unified_process_template_batch(unified_batches, bids_basename)
+  } else {
+    unified_process_template(unified_results_with_basename, params.includeBidsParentDir)
+  }
 }
\ No newline at end of file
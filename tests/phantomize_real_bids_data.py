@@ -1,34 +1,132 @@
 import os
 import argparse
+import shutil
+import threading
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
 from pathlib import Path
 
-def create_phantom_structure(source_dir, phantom_root):
+# Small metadata files that grouping reads or that users may want to inspect
+SIDECAR_EXTENSIONS = ('.json', '.tsv', '.bval', '.bvec')
+
+CHECKPOINT_NAME = '.phantomize_checkpoint'
+
+
+def scan_directory(directory):
+    subdirs = []
+    files = []
+    with os.scandir(directory) as entries:
+        for entry in entries:
+            # Like os.walk, symlinked directories are neither descended into nor created.
+            # Annexed files are symlinks to files and are phantomized as files.
+            if entry.is_dir():
+                if not entry.is_symlink():
+                    subdirs.append(entry.path)
+            else:
+                files.append(entry.name)
+    return directory, subdirs, files
+
+
+def crawl_tree(source_dir, workers):
+    # Scan directories on a thread pool: on network file systems listing latency, not CPU,
+    # dominates, so many directories are listed concurrently
+    listing = {}
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        pending = {executor.submit(scan_directory, str(source_dir))}
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                directory, subdirs, files = future.result()
+                listing[os.path.relpath(directory, source_dir)] = files
+                pending.update(executor.submit(scan_directory, subdir) for subdir in subdirs)
+    return listing
+
+
+def read_checkpoint(checkpoint_path):
+    if not checkpoint_path.exists():
+        return set()
+    with open(checkpoint_path) as handle:
+        return {line.rstrip('\n') for line in handle if line.strip()}
+
+
+def create_directories(phantom_root, rel_dirs, workers):
+    # Only leaf directories need a mkdir call, their parents are created along the way
+    rel_dirs = [rel_dir for rel_dir in rel_dirs if rel_dir != '.']
+    parents = {os.path.dirname(rel_dir) for rel_dir in rel_dirs}
+    leaves = [rel_dir for rel_dir in rel_dirs if rel_dir not in parents]
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        list(executor.map(lambda rel_dir: (phantom_root / rel_dir).mkdir(parents=True, exist_ok=True), leaves))
+
+
+def phantomize_file(source_file, phantom_file, keep_sidecars):
+    if keep_sidecars and source_file.name.endswith(SIDECAR_EXTENSIONS):
+        try:
+            shutil.copyfile(source_file, phantom_file)
+            return
+        except OSError:
+            # e.g. an annexed sidecar whose content is not available locally
+            pass
+    phantom_file.touch(exist_ok=True)
+
+
+def create_phantom_structure(source_dir, phantom_root, workers=32, keep_sidecars=False, checkpoint=True):
     source_dir = Path(source_dir).resolve()
     phantom_root = Path(phantom_root).resolve()
+    phantom_root.mkdir(parents=True, exist_ok=True)
+
+    checkpoint_path = phantom_root / CHECKPOINT_NAME
+    completed = read_checkpoint(checkpoint_path) if checkpoint else set()
+
+    listing = crawl_tree(source_dir, workers)
+    remaining = {rel_dir: files for rel_dir, files in listing.items() if rel_dir not in completed}
+    print(f"Found {len(listing)} directories, {len(listing) - len(remaining)} already phantomized")
+
+    create_directories(phantom_root, remaining.keys(), workers)
+
+    # Each directory is recorded in the checkpoint once all of its files exist, so an
+    # interrupted run resumes with the directories it had not finished
+    checkpoint_lock = threading.Lock()
+    checkpoint_handle = open(checkpoint_path, 'a') if checkpoint else None
+
+    def phantomize_directory(rel_dir):
+        for file_name in remaining[rel_dir]:
+            if rel_dir == '.' and file_name == CHECKPOINT_NAME:
+                continue
+            phantomize_file(source_dir / rel_dir / file_name, phantom_root / rel_dir / file_name, keep_sidecars)
+        if checkpoint_handle:
+            with checkpoint_lock:
+                checkpoint_handle.write(rel_dir + '\n')
+                checkpoint_handle.flush()
 
-    for root, dirs, files in os.walk(source_dir):
-        rel_path = Path(root).relative_to(source_dir)
-        phantom_path = phantom_root / rel_path
+    try:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            list(executor.map(phantomize_directory, remaining))
+    finally:
+        if checkpoint_handle:
+            checkpoint_handle.close()
 
-        # Create the phantom directory
-        phantom_path.mkdir(parents=True, exist_ok=True)
+    # A complete run needs no checkpoint
+    if checkpoint:
+        checkpoint_path.unlink()
 
-        # Create phantom files
-        for file_name in files:
-            phantom_file = phantom_path / file_name
-            phantom_file.touch(exist_ok=True)
 
 def main():
     parser = argparse.ArgumentParser(description="Create phantom copy of a directory structure.")
     parser.add_argument("source", help="Path to the source directory.")
     parser.add_argument("phantom", help="Path where phantom structure will be created.")
+    parser.add_argument("--workers", type=int, default=32,
+                        help="Threads used to list directories and create files (default: 32).")
+    parser.add_argument("--keep-sidecars", action="store_true",
+                        help=f"Copy the content of small sidecar files ({', '.join(SIDECAR_EXTENSIONS)}) "
+                             "instead of creating them empty.")
+    parser.add_argument("--no-checkpoint", action="store_true",
+                        help="Do not record progress for resuming an interrupted run.")
     args = parser.parse_args()
 
     if not os.path.isdir(args.source):
         print(f"Error: Source directory {args.source} does not exist or is not a directory.")
         return
 
-    create_phantom_structure(args.source, args.phantom)
+    create_phantom_structure(args.source, args.phantom, args.workers, args.keep_sidecars, not args.no_checkpoint)
     print(f"Phantom structure created at {args.phantom}")
 
 if __name__ == "__main__":